@@ -131,16 +131,11 @@ func DeleteFeature(db *mongo.Database) http.HandlerFunc {
 			http.Error(w, "Missing id parameter", http.StatusBadRequest)
 			return
 		}
-		featureID, err := strconv.Atoi(idStr)
-		if err != nil {
-			http.Error(w, "Invalid id parameter", http.StatusBadRequest)
-			return
-		}
 
 		ctx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
 		defer cancel()
 
-		res, err := db.Collection("feature").DeleteOne(ctx, bson.M{"feature_id": featureID})
+		res, err := db.Collection("feature").DeleteOne(ctx, bson.M{"feature_id": idStr})
 		if err != nil {
 			http.Error(w, "Failed to delete feature: "+err.Error(), http.StatusInternalServerError)
 			return
@@ -3,6 +3,7 @@ package handlers
 import (
 	"context"
 	"encoding/json"
+	"errors"
 	"net/http"
 	"strconv"
 	"time"
@@ -10,6 +11,7 @@ import (
 	"backend/models"
 	"go.mongodb.org/mongo-driver/bson"
 	"go.mongodb.org/mongo-driver/mongo"
+	"go.mongodb.org/mongo-driver/mongo/options"
 )
 
 // CreateLink inserts a new feature-provision link
@@ -40,6 +42,52 @@ func CreateLink(db *mongo.Database) http.HandlerFunc {
 	}
 }
 
+// CreateLinks inserts many feature-provision links in one round trip; links that already exist are skipped
+func CreateLinks(db *mongo.Database) http.HandlerFunc {
+	return func(w http.ResponseWriter, r *http.Request) {
+		var links []models.FeatureProvisionLink
+		if err := json.NewDecoder(r.Body).Decode(&links); err != nil {
+			http.Error(w, "Invalid request body: "+err.Error(), http.StatusBadRequest)
+			return
+		}
+
+		duplicates := 0
+		if len(links) > 0 {
+			docs := make([]interface{}, len(links))
+			for i, link := range links {
+				docs[i] = link
+			}
+
+			ctx, cancel := context.WithTimeout(context.Background(), 30*time.Second)
+			defer cancel()
+
+			// Unordered: one duplicate does not stop the rest of the batch
+			_, err := db.Collection("feature_provision_link").InsertMany(ctx, docs, options.InsertMany().SetOrdered(false))
+			if err != nil {
+				var bulkErr mongo.BulkWriteException
+				if !errors.As(err, &bulkErr) || bulkErr.WriteConcernError != nil {
+					http.Error(w, "Failed to create links: "+err.Error(), http.StatusInternalServerError)
+					return
+				}
+				for _, writeErr := range bulkErr.WriteErrors {
+					if !mongo.IsDuplicateKeyError(writeErr) {
+						http.Error(w, "Failed to create links: "+writeErr.Message, http.StatusInternalServerError)
+						return
+					}
+					duplicates++
+				}
+			}
+		}
+
+		w.Header().Set("Content-Type", "application/json")
+		w.WriteHeader(http.StatusCreated)
+		json.NewEncoder(w).Encode(map[string]interface{}{
+			"inserted_count":  len(links) - duplicates,
+			"duplicate_count": duplicates,
+		})
+	}
+}
+
 // GetProvisionsByFeature retrieves all provisions linked to a feature
 func GetProvisionsByFeature(db *mongo.Database) http.HandlerFunc {
 	return func(w http.ResponseWriter, r *http.Request) {
@@ -152,16 +200,11 @@ func DeleteLinksByFeature(db *mongo.Database) http.HandlerFunc {
 			http.Error(w, "Missing feature_id parameter", http.StatusBadRequest)
 			return
 		}
-		featureID, err := strconv.Atoi(idStr)
-		if err != nil {
-			http.Error(w, "Invalid feature_id parameter", http.StatusBadRequest)
-			return
-		}
 
 		ctx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
 		defer cancel()
 
-		res, err := db.Collection("feature_provision_link").DeleteMany(ctx, bson.M{"feature_id": featureID})
+		res, err := db.Collection("feature_provision_link").DeleteMany(ctx, bson.M{"feature_id": idStr})
 		if err != nil {
 			http.Error(w, "Failed to delete links: "+err.Error(), http.StatusInternalServerError)
 			return
@@ -182,16 +225,11 @@ func DeleteLinksByProvision(db *mongo.Database) http.HandlerFunc {
 			http.Error(w, "Missing provision_id parameter", http.StatusBadRequest)
 			return
 		}
-		provisionID, err := strconv.Atoi(idStr)
-		if err != nil {
-			http.Error(w, "Invalid provision_id parameter", http.StatusBadRequest)
-			return
-		}
 
 		ctx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
 		defer cancel()
 
-		res, err := db.Collection("feature_provision_link").DeleteMany(ctx, bson.M{"provision_id": provisionID})
+		res, err := db.Collection("feature_provision_link").DeleteMany(ctx, bson.M{"provision_id": idStr})
 		if err != nil {
 			http.Error(w, "Failed to delete links: "+err.Error(), http.StatusInternalServerError)
 			return
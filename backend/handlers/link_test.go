@@ -111,3 +111,37 @@ func TestMultipleLinks(t *testing.T) {
 		t.Fatalf("Expected deleted_count 2, got %v", delResp["deleted_count"])
 	}
 }
+
+func TestBulkLinks(t *testing.T) {
+	testDB = setupTestDB(t)
+
+	links := []models.FeatureProvisionLink{
+		{FeatureID: "1", ProvisionID: "101"},
+		{FeatureID: "1", ProvisionID: "102"},
+		{FeatureID: "2", ProvisionID: "101"},
+	}
+	body, _ := json.Marshal(links)
+	req := httptest.NewRequest("POST", "/links", bytes.NewReader(body))
+	w := httptest.NewRecorder()
+	CreateLinks(testDB)(w, req)
+	if w.Result().StatusCode != http.StatusCreated {
+		t.Fatalf("Failed to create links, status %d", w.Result().StatusCode)
+	}
+
+	// Re-sending an overlapping batch only inserts the new link
+	links = append(links, models.FeatureProvisionLink{FeatureID: "3", ProvisionID: "103"})
+	body, _ = json.Marshal(links)
+	req = httptest.NewRequest("POST", "/links", bytes.NewReader(body))
+	w = httptest.NewRecorder()
+	CreateLinks(testDB)(w, req)
+
+	var resp map[string]interface{}
+	if err := json.NewDecoder(w.Body).Decode(&resp); err != nil {
+		t.Fatalf("Failed to decode CreateLinks: %v", err)
+	}
+	t.Logf("Bulk insert result: %+v", resp)
+
+	if resp["inserted_count"].(float64) != 1 || resp["duplicate_count"].(float64) != 3 {
+		t.Fatalf("Expected 1 inserted and 3 duplicates, got %v", resp)
+	}
+}
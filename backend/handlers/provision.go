@@ -132,16 +132,11 @@ func DeleteProvision(db *mongo.Database) http.HandlerFunc {
 			http.Error(w, "Missing id parameter", http.StatusBadRequest)
 			return
 		}
-		provisionID, err := strconv.Atoi(idStr)
-		if err != nil {
-			http.Error(w, "Invalid id parameter", http.StatusBadRequest)
-			return
-		}
 
 		ctx, cancel := context.WithTimeout(context.Background(), 5*time.Second)
 		defer cancel()
 
-		res, err := db.Collection("provision").DeleteOne(ctx, bson.M{"provision_id": provisionID})
+		res, err := db.Collection("provision").DeleteOne(ctx, bson.M{"provision_id": idStr})
 		if err != nil {
 			http.Error(w, "Failed to delete provision: "+err.Error(), http.StatusInternalServerError)
 			return
@@ -0,0 +1,171 @@
+package handlers
+
+import (
+	"context"
+	"crypto/rand"
+	"crypto/sha256"
+	"encoding/hex"
+	"encoding/json"
+	"log"
+	"net/http"
+	"os"
+	"regexp"
+	"strconv"
+	"strings"
+	"sync"
+	"time"
+)
+
+const (
+	RequestIDHeader   = "X-Request-ID"
+	TraceparentHeader = "traceparent"
+)
+
+// When set, spans are also appended to this file in OTLP/JSON (one export request per line),
+// the same format the Python service writes, so both halves of a trace can be loaded together.
+var traceExportPath = os.Getenv("TRACE_EXPORT_PATH")
+var traceFileMu sync.Mutex
+
+var traceparentPattern = regexp.MustCompile(`^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$`)
+var hex32Pattern = regexp.MustCompile(`^[0-9a-f]{32}$`)
+
+type traceKey struct{}
+
+// Span is one timed step of a request. Spans of one request share the correlation id.
+type Span struct {
+	RequestID string
+	TraceID   string
+	SpanID    string
+	ParentID  string
+	Name      string
+	Start     time.Time
+}
+
+func randomHex(n int) string {
+	b := make([]byte, n)
+	rand.Read(b)
+	return hex.EncodeToString(b)
+}
+
+// traceIDFor mirrors monitoring.Tracing.trace_id_for: correlation ids that are not 32 hex chars are hashed.
+func traceIDFor(requestID string) string {
+	id := strings.ReplaceAll(strings.ToLower(requestID), "-", "")
+	if hex32Pattern.MatchString(id) {
+		return id
+	}
+	sum := sha256.Sum256([]byte(id))
+	return hex.EncodeToString(sum[:])[:32]
+}
+
+// SpanFromContext returns the current span, or nil outside a traced request.
+func SpanFromContext(ctx context.Context) *Span {
+	s, _ := ctx.Value(traceKey{}).(*Span)
+	return s
+}
+
+// StartSpan opens a child span of the one in ctx; call the returned function to end it.
+func StartSpan(ctx context.Context, name string) (context.Context, func()) {
+	parent := SpanFromContext(ctx)
+	if parent == nil {
+		return ctx, func() {}
+	}
+	s := &Span{RequestID: parent.RequestID, TraceID: parent.TraceID, SpanID: randomHex(8), ParentID: parent.SpanID, Name: name, Start: time.Now()}
+	return context.WithValue(ctx, traceKey{}, s), func() { s.end("") }
+}
+
+// SetTraceHeaders passes the correlation id and the current span on to the next hop.
+func SetTraceHeaders(ctx context.Context, req *http.Request) {
+	s := SpanFromContext(ctx)
+	if s == nil {
+		return
+	}
+	req.Header.Set(RequestIDHeader, s.RequestID)
+	req.Header.Set(TraceparentHeader, "00-"+s.TraceID+"-"+s.SpanID+"-01")
+}
+
+func (s *Span) end(status string) {
+	elapsed := time.Since(s.Start)
+	log.Printf("trace request_id=%s span=%q duration_ms=%.1f status=%s\n", s.RequestID, s.Name, float64(elapsed.Microseconds())/1000, status)
+	if traceExportPath != "" {
+		s.export(elapsed, status)
+	}
+}
+
+func (s *Span) export(elapsed time.Duration, status string) {
+	attrs := []map[string]interface{}{
+		{"key": "request.id", "value": map[string]string{"stringValue": s.RequestID}},
+	}
+	if status != "" {
+		attrs = append(attrs, map[string]interface{}{"key": "http.status", "value": map[string]string{"stringValue": status}})
+	}
+	span := map[string]interface{}{
+		"traceId":           s.TraceID,
+		"spanId":            s.SpanID,
+		"name":              s.Name,
+		"kind":              1,
+		"startTimeUnixNano": strconv.FormatInt(s.Start.UnixNano(), 10),
+		"endTimeUnixNano":   strconv.FormatInt(s.Start.Add(elapsed).UnixNano(), 10),
+		"attributes":        attrs,
+	}
+	if s.ParentID != "" {
+		span["parentSpanId"] = s.ParentID
+	}
+	payload := map[string]interface{}{
+		"resourceSpans": []interface{}{map[string]interface{}{
+			"resource": map[string]interface{}{"attributes": []interface{}{
+				map[string]interface{}{"key": "service.name", "value": map[string]string{"stringValue": "compliance-backend"}},
+			}},
+			"scopeSpans": []interface{}{map[string]interface{}{"spans": []interface{}{span}}},
+		}},
+	}
+	line, err := json.Marshal(payload)
+	if err != nil {
+		return
+	}
+	traceFileMu.Lock()
+	defer traceFileMu.Unlock()
+	f, err := os.OpenFile(traceExportPath, os.O_APPEND|os.O_CREATE|os.O_WRONLY, 0644)
+	if err != nil {
+		log.Printf("warning: failed to export span: %v", err)
+		return
+	}
+	defer f.Close()
+	f.Write(append(line, '\n'))
+}
+
+type statusRecorder struct {
+	http.ResponseWriter
+	status int
+}
+
+func (r *statusRecorder) WriteHeader(status int) {
+	r.status = status
+	r.ResponseWriter.WriteHeader(status)
+}
+
+// WithTracing reuses the caller's X-Request-ID / traceparent (or issues a new id), echoes the id in the
+// response and times the whole request as a span that handlers can add child spans to.
+func WithTracing(next http.Handler) http.Handler {
+	return http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		requestID := r.Header.Get(RequestIDHeader)
+		traceID, parentID := "", ""
+		if m := traceparentPattern.FindStringSubmatch(r.Header.Get(TraceparentHeader)); m != nil {
+			traceID, parentID = m[1], m[2]
+		}
+		if requestID == "" {
+			requestID = traceID
+		}
+		if requestID == "" {
+			requestID = randomHex(16)
+		}
+		if traceID == "" {
+			traceID = traceIDFor(requestID)
+		}
+
+		s := &Span{RequestID: requestID, TraceID: traceID, SpanID: randomHex(8), ParentID: parentID, Name: r.Method + " " + r.URL.Path, Start: time.Now()}
+		w.Header().Set(RequestIDHeader, requestID)
+		rec := &statusRecorder{ResponseWriter: w, status: http.StatusOK}
+		next.ServeHTTP(rec, r.WithContext(context.WithValue(r.Context(), traceKey{}, s)))
+		s.end(strconv.Itoa(rec.status))
+	})
+}
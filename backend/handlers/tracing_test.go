@@ -0,0 +1,44 @@
+package handlers
+
+import (
+	"net/http"
+	"net/http/httptest"
+	"strings"
+	"testing"
+)
+
+func TestTracingPropagation(t *testing.T) {
+	var forwarded *http.Request
+	handler := WithTracing(http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		ctx, endSpan := StartSpan(r.Context(), "forward_fastapi")
+		defer endSpan()
+		forwarded, _ = http.NewRequest("POST", "http://localhost:8000/upload/law", nil)
+		SetTraceHeaders(ctx, forwarded)
+		w.WriteHeader(http.StatusCreated)
+	}))
+
+	// ---------- Caller's correlation id is reused and forwarded ----------
+	req := httptest.NewRequest("POST", "/upload/law", nil)
+	req.Header.Set(RequestIDHeader, "upload-42")
+	w := httptest.NewRecorder()
+	handler.ServeHTTP(w, req)
+
+	if got := w.Result().Header.Get(RequestIDHeader); got != "upload-42" {
+		t.Fatalf("Expected response %s upload-42, got %q", RequestIDHeader, got)
+	}
+	if got := forwarded.Header.Get(RequestIDHeader); got != "upload-42" {
+		t.Fatalf("Expected forwarded %s upload-42, got %q", RequestIDHeader, got)
+	}
+	traceparent := forwarded.Header.Get(TraceparentHeader)
+	if !strings.HasPrefix(traceparent, "00-"+traceIDFor("upload-42")+"-") {
+		t.Fatalf("Forwarded traceparent %q does not carry the trace id of upload-42", traceparent)
+	}
+	t.Logf("✅ Forwarded %s", traceparent)
+
+	// ---------- A new id is issued when the caller sends none ----------
+	w = httptest.NewRecorder()
+	handler.ServeHTTP(w, httptest.NewRequest("POST", "/upload/law", nil))
+	if got := w.Result().Header.Get(RequestIDHeader); len(got) != 32 {
+		t.Fatalf("Expected a generated 32 hex char request id, got %q", got)
+	}
+}
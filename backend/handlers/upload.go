@@ -2,6 +2,7 @@ package handlers
 
 import (
 	"bytes"
+	"context"
 	"encoding/json"
 	"fmt"
 	"io"
@@ -60,7 +61,11 @@ func saveUploadedFile(r *http.Request, uploadType string) (string, error) {
 }
 
 // ---------------- FastAPI Call Helper ----------------
-func forwardToFastAPI(filePath, fastapiURL string) ([]byte, int, error) {
+// The request's correlation id is forwarded, so the FastAPI spans join this request's trace
+func forwardToFastAPI(ctx context.Context, filePath, fastapiURL string) ([]byte, int, error) {
+	ctx, endSpan := StartSpan(ctx, "forward_fastapi")
+	defer endSpan()
+
 	f, err := os.Open(filePath)
 	if err != nil {
 		return nil, 0, fmt.Errorf("error opening saved file: %w", err)
@@ -83,6 +88,7 @@ func forwardToFastAPI(filePath, fastapiURL string) ([]byte, int, error) {
 		return nil, 0, fmt.Errorf("error creating request: %w", err)
 	}
 	req.Header.Set("Content-Type", writer.FormDataContentType())
+	SetTraceHeaders(ctx, req)
 
 	client := &http.Client{}
 	resp, err := client.Do(req)
@@ -106,14 +112,16 @@ func UploadFeatureHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
+	_, endSave := StartSpan(r.Context(), "save_file")
 	filePath, err := saveUploadedFile(r, "feature")
+	endSave()
 	if err != nil {
 		http.Error(w, err.Error(), http.StatusBadRequest)
 		return
 	}
 
 	// respBody
-	_, statusCode, err := forwardToFastAPI(filePath, "http://localhost:8000/parse/feature")
+	_, statusCode, err := forwardToFastAPI(r.Context(), filePath, "http://localhost:8000/parse/feature")
 	if err != nil {
 		http.Error(w, err.Error(), http.StatusInternalServerError)
 		return
@@ -219,13 +227,15 @@ func UploadLawHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
+	_, endSave := StartSpan(r.Context(), "save_file")
 	filePath, err := saveUploadedFile(r, "law")
+	endSave()
 	if err != nil {
 		http.Error(w, err.Error(), http.StatusBadRequest)
 		return
 	}
 
-	respBody, statusCode, err := forwardToFastAPI(filePath, "http://localhost:8000/upload/law")
+	respBody, statusCode, err := forwardToFastAPI(r.Context(), filePath, "http://localhost:8000/upload/law")
 	if err != nil {
 		http.Error(w, err.Error(), http.StatusInternalServerError)
 		return
@@ -37,6 +37,7 @@ func main() {
 
 	// Feature-Provision Link CRUD
 	http.HandleFunc("/link", handlers.CreateLink(database))
+	http.HandleFunc("/links", handlers.CreateLinks(database))
 	http.HandleFunc("/link/get/provisions", handlers.GetProvisionsByFeature(database))
 	http.HandleFunc("/link/get/features", handlers.GetFeaturesByProvision(database))
 	http.HandleFunc("/link/update", handlers.UpdateLink(database))
@@ -48,5 +49,6 @@ func main() {
 	http.Handle("/files/", http.StripPrefix("/files/", fs))
 
 	log.Println("Server running at :8080")
-	log.Fatal(http.ListenAndServe(":8080", nil))
+	// Every request gets a correlation id (X-Request-ID) shared with the FastAPI service
+	log.Fatal(http.ListenAndServe(":8080", handlers.WithTracing(http.DefaultServeMux)))
 }
@@ -8,6 +8,7 @@ type Feature struct {
 	ProjectName        string `bson:"project_name" json:"project_name"`
 	ReferenceFile      string `bson:"reference_file" json:"reference_file"`
 	ProjectID          string `bson:"project_id" json:"project_id"`
+	ContentHash        string `bson:"content_hash" json:"content_hash"`
 }
 
 type ReasoningFeature struct {
@@ -42,6 +43,7 @@ type Provision struct {
 	RelevantLabels []string `bson:"relevant_labels" json:"relevant_labels"`
 	LawCode        string   `bson:"law_code" json:"law_code"`
 	ReferenceFile  string   `bson:"reference_file" json:"reference_file"`
+	ContentHash    string   `bson:"content_hash" json:"content_hash"`
 }
 
 type ReasoningProvision struct {
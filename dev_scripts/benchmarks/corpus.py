@@ -0,0 +1,87 @@
+import json
+import uuid
+import random
+from typing import List, Tuple
+
+from model.utils import content_hash, LAW_HASH_FIELDS, FEATURE_HASH_FIELDS
+
+# Shared vocabulary so that generated features and provisions overlap like the real data does
+TOPICS = [
+    "age verification", "parental consent", "minor accounts", "personal data", "data retention",
+    "geolocation", "recommendation feed", "direct messaging", "content moderation", "child safety",
+    "advertising profile", "biometric data", "account deletion", "notification curfew", "reporting obligation",
+    "encryption", "cross border transfer", "consent banner", "livestream", "payment information",
+]
+VERBS = ["shall", "must not", "may", "is required to", "shall promptly"]
+ACTORS = ["a provider", "an online platform", "a social media company", "a controller", "a service"]
+JURISDICTIONS = [
+    ("European Union", "N/A"), ("United States", "N/A"), ("United States", "Utah"),
+    ("United States", "California"), ("United States", "Florida"), ("Brazil", "N/A"),
+    ("Indonesia", "N/A"), ("Canada", "Ontario"),
+]
+FEATURE_TYPES = ["backend", "frontend", "data pipeline", "ml model", "policy"]
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    topics = rng.sample(TOPICS, 3)
+    filler = " ".join(rng.choice(TOPICS).split()[0] for _ in range(max(0, words - 12)))
+    return (f"{rng.choice(ACTORS)} {rng.choice(VERBS)} handle {topics[0]} and {topics[1]} "
+            f"when processing {topics[2]} {filler}").strip()
+
+
+def generate_laws(n: int, seed: int = 0, provisions_per_law: int = 50) -> List[dict]:
+    """`n` provision records shaped like LawParser output (ids, reference_file and content_hash included)."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        law_number = i // provisions_per_law
+        country, region = JURISDICTIONS[law_number % len(JURISDICTIONS)]
+        record = {
+            "provision_title": f"{rng.choice(TOPICS).title()} requirements",
+            "provision_body": _sentence(rng, 40),
+            "provision_code": f"Section {i % provisions_per_law + 1}",
+            "country": country,
+            "region": region,
+            "relevant_labels": ", ".join(rng.sample(TOPICS, 2)),
+            "law_code": f"LAW-{law_number:06d}",
+            "id": _uuid(rng),
+            "reference_file": f"./law_dataset/law_{law_number:06d}.pdf",
+        }
+        record["content_hash"] = content_hash(record, LAW_HASH_FIELDS)
+        records.append(record)
+    return records
+
+
+def generate_features(n: int, seed: int = 1, features_per_project: int = 50) -> List[Tuple[List[dict], List[dict], List[dict]]]:
+    """`n` features split into projects; per project (features, compliance terms, data dictionary) like FeatureParser output."""
+    rng = random.Random(seed)
+    projects = []
+    for start in range(0, n, features_per_project):
+        project_name, project_id = f"Project {start // features_per_project:05d}", _uuid(rng)
+        common = {"project_name": project_name, "project_id": project_id,
+                  "reference_file": f"./feature_dataset/project_{start // features_per_project:05d}.pdf"}
+        dictionary = [{"variable_name": topic.replace(" ", "_"), "variable_description": f"Stores {topic}",
+                       "dictionary_id": _uuid(rng), **common} for topic in rng.sample(TOPICS, 5)]
+        compliance = [{"compliance_title": topic.title(), "compliance_description": _sentence(rng, 15),
+                       "compliance_id": _uuid(rng), **common} for topic in rng.sample(TOPICS, 3)]
+        features = []
+        for _ in range(min(features_per_project, n - start)):
+            feature = {
+                "feature_title": f"{rng.choice(TOPICS).title()} {rng.choice(['service', 'screen', 'job', 'api'])}",
+                "feature_description": _sentence(rng, 30),
+                "feature_type": rng.choice(FEATURE_TYPES),
+                "feature_id": _uuid(rng),
+                **common,
+            }
+            feature["content_hash"] = content_hash(feature, FEATURE_HASH_FIELDS)
+            features.append(feature)
+        projects.append((features, compliance, dictionary))
+    return projects
+
+
+def to_jsonl(records) -> str:
+    return "".join(json.dumps(record) + "\n" for record in records)
@@ -0,0 +1,79 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from model.Embeddings import HashingEmbedding
+
+
+def fake_chat_model(latency: float = 0.0) -> FakeListChatModel:
+    """Chat model answering "no conflicts" after `latency` seconds."""
+    return FakeListChatModel(responses=["{}"], sleep=latency or None)
+
+
+class StubBackend:
+    """Stand-in for the Go backend: accepts every request, answers 201/200 and counts calls per route."""
+
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with stub._lock:
+                    route = f"{self.command} {self.path.split('?')[0]}"
+                    stub.calls[route] = stub.calls.get(route, 0) + 1
+                payload = {"message": "ok"}
+                if self.path.startswith("/links") and body:
+                    payload = {"inserted_count": len(json.loads(body)), "duplicate_count": 0}
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self._reply(201)
+
+            def do_GET(self):
+                self._reply(200)
+
+            def do_PUT(self):
+                self._reply(200)
+
+            def do_DELETE(self):
+                self._reply(200)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self) -> "StubBackend":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def install_fakes(dimension: int, llm_latency: float = 0.0) -> HashingEmbedding:
+    """Swap the Gemini embedding/chat clients of both models for offline fakes; call before building any model."""
+    import model.RAGLawModel as law_model
+    import model.FeatureRagModel as feature_model
+    from model.RateLimiter import llm_rate_limiter
+
+    embedding = HashingEmbedding(dimension)
+    for module in (law_model, feature_model):
+        module.create_embeddings = lambda: embedding
+        module.ChatGoogleGenerativeAI = lambda **kwargs: fake_chat_model(llm_latency)
+        module.sleep = lambda seconds: None
+    llm_rate_limiter.set_rate(0)
+    return embedding
@@ -0,0 +1,157 @@
+"""
+Recall vs latency of candidate FAISS index configurations, measured against the exact flat index.
+
+    python -m benchmarks.index_recall --store law_index [--k 10] [--queries 500]
+    python -m benchmarks.index_recall --synthetic 100000 --dimension 768 --configs "HNSW32|efSearch=64;IVF{nlist},SQ8|nprobe=16"
+
+Live vectors are read back from every shard of a sharded store (or generated from a synthetic corpus with the
+offline HashingEmbedding). Queries are held out of the indexed set. Each configuration is a faiss
+index_factory string, optionally followed by "|" and search-time parameters; "{nlist}" expands to ~4*sqrt(n).
+Reported per configuration: recall@k against IndexFlatL2, single-query latency percentiles, batch QPS,
+build (train + add) time and serialized index size.
+"""
+import os
+import sys
+import glob
+import json
+import math
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from benchmarks.run import latency_stats
+
+DEFAULT_CONFIGS = [
+    "Flat",
+    "HNSW32|efSearch=16",
+    "HNSW32|efSearch=64",
+    "HNSW32|efSearch=256",
+    "IVF{nlist},Flat|nprobe=1",
+    "IVF{nlist},Flat|nprobe=8",
+    "IVF{nlist},Flat|nprobe=32",
+    "SQ8",
+    "IVF{nlist},SQ8|nprobe=16",
+    "OPQ64,IVF{nlist},PQ64|nprobe=16",
+]
+
+
+def load_store_vectors(root: str) -> np.ndarray:
+    """
+    The live vectors of a (sharded or legacy single-folder) store: each shard is opened read-only and its own
+    tombstone bookkeeping decides which positions count, so the benchmark sees exactly what the store serves.
+    """
+    from model.ShardedStore import IndexShard
+
+    paths = sorted(glob.glob(os.path.join(root, "index.faiss")) + glob.glob(os.path.join(root, "shards", "*", "index.faiss")))
+    if not paths:
+        raise FileNotFoundError(f"No index.faiss under {root}")
+    blocks = []
+    for path in paths:
+        folder = os.path.dirname(path)
+        # No embedding client needed: vectors are only read back, never computed
+        shard = IndexShard(os.path.basename(folder), folder, embedding=None, read_only=True)
+        doc_ids = [doc_id for _, doc_id in shard.live_positions()]
+        if doc_ids:
+            blocks.append(shard.vectors(doc_ids))
+    if not blocks:
+        raise ValueError(f"No live vectors under {root}")
+    return np.vstack(blocks).astype(np.float32)
+
+
+def synthetic_vectors(n: int, dimension: int, seed: int) -> np.ndarray:
+    from benchmarks.corpus import generate_laws
+    from model.Embeddings import HashingEmbedding
+
+    embedding = HashingEmbedding(dimension)
+    laws = generate_laws(n, seed=seed)
+    return np.array(embedding.embed_documents([f'{law["provision_title"]} - {law["provision_body"]}' for law in laws]),
+                    dtype=np.float32)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(row[row >= 0]) & set(expected)) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def evaluate(config: str, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    factory, _, params = config.partition("|")
+    factory = factory.format(nlist=max(1, int(4 * math.sqrt(len(base)))))
+    result = {"config": config, "factory": factory, "params": params}
+    index = faiss.index_factory(base.shape[1], factory)
+
+    started = time.perf_counter()
+    if not index.is_trained:
+        index.train(base)
+    index.add(base)
+    result["build_seconds"] = time.perf_counter() - started
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+    result["index_mb"] = faiss.serialize_index(index).nbytes / 2 ** 20
+
+    latencies, found = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found.append(ids[0])
+    result["latency"] = latency_stats(latencies)
+
+    started = time.perf_counter()
+    index.search(queries, k)
+    result["batch_qps"] = len(queries) / (time.perf_counter() - started)
+    result[f"recall@{k}"] = recall_at_k(np.array(found), truth)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency/memory of FAISS index configurations vs exact search.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--store", help="Vector store folder, e.g. law_index or feature_vector_store.")
+    source.add_argument("--synthetic", type=int, help="Number of synthetic provisions to embed offline.")
+    parser.add_argument("--dimension", type=int, default=3072, help="Embedding dimension for --synthetic.")
+    parser.add_argument("--configs", default=";".join(DEFAULT_CONFIGS), help="';'-separated 'factory[|params]' list.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500, help="Vectors held out of the index as queries.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    vectors = load_store_vectors(args.store) if args.store else synthetic_vectors(args.synthetic, args.dimension, args.seed)
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(vectors))
+    n_queries = min(args.queries, max(1, len(vectors) // 10))
+    queries, base = vectors[order[:n_queries]], vectors[order[n_queries:]]
+    k = min(args.k, len(base))
+    print(f"{len(base)} vectors of dimension {base.shape[1]}, {len(queries)} held-out queries, k={k}")
+
+    flat = faiss.IndexFlatL2(base.shape[1])
+    flat.add(base)
+    _, truth = flat.search(queries, k)
+
+    results = []
+    print(f"{'config':40s} {'recall':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'batch qps':>10s} {'build s':>8s} {'MB':>8s}")
+    for config in (c.strip() for c in args.configs.split(";") if c.strip()):
+        try:
+            result = evaluate(config, base, queries, truth, k)
+        except RuntimeError as e:
+            # e.g. too few vectors to train an IVF/PQ configuration
+            print(f"{config:40s} skipped: {str(e).splitlines()[0]}")
+            results.append({"config": config, "error": str(e)})
+            continue
+        results.append(result)
+        latency = result["latency"]
+        print(f"{config:40s} {result[f'recall@{k}']:8.3f} {latency['p50_ms']:8.3f} {latency['p99_ms']:8.3f} "
+              f"{result['batch_qps']:10.0f} {result['build_seconds']:8.2f} {result['index_mb']:8.1f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"source": args.store or f"synthetic:{args.synthetic}", "vectors": len(base),
+                       "dimension": int(base.shape[1]), "k": k, "results": results}, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
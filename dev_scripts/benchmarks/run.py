@@ -0,0 +1,265 @@
+"""
+Offline benchmarks for ingestion, retrieval and the upload endpoints.
+
+    python -m benchmarks.run --sizes 100,1000,10000 [--dimension 3072] [--baseline old.json]
+
+Everything runs without network access: embeddings are HashingEmbedding, the LLM is a fake chat
+model and the Go backend is a local stub. Each corpus size runs in a fresh interpreter and a fresh
+working directory. Results are written as JSON (with the git commit) so runs can be compared;
+--baseline prints the relative change of every metric against an earlier result file.
+For 100k+ records use a smaller --dimension: a flat index needs records x dimension x 4 bytes.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEV_SCRIPTS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (FAISS allocations included, unlike tracemalloc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_stats(latencies) -> dict:
+    values = np.array(latencies) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "qps": float(len(values) / (values.sum() / 1000)) if values.sum() else 0.0,
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def bench_ingest(model, documents, batch_size: int) -> dict:
+    before = rss_mb()
+    seconds = timed(model.update_vector_store, documents, batch_size)
+    index_bytes = sum(shard.vector_store.index.ntotal * shard.vector_store.index.d * 4
+                      for shard in model.store.shards.values())
+    return {
+        "documents": len(documents),
+        "seconds": seconds,
+        "docs_per_second": len(documents) / seconds if seconds else 0.0,
+        "rss_delta_mb": rss_mb() - before,
+        "index_mb": index_bytes / 2 ** 20,
+        "shards": len(model.store.shards),
+    }
+
+
+def bench_retrieval(fn, queries, concurrency: int) -> dict:
+    latencies = [timed(fn, query) for query in queries]
+    stats = latency_stats(latencies)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fn, queries))
+    stats["concurrent_qps"] = len(queries) / (time.perf_counter() - started)
+    stats["concurrency"] = concurrency
+    return stats
+
+
+def bench_uploads(args, backend, seed: int) -> dict:
+    """End-to-end latency of /upload/law and /upload/feature through FastAPI with the parsers stubbed."""
+    from fastapi.testclient import TestClient
+    from benchmarks.corpus import generate_laws, generate_features, to_jsonl
+
+    os.environ["GO_BACKEND_URL"] = backend.url
+    import main
+
+    main.SLEEP_SECONDS = 0
+    law_batches = [generate_laws(args.upload_size, seed=seed + i, provisions_per_law=args.upload_size)
+                   for i in range(args.uploads)]
+    for i, batch in enumerate(law_batches):
+        for record in batch:
+            record["law_code"] = f"UPLOAD-{seed}-{i}"
+    feature_batches = [generate_features(args.upload_size, seed=seed + 1000 + i, features_per_project=args.upload_size)[0]
+                       for i in range(args.uploads)]
+    for i, batch in enumerate(feature_batches):
+        for part in batch:
+            for record in part:
+                record["project_name"] = f"Upload {seed}-{i}"
+    laws, features = iter(law_batches), iter(feature_batches)
+    main.LawParser.parse = lambda path: to_jsonl(next(laws))
+    main.FeatureParser.parse = lambda path: tuple(to_jsonl(part) for part in next(features))
+
+    client = TestClient(main.app)
+    results = {}
+    for route in ("/upload/law", "/upload/feature"):
+        latencies = []
+        for _ in range(args.uploads):
+            started = time.perf_counter()
+            resp = client.post(route, files={"file": ("bench.pdf", b"%PDF-1.4 benchmark", "application/pdf")})
+            latencies.append(time.perf_counter() - started)
+            if resp.status_code != 200:
+                raise RuntimeError(f"{route} failed: {resp.status_code} {resp.text}")
+        results[route] = latency_stats(latencies)
+    results["backend_calls"] = dict(backend.calls)
+    return results
+
+
+def run_size(size: int, args) -> dict:
+    """One corpus size, in a fresh process and working directory."""
+    os.chdir(tempfile.mkdtemp(prefix=f"benchmark-{size}-"))
+    sys.path.insert(0, DEV_SCRIPTS)
+    from benchmarks.fakes import install_fakes, StubBackend
+    from benchmarks.corpus import generate_laws, generate_features, to_jsonl
+
+    install_fakes(args.dimension, args.llm_latency)
+    from model.RAGLawModel import RAGLawModel
+    from model.FeatureRagModel import FeatureRagModel
+    from model.CandidateLinks import CandidateLinks
+    from model.utils import law_to_document, feature_to_document
+
+    logging.getLogger().setLevel(args.log_level)
+    result = {"size": size, "rss_start_mb": rss_mb()}
+    laws = generate_laws(size, seed=args.seed)
+    projects = generate_features(size, seed=args.seed + 1)
+    law_documents = law_to_document(to_jsonl(laws))
+    feature_documents = [doc for features, compliance, dictionary in projects
+                         for doc in feature_to_document(to_jsonl(features), to_jsonl(compliance), to_jsonl(dictionary))]
+
+    law_model, feature_model = RAGLawModel(), FeatureRagModel()
+    result["ingest"] = {
+        "law": bench_ingest(law_model, law_documents, args.batch_size),
+        "feature": bench_ingest(feature_model, feature_documents, args.batch_size),
+    }
+
+    rng = random.Random(args.seed)
+    feature_queries = [f'{f["feature_title"]} - {f["feature_description"]}'
+                       for f in rng.sample([f for features, _, _ in projects for f in features], min(args.queries, size))]
+    law_queries = [f'{law["provision_title"]} - {law["provision_body"]}' for law in rng.sample(laws, min(args.queries, size))]
+    result["retrieval"] = {
+        "law.retrieve_docs": bench_retrieval(law_model.retrieve_docs, feature_queries, args.concurrency),
+        "law.hybrid_retrieve_docs": bench_retrieval(law_model.hybrid_retrieve_docs, feature_queries, args.concurrency),
+        "feature.retrieve_docs": bench_retrieval(feature_model.retrieve_docs, law_queries, args.concurrency),
+        "feature.hybrid_retrieve_docs": bench_retrieval(feature_model.hybrid_retrieve_docs, law_queries, args.concurrency),
+    }
+
+    candidate_links = CandidateLinks()
+    seconds = timed(candidate_links.update, feature_model.store, law_model.store)
+    candidate_links.save()
+    result["candidate_links"] = {"seconds": seconds, "pairs": sum(len(p) for p in candidate_links.features.values())}
+
+    if args.uploads:
+        backend = StubBackend().start()
+        try:
+            result["upload"] = bench_uploads(args, backend, args.seed + 7)
+        finally:
+            backend.stop()
+
+    result["rss_end_mb"] = rss_mb()
+    result["rss_peak_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            yield from flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(baseline: dict, current: dict):
+    """Print the relative change of every numeric metric per corpus size."""
+    old = {run["size"]: dict(flatten(run)) for run in baseline["results"]}
+    for run in current["results"]:
+        if run["size"] not in old:
+            continue
+        print(f"\nsize {run['size']} vs {baseline['meta'].get('commit', '?')[:10]}:")
+        for name, value in flatten(run):
+            before = old[run["size"]].get(name)
+            if before:
+                print(f"  {name:60s} {before:12.3f} -> {value:12.3f} ({(value - before) / before:+.1%})")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=DEV_SCRIPTS, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion/retrieval/upload benchmarks.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated corpus sizes (records per store).")
+    parser.add_argument("--dimension", type=int, default=3072, help="Embedding dimension of the fake provider.")
+    parser.add_argument("--batch-size", type=int, default=256, help="batch_size passed to update_vector_store.")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries per store.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads for the concurrent QPS measurement.")
+    parser.add_argument("--uploads", type=int, default=5, help="End-to-end uploads per endpoint (0 to skip).")
+    parser.add_argument("--upload-size", type=int, default=20, help="Provisions/features per uploaded document.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the fake LLM takes per call.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--out", default=None, help="Result file (default: benchmarks/results/<time>-<commit>.json).")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare against.")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Benchmarking {size} records...")
+        with context.Pool(1) as pool:
+            run = pool.apply(run_size, (size, args))
+        ingest, retrieval = run["ingest"], run["retrieval"]
+        print(f"  ingest law {ingest['law']['docs_per_second']:.0f} docs/s, feature {ingest['feature']['docs_per_second']:.0f} docs/s")
+        for name, stats in retrieval.items():
+            print(f"  {name}: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, {stats['concurrent_qps']:.0f} qps")
+        for route, stats in run.get("upload", {}).items():
+            if route.startswith("/"):
+                print(f"  {route}: p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms")
+        print(f"  rss peak {run['rss_peak_mb']:.0f} MB")
+        results.append(run)
+
+    output = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{commit[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(json.load(f), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+import gc
 import os
+import hmac
 import json
 import requests
 import threading
 import time
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import List
 from dotenv import load_dotenv
 
 from parser.LawParser import LawParser
 from parser.FeatureParser import FeatureParser
+from model.Admission import Overloaded, stage_limit, status as admission_status
+from model.Scheduler import DEFAULT_PRIORITY, PRIORITY_CLASSES, priority, status as scheduler_status
 from model.RAGLawModel import RAGLawModel
 from model.FeatureRagModel import FeatureRagModel
-from model.utils import law_to_document, feature_to_document
+from model.CandidateLinks import CandidateLinks
+from model.ShardedStore import index_role
+from langchain_core.documents import Document
+from model.SnapshotWatcher import SnapshotWatcher
+from model.Triage import Triage
+from model.utils import law_to_document, feature_to_document, diff_records
+from monitoring.Ledger import current as current_ledger, ledger_scope, recent_entries
+from monitoring.Metrics import (
+    REGISTRY, CONTENT_TYPE, BACKEND_REQUESTS, QUEUE_DEPTH, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, stage
+)
+from monitoring.Profiling import Profiler
+from storage.UploadStore import ByteBudget, UploadStore, UploadTooLarge
+from monitoring.Tracing import (
+    REQUEST_ID_HEADER, flush_current, get_trace, outgoing_headers, parse_incoming, recent_traces, span, trace_scope
+)
 
 # Load environment variables
 load_dotenv(dotenv_path=".ENV")
@@ -19,11 +43,37 @@ load_dotenv(dotenv_path=".ENV")
 app = FastAPI()
 
 GO_BACKEND_URL = os.getenv("GO_BACKEND_URL")
+# Multi-worker deployments: API workers run with INDEX_ROLE=reader and send vector store changes to one
+# INDEX_ROLE=writer process at INDEX_WRITER_URL (see model.ShardedStore.index_role)
+INDEX_ROLE = index_role()
+INDEX_WRITER_URL = os.getenv("INDEX_WRITER_URL")
+# Shared secret readers send to the writer's sync endpoint; without it the writer only accepts loopback callers
+INDEX_WRITER_TOKEN = os.getenv("INDEX_WRITER_TOKEN")
+INDEX_TOKEN_HEADER = "X-Index-Token"
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
 SLEEP_SECONDS = 2
 BATCH_SIZE = 2
+LINK_BATCH_SIZE = 500
+# Callers (frontend, ingestion scripts) may set the priority class of a request's provider calls
+PRIORITY_HEADER = "X-Priority"
 
 rag_law_model = RAGLawModel()
 rag_feature_model = FeatureRagModel()
+stores = {"law": rag_law_model, "feature": rag_feature_model}
+candidate_links = CandidateLinks()
+triage = Triage()
+profiler = Profiler()
+law_uploads = UploadStore("./law_dataset")
+feature_uploads = UploadStore("./feature_dataset")
+# Multipart framing around the file; bodies beyond this are refused before they are read
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+# Batch uploads: documents processed concurrently (overridable per request up to the max), documents per batch,
+# total body size, and documents per embedding call when the batch is committed to the vector store
+UPLOAD_BATCH_PARALLELISM = int(os.getenv("UPLOAD_BATCH_PARALLELISM", 4))
+UPLOAD_BATCH_MAX_PARALLELISM = int(os.getenv("UPLOAD_BATCH_MAX_PARALLELISM", 16))
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", 100))
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_BYTES", 500 * 1024 * 1024))
+UPLOAD_BATCH_EMBED_SIZE = int(os.getenv("UPLOAD_BATCH_EMBED_SIZE", 32))
 
 
 def load_jsonl(jsonl_string: str):
@@ -34,153 +84,696 @@ def load_jsonl(jsonl_string: str):
         raise HTTPException(status_code=400, detail=f"Invalid JSONL format: {e}")
 
 
-@app.get("/")
-def root():
-    return {"message": "Welcome to the python services!"}
+def split_csv(value: str):
+    """Comma-separated form field -> list of values (None when empty)."""
+    values = [item.strip() for item in (value or "").split(",") if item.strip()]
+    return values or None
 
 
-@app.post("/upload/law")
-async def upload_law(file: UploadFile = File(...)):
-    temp_path = os.path.join("./law_dataset", os.path.basename(file.filename))
-    try:
-        os.makedirs("./law_dataset", exist_ok=True)
-        contents = await file.read()
-        with open(temp_path, "wb") as f:
-            f.write(contents)
+def to_jsonl(records) -> str:
+    """Dump a list of dicts back into a JSONL string."""
+    return "".join(json.dumps(record) + "\n" for record in records)
 
-        parsed_law = LawParser.parse(temp_path)
-        documents = law_to_document(parsed_law)
 
-        # Run update_vector_store in a daemon thread to avoid blocking
-        def update_vector_store_daemon():
-            try:
-                rag_law_model.update_vector_store(documents)
-            except Exception as e:
-                print("Warning: Failed to update vector store:", e)
-
-        thread = threading.Thread(target=update_vector_store_daemon)
-        thread.daemon = True
-        thread.start()
-
-        laws = load_jsonl(parsed_law)
-
-        # Save all laws one by one to MongoDB
-        for provision in laws:
-            # Fix "relevant_labels": convert string -> list of strings
-            if isinstance(provision.get("relevant_labels"), str):
-                provision["relevant_labels"] = [
-                    label.strip() for label in provision["relevant_labels"].split(",")
-                ]
-            
+def backend_request(method: str, path: str, **kwargs):
+    """Call the Go backend, timing the call and counting it per route and status; the correlation id travels along."""
+    status = "error"
+    try:
+        with stage("backend_request"):
+            headers = {**outgoing_headers(), **kwargs.pop("headers", {})}
+            resp = requests.request(method, f"{GO_BACKEND_URL}{path}", headers=headers, **kwargs)
+        status = str(resp.status_code)
+        return resp
+    finally:
+        BACKEND_REQUESTS.inc(method=method, route=path, status=status)
+
+
+def run_in_background(queue: str, target):
+    """
+    Start a daemon thread for `target`, tracked in the background_queue_depth gauge.
+    The thread inherits the request context, so its token usage lands on the request's ledger
+    and its spans on the request's trace.
+    """
+    context = contextvars.copy_context()
+
+    def run():
+        # Work the response does not wait for yields to interactive and batch calls
+        with QUEUE_DEPTH.track(queue=queue), priority("background"):
             try:
-                resp = requests.post(f"{GO_BACKEND_URL}/provision", json=provision)
-                if resp.status_code != 201:
-                    print(f"Failed to save provision {provision.get('provision_code')}: {resp.text}")
-            except Exception as e:
-                print("Error sending laws to backend:", e)
-
-     
-
-        # Build prompts + retrieve docs
-        law_prompt = ""
-        raw_docs = []
-        for i in range(0, len(laws), BATCH_SIZE):
-            batch = laws[i:i + BATCH_SIZE]
-            for j, law in enumerate(batch, start=i):
-                law_prompt += f'\n{j}. [{law["provision_code"]}/{law["law_code"]}] {law["provision_title"]} - {law["provision_body"]}'
-                doc_query_prompt = f'{law["provision_title"]} - {law["provision_body"]}'
-                raw_docs.extend(rag_feature_model.retrieve_docs(doc_query_prompt))
-            
+                with span(f"background:{queue}"), profiler.follow(queue):
+                    target()
+            finally:
+                flush_current()
+                ledger = current_ledger()
+                if ledger is not None:
+                    ledger.flush("background")
+
+    thread = threading.Thread(target=context.run, args=(run,))
+    thread.daemon = True
+    thread.start()
+
+
+async def run_ingest(ingest, *args) -> tuple:
+    """
+    run_in_threadpool for an ingest pipeline. The request profile (X-Profile) only covers the event loop thread,
+    so the pipeline is profiled on its worker thread; returns (result, profile file names).
+    """
+    profiles = []
+
+    def run():
+        with profiler.follow("ingest") as written:
+            profiles.append(written)  # filled in when the profile is written on exit
+            return ingest(*args)
+
+    result = await run_in_threadpool(run)
+    return result, [name for written in profiles for name in written]
+
+
+def delete_from_backend(kind: str, record_ids):
+    """Delete records (and their links) that no longer exist in a re-uploaded document."""
+    for record_id in record_ids:
+        try:
+            resp = backend_request("DELETE", f"/{kind}/delete", params={"id": record_id})
+            if resp.status_code != 200:
+                print(f"Failed to delete {kind} {record_id}: {resp.text}")
+            backend_request("DELETE", f"/link/delete/{kind}s", params={f"{kind}_id": record_id})
+        except Exception as e:
+            print(f"Error deleting {kind} from backend:", e)
+
+
+def refresh_candidate_links():
+    """Score new documents against the other store and push new candidate pairs to the backend /link collection."""
+    try:
+        pairs = candidate_links.update(rag_feature_model.store, rag_law_model.store)
+        candidate_links.save()
+    except Exception as e:
+        print("Warning: Failed to update candidate links:", e)
+        return
+    links = [{"feature_id": feature_id, "provision_id": provision_id} for feature_id, provision_id, _ in pairs]
+    for i in range(0, len(links), LINK_BATCH_SIZE):
+        try:
+            resp = backend_request("POST", "/links", json=links[i:i + LINK_BATCH_SIZE])
+            if resp.status_code != 201:
+                print(f"Failed to save {len(links[i:i + LINK_BATCH_SIZE])} links: {resp.text}")
+        except Exception as e:
+            print("Error sending links to backend:", e)
+
+
+if INDEX_ROLE == "reader":
+    # The writer computes the candidate links; readers load its table when it changes
+    snapshot_watcher = SnapshotWatcher(stores, on_poll=candidate_links.reload_if_changed)
+else:
+    threading.Thread(target=refresh_candidate_links, daemon=True).start()
+    # Stores rebuilt offline are swapped in without a restart; their new documents are then linked
+    snapshot_watcher = SnapshotWatcher(
+        stores, on_reload=lambda reloaded: run_in_background("candidate_links", refresh_candidate_links),
+    )
+snapshot_watcher.start()
+
+# Startup objects (libraries, loaded stores) live for the whole process: keep them out of full GC passes
+gc.freeze()
+
+
+def admission_gate(request: Request):
+    """The admission limit guarding a request: uploads start parse and analysis pipelines, nothing else is limited."""
+    if request.method != "POST" or not request.url.path.startswith("/upload/"):
+        return None
+    return stage_limit("batch_upload" if request.url.path.endswith("/batch") else "upload")
+
+
+@app.middleware("http")
+async def admit_uploads(request: Request, call_next):
+    """
+    Admission control: uploads beyond the concurrency limit wait in a bounded queue; a full queue is answered
+    429 and a wait past the limit 503, both with Retry-After, before the body is read. Admitted requests run
+    with no more competition than the limits allow.
+    """
+    gate = admission_gate(request)
+    if gate is None:
+        return await call_next(request)
+    try:
+        acquired_at = await run_in_threadpool(gate.acquire)
+    except Overloaded as e:
+        return JSONResponse(status_code=e.status, content={"detail": str(e)}, headers={"Retry-After": str(e.retry_after)})
+    try:
+        return await call_next(request)
+    finally:
+        gate.release(acquired_at)
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads announcing a body over the limit before Starlette spools them; streaming enforces the rest."""
+    if request.url.path.startswith("/upload/"):
+        limit = UPLOAD_BATCH_MAX_BYTES if request.url.path.endswith("/batch") else law_uploads.max_bytes
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > limit + UPLOAD_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": f"Upload exceeds the {limit} byte limit"})
+    return await call_next(request)
+
+
+def request_priority(request: Request) -> str:
+    """Priority class of a request: the X-Priority header when valid, batch for batch uploads, else interactive."""
+    requested = request.headers.get(PRIORITY_HEADER, "").lower()
+    if requested in PRIORITY_CLASSES:
+        return requested
+    return "batch" if request.url.path.endswith("/batch") else DEFAULT_PRIORITY
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = "500"
+    # The caller's correlation id (Go backend, sweep, curl) is reused, else a new one is issued
+    request_id, trace_id, remote_parent = parse_incoming(request.headers)
+    profile_reason = profiler.requested(request.headers)
+    try:
+        # Token usage and spans of everything the request triggers are collected under one id
+        with REQUESTS_IN_FLIGHT.track(), ledger_scope(request.url.path, request_id), priority(request_priority(request)), \
+                trace_scope(f"{request.method} {request.url.path}", request_id, trace_id, remote_parent):
+            with profiler.profile(request_id, profile_reason) if profile_reason else nullcontext([]) as profiles:
+                response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        if profiles and "X-Profile-File" not in response.headers:
+            response.headers["X-Profile-File"] = profiles[0]
+        status = str(response.status_code)
+        return response
+    finally:
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=status)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/traces")
+def traces(limit: int = 20):
+    """Most recent request traces of this process."""
+    return recent_traces(limit)
+
+
+@app.get("/traces/{request_id}")
+def trace(request_id: str):
+    """Spans of one request (including its background work), ordered by start time."""
+    spans = get_trace(request_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"No trace for {request_id}")
+    return spans
+
+
+@app.get("/profiling")
+def profiling():
+    """Profiler settings and the profiles written so far (newest first)."""
+    return {**profiler.settings(), "profiles": profiler.list()}
+
+
+@app.post("/profiling")
+def configure_profiling(sample_rate: float = None, header_enabled: bool = None):
+    """Change the sampled fraction of requests or toggle the X-Profile header at runtime."""
+    if sample_rate is not None:
+        if not 0 <= sample_rate <= 1:
+            raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+        profiler.sample_rate = sample_rate
+    if header_enabled is not None:
+        profiler.header_enabled = header_enabled
+    return profiler.settings()
+
+
+@app.get("/profiling/{name}")
+def profile_file(name: str):
+    """Download a .prof (pstats / snakeviz) or its .txt summary."""
+    path = profiler.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No profile {name}")
+    return FileResponse(path)
+
+
+@app.get("/ledger")
+def ledger(document: str = None, limit: int = 50):
+    """Most recent per-request token ledgers, optionally for one document."""
+    return recent_entries(document, limit)
+
+
+@app.get("/stores")
+def store_snapshots():
+    """Loaded and on-disk snapshot version of each vector store, and this worker's INDEX_ROLE."""
+    return {"role": INDEX_ROLE, **snapshot_watcher.status()}
+
+
+@app.get("/admission")
+def admission():
+    """Active and waiting work and the limits of every admission stage."""
+    return admission_status()
+
+
+@app.get("/scheduler")
+def scheduler():
+    """In-flight and waiting provider calls per priority class, with the class quotas."""
+    return scheduler_status()
+
+
+@app.post("/stores/reload")
+def reload_stores(store: str = None):
+    """Swap in snapshots written by another process now instead of waiting for the next poll."""
+    if store is not None and store not in snapshot_watcher.models:
+        raise HTTPException(status_code=404, detail=f"No store {store}")
+    return {"reloaded": snapshot_watcher.check(store), **snapshot_watcher.status()}
+
+
+def authorize_index_sync(request: Request):
+    """Only reader workers may change the writer's stores: the shared INDEX_WRITER_TOKEN, else loopback callers."""
+    if INDEX_WRITER_TOKEN:
+        if not hmac.compare_digest(request.headers.get(INDEX_TOKEN_HEADER, ""), INDEX_WRITER_TOKEN):
+            raise HTTPException(status_code=403, detail=f"Missing or wrong {INDEX_TOKEN_HEADER}")
+    elif request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Set INDEX_WRITER_TOKEN to accept index changes from other hosts")
+
+
+def index_sync(store: str, payload: dict, request: Request):
+    """
+    Vector store changes sent by reader workers: applied by this process (the index writer) in the background,
+    then published as a new snapshot that the readers reload.
+    """
+    authorize_index_sync(request)
+    if store not in stores:
+        raise HTTPException(status_code=404, detail=f"No store {store}")
+    documents = [Document(page_content=doc["page_content"], metadata=doc.get("metadata") or {})
+                 for doc in payload.get("documents", [])]
+    sync_in_background(store, documents, payload.get("removed_ids", []), payload.get("batch_size", BATCH_SIZE))
+    return {"store": store, "documents": len(documents), "removed": len(payload.get("removed_ids", []))}
+
+
+if INDEX_ROLE == "writer":
+    # Standalone and reader processes expose no way to change their stores over HTTP
+    app.post("/index/{store}/sync", status_code=202)(index_sync)
+
+
+@app.get("/")
+def root():
+    return {"message": "Welcome to the python services!"}
+
+
+@app.get("/triage/stats")
+def triage_stats():
+    """Pairs per triage class and LLM calls avoided since startup, plus the active thresholds."""
+    return triage.stats()
+
+
+def sync_in_background(store: str, documents, removed_ids, batch_size: int = BATCH_SIZE):
+    """
+    Sync a vector store in a daemon thread (uploads return before the embeddings are written), then refresh links.
+    Reader workers hand the changes to the index writer instead; they see them once its snapshot is reloaded.
+    """
+    def update_vector_store_daemon():
+        try:
+            stores[store].sync_vector_store(documents, removed_ids, batch_size)
+            refresh_candidate_links()
+        except Exception as e:
+            print("Warning: Failed to update vector store:", e)
+
+    def forward_to_writer():
+        try:
+            with stage("index_writer_request"):
+                headers = {**outgoing_headers(), **({INDEX_TOKEN_HEADER: INDEX_WRITER_TOKEN} if INDEX_WRITER_TOKEN else {})}
+                resp = requests.post(f"{INDEX_WRITER_URL}/index/{store}/sync", headers=headers, json={
+                    "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents],
+                    "removed_ids": removed_ids,
+                    "batch_size": batch_size,
+                })
+            if resp.status_code != 202:
+                print(f"Index writer refused the {store} store sync: {resp.text}")
+        except Exception as e:
+            print("Warning: Failed to send vector store changes to the index writer:", e)
+
+    if documents or removed_ids:
+        if INDEX_ROLE == "reader":
+            run_in_background("index_writer", forward_to_writer)
+        else:
+            run_in_background("vector_store_sync", update_vector_store_daemon)
+
+
+def ingest_law(stored_file: dict, commit) -> dict:
+    """
+    Parse, diff, save and analyze one stored law document. The vector store changes are handed to
+    `commit(documents, removed_ids, key)` with the law code as key: synced right away for a single upload,
+    collected for a batch (which refuses a second document with the same key).
+    """
+    with stage_limit("parse").slot():
+        parsed_law = LawParser.parse(stored_file["path"])
+    laws = load_jsonl(parsed_law)
+
+    # Diff against the stored version of this law: only new/changed provisions are embedded and saved
+    law_code = laws[0].get("law_code") if laws else None
+    added, unchanged, removed = diff_records(laws, rag_law_model.get_stored_records(law_code), "id")
+    parsed_law = to_jsonl(laws)
+    commit(law_to_document(to_jsonl(added)) if added else [], [docstore_id for docstore_id, _ in removed], law_code)
+
+    delete_from_backend("provision", [record_id for _, record_id in removed if record_id])
+
+    # Save new/changed laws one by one to MongoDB
+    for provision in added:
+        # Fix "relevant_labels": convert string -> list of strings
+        if isinstance(provision.get("relevant_labels"), str):
+            provision["relevant_labels"] = [
+                label.strip() for label in provision["relevant_labels"].split(",")
+            ]
+        
+        try:
+            resp = backend_request("POST", "/provision", json=provision)
+            if resp.status_code != 201:
+                print(f"Failed to save provision {provision.get('provision_code')}: {resp.text}")
+        except Exception as e:
+            print("Error sending laws to backend:", e)
+
+    def build_law_prompt(items):
+        return "".join(
+            f'\n{j}. [{law["id"]}] [{law["provision_code"]}/{law["law_code"]}] {law["provision_title"]} - {law["provision_body"]}'
+            for j, law in enumerate(items)
+        )
+
+    # Retrieve the features each provision may affect
+    retrieved = {}
+    for i in range(0, len(laws), BATCH_SIZE):
+        batch = laws[i:i + BATCH_SIZE]
+        retrieved_any = False
+        for law in batch:
+            doc_query_prompt = f'{law["provision_title"]} - {law["provision_body"]}'
+            if law["id"] in candidate_links.known_provisions:
+                # Already embedded: its dense matches are a lookup in the candidate table, BM25 still runs
+                retrieved[law["id"]] = rag_feature_model.hybrid_retrieve_scored(
+                    doc_query_prompt, known_scores=candidate_links.features_for_provision(law["id"])
+                )
+                continue
+            retrieved[law["id"]] = rag_feature_model.hybrid_retrieve_scored(doc_query_prompt)
+            retrieved_any = True
+
+        if retrieved_any:
             time.sleep(SLEEP_SECONDS)
-        docs = []
-        for doc in raw_docs:
-            if doc not in docs:
-                docs.append(doc)
 
-        result = ""
-        if docs:
-            result = rag_feature_model.prompt(law_prompt, docs)
+    # Clearly unrelated pairs are dropped, then only pairs never judged before reach the LLM
+    candidates, triaged = triage.filter(retrieved)
+    with stage_limit("analysis").slot():
+        result, analysis = rag_feature_model.analyze(laws, candidates, build_law_prompt)
+    analysis["triage"] = triaged
 
-        return JSONResponse(content={'conflict': result, 'parsed_law': parsed_law})
+    diff = {"added": len(added), "unchanged": len(unchanged), "removed": len(removed)}
+    return {'conflict': result, 'parsed_law': parsed_law, 'diff': diff, 'analysis': analysis}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/upload/feature")
-async def upload_feature(file: UploadFile = File(...)):
+def ingest_feature(stored_file: dict, commit, jurisdictions: str = "", labels: str = "") -> dict:
+    """ingest_law() for a feature document; `jurisdictions` / `labels` constrain the laws searched."""
     def build_prompt(items, title_key: str, desc_key: str):
         """Build a numbered prompt string from list of dicts."""
         return "\n".join(f"{i}. {item[title_key]} - {item[desc_key]}" for i, item in enumerate(items))
 
-    temp_path = os.path.join("./feature_dataset", os.path.basename(file.filename))
-    try:
-        os.makedirs("./feature_dataset", exist_ok=True)
-        contents = await file.read()
-        with open(temp_path, "wb") as f:
-            f.write(contents)
+    # Parse feature file
+    with stage_limit("parse").slot():
+        parsed_feature, parsed_compliance, parsed_data_dict = FeatureParser.parse(stored_file["path"])
+
+    features = load_jsonl(parsed_feature)
+    compliance = load_jsonl(parsed_compliance)
+    data_dict = load_jsonl(parsed_data_dict)
+
+    # Diff against the stored version of this project: only new/changed features are embedded and saved
+    project_name = features[0].get("project_name") if features else None
+    stored, project_id = rag_feature_model.get_stored_records(project_name)
+    if project_id:
+        for record in features + compliance + data_dict:
+            record["project_id"] = project_id
+    added, unchanged, removed = diff_records(features, stored, "feature_id")
+    parsed_feature = to_jsonl(features)
+    commit(
+        feature_to_document(to_jsonl(added), parsed_compliance, parsed_data_dict) if added else [],
+        [docstore_id for docstore_id, _ in removed],
+        project_name,
+    )
+
+    delete_from_backend("feature", [record_id for _, record_id in removed if record_id])
+
+   # Save new/changed features one by one to MongoDB
+    for feature in added:
+        try:
+            resp = backend_request("POST", "/feature", json=feature)
+            if resp.status_code != 201:
+                print(f"Failed to save feature {feature.get('feature_title')}: {resp.text}")
+        except Exception as e:
+            print("Error sending features to backend:", e)
+
+    # Build prompts
+    terminology_prompt = build_prompt(data_dict, "variable_name", "variable_description")
+
+    def build_feature_prompt(items):
+        features_prompt = "\n".join(
+            f'{i}. [{item["feature_id"]}] {item["feature_title"]} - {item["feature_description"]}'
+            for i, item in enumerate(items)
+        )
+        return f"""
+        <features>
+        {features_prompt}
+        </features>
+        <terminology>
+        {terminology_prompt}
+        </terminology>
+        """.strip()
+
+    # Retrieve the provisions each feature may violate
+    retrieved = {}
+    filtered = bool(split_csv(jurisdictions) or split_csv(labels))
+    for i in range(0, len(features), BATCH_SIZE):
+        batch = features[i:i + BATCH_SIZE]
+        retrieved_any = False
+        for feature in batch:
+            query_text = f'{feature["feature_title"]} - {feature["feature_description"]}'
+            if not filtered and feature["feature_id"] in candidate_links.known_features:
+                # Already embedded: its dense matches are a lookup in the candidate table, BM25 still runs
+                retrieved[feature["feature_id"]] = rag_law_model.hybrid_retrieve_scored(
+                    query_text, known_scores=candidate_links.provisions_for_feature(feature["feature_id"])
+                )
+                continue
+            retrieved[feature["feature_id"]] = rag_law_model.hybrid_retrieve_scored(
+                query_text, jurisdictions=split_csv(jurisdictions), labels=split_csv(labels)
+            )
+            retrieved_any = True
+        if retrieved_any:
+            time.sleep(SLEEP_SECONDS)
 
-        # Parse feature file
-        parsed_feature, parsed_compliance, parsed_data_dict = FeatureParser.parse(temp_path)
+    # Clearly unrelated pairs are dropped, then only pairs never judged before reach the LLM
+    candidates, triaged = triage.filter(retrieved)
+    with stage_limit("analysis").slot():
+        result, analysis = rag_law_model.analyze(features, candidates, build_feature_prompt)
+    analysis["triage"] = triaged
 
-        # Run update_vector_store in a background daemon thread to avoid blocking
-        def update_vector_store_daemon():
-            try:
-                documents = feature_to_document(parsed_feature, parsed_compliance, parsed_data_dict)
-                rag_feature_model.update_vector_store(documents)
-            except Exception as e:
-                print("Warning: Failed to update feature vector store:", e)
+    diff = {"added": len(added), "unchanged": len(unchanged), "removed": len(removed)}
+    return {'conflict': result, 'parsed_feature': parsed_feature, 'diff': diff, 'analysis': analysis}
 
-        thread = threading.Thread(target=update_vector_store_daemon)
-        thread.daemon = True
-        thread.start()
 
-        features = load_jsonl(parsed_feature)
-        compliance = load_jsonl(parsed_compliance)
-        data_dict = load_jsonl(parsed_data_dict)
-
-       # Save all features one by one to MongoDB
-        for feature in features:
-            try:
-                resp = requests.post(f"{GO_BACKEND_URL}/feature", json=feature)
-                if resp.status_code != 201:
-                    print(f"Failed to save feature {feature.get('feature_title')}: {resp.text}")
-            except Exception as e:
-                print("Error sending features to backend:", e)
-
-        # Build prompts
-        terminology_prompt = build_prompt(data_dict, "variable_name", "variable_description")
-        features_prompt = build_prompt(features, "feature_title", "feature_description")
-
-        raw_docs = []
-        for i in range(0, len(features), BATCH_SIZE):
-            batch = features[i:i + BATCH_SIZE]
-            for feature in batch:
-                query_text = f'{feature["feature_title"]} - {feature["feature_description"]}'
-                raw_docs.extend(rag_law_model.retrieve_docs(query_text))
-            time.sleep(SLEEP_SECONDS)
-            
+@app.post("/upload/law")
+async def upload_law(file: UploadFile = File(...)):
+    current_ledger().document = os.path.basename(file.filename)
+    try:
+        with stage("file_receive"):
+            stored_file = await law_uploads.save(file)
+        # Off the event loop, so saturated uploads can still be turned away immediately
+        result, profiles = await run_ingest(ingest_law, stored_file, lambda documents, removed_ids, key: sync_in_background(
+            "law", documents, removed_ids
+        ))
+        return JSONResponse(content={**result, 'tokens': current_ledger().summary(), 'file': stored_file},
+                            headers={"X-Profile-File": profiles[0]} if profiles else None)
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        docs = []
-        for doc in raw_docs:
-            if doc not in docs:
-                docs.append(doc)
+@app.post("/upload/feature")
+async def upload_feature(file: UploadFile = File(...), jurisdictions: str = Form(""), labels: str = Form("")):
+    """
+    `jurisdictions` / `labels` are optional comma-separated constraints on the laws searched,
+    e.g. jurisdictions="European Union, United States/Utah".
+    """
+    current_ledger().document = os.path.basename(file.filename)
+    try:
+        with stage("file_receive"):
+            stored_file = await feature_uploads.save(file)
+        result, profiles = await run_ingest(ingest_feature, stored_file, lambda documents, removed_ids, key: sync_in_background(
+            "feature", documents, removed_ids
+        ), jurisdictions, labels)
+        return JSONResponse(content={**result, 'tokens': current_ledger().summary(), 'file': stored_file},
+                            headers={"X-Profile-File": profiles[0]} if profiles else None)
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Final prompt
-        full_prompt = f"""
-            <features>
-            {features_prompt}
-            </features>
-            <terminology>
-            {terminology_prompt}
-            </terminology>
-        """
 
-        result = "{}"
-        if docs:
-            result = rag_law_model.prompt(full_prompt.strip(), docs)
+async def store_batch(uploads: UploadStore, files: List[UploadFile]) -> List[dict]:
+    """
+    Stream every file of a batch to the store, expanding zip archives; identical documents are kept once.
+    The documents stored (files and archive members, not the archives themselves) share UPLOAD_BATCH_MAX_BYTES.
+    """
+    stored, seen = [], set()
+    budget = ByteBudget(UPLOAD_BATCH_MAX_BYTES)
+    with stage("file_receive", len(files)):
+        for file in files:
+            archive = os.path.splitext(file.filename or "")[1].lower() == ".zip"
+            stored_file = await uploads.save(file, budget=None if archive else budget)
+            if archive:
+                members = await run_in_threadpool(uploads.save_archive, stored_file["path"], budget=budget)
+                os.remove(stored_file["path"])  # the members are stored, the archive itself is not needed
+            else:
+                members = [stored_file]
+            for member in members:
+                if member["sha256"] not in seen:
+                    seen.add(member["sha256"])
+                    stored.append(member)
+    if not stored:
+        raise HTTPException(status_code=400, detail="No documents in the upload")
+    if len(stored) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"{len(stored)} documents uploaded, at most {UPLOAD_BATCH_MAX_FILES} per batch")
+    return stored
+
+
+def merge_conflicts(results, result_key: str, result_id: str, violated_by: str) -> dict:
+    """One conflict report for a batch: items found for several documents are merged, listing every source file."""
+    merged = {}
+    for filename, conflict in results:
+        for item in (conflict or {}).get(result_key, []):
+            entry = merged.setdefault(item.get(result_id), {**item, violated_by: [], "reasoning": "", "files": []})
+            entry[violated_by] += [record_id for record_id in item.get(violated_by, []) if record_id not in entry[violated_by]]
+            if item.get("reasoning") and item["reasoning"] not in entry["reasoning"]:
+                entry["reasoning"] = f'{entry["reasoning"]}\n{item["reasoning"]}'.strip()
+            if filename not in entry["files"]:
+                entry["files"].append(filename)
+    return {result_key: list(merged.values())}
+
+
+def ingest_batch(kind: str, stored_files: List[dict], ingest, result_key: str, result_id: str,
+                 violated_by: str, parallelism: int) -> dict:
+    """
+    Run `ingest` over the stored files, `parallelism` documents at a time (parse and analysis calls are
+    I/O-bound), then commit the vector store changes of the whole batch at once: one embedding pass in
+    batches of UPLOAD_BATCH_EMBED_SIZE, one save per touched shard, one candidate link refresh.
+    Each document gets its own ledger entry and trace span; a failing document does not fail the batch.
+    Only the first document of a law code / project name is committed, later revisions of it fail.
+    """
+    batch_ledger = current_ledger()
+    documents, removed_ids = [], []
+    claimed = {}  # law code / project name -> the stored file committing it
+    pending_lock = threading.Lock()
+
+    def collect(stored_file, new_documents, stale_ids, key):
+        with pending_lock:
+            # Every document is diffed against the stored version, not against the batch: a second revision
+            # of the same law or project would commit duplicates next to the first
+            owner = claimed.setdefault(key, stored_file) if key is not None else stored_file
+            if owner is not stored_file:
+                raise ValueError(f"{kind} {key} is also in {owner['filename']} of this batch, upload its revisions separately")
+            documents.extend(new_documents)
+            removed_ids.extend(stale_ids)
+
+    def run_one(index: int, stored_file: dict) -> dict:
+        entry = {'file': stored_file}
+        with ledger_scope(stored_file["filename"], f"{batch_ledger.request_id}-{index}", phase="batch") as ledger, \
+                span(f"ingest_{kind}", file=stored_file["filename"]), profiler.follow(f"ingest-{index}"):
+            try:
+                entry.update(ingest(stored_file, functools.partial(collect, stored_file)))
+            except Exception as e:
+                print(f"Failed to ingest {kind} {stored_file['filename']}:", e)
+                entry['error'] = str(e)
+            entry['tokens'] = ledger.summary()
+        return entry
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix=f"batch_{kind}") as executor:
+        # Each task runs in a copy of the request context so its spans land on the batch trace
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_one, i, stored_file)
+            for i, stored_file in enumerate(stored_files)
+        ]
+        results = [future.result() for future in futures]
+
+    sync_in_background(kind, documents, removed_ids, UPLOAD_BATCH_EMBED_SIZE)
+
+    succeeded = [entry for entry in results if 'error' not in entry]
+    diff = {key: sum(entry['diff'][key] for entry in succeeded) for key in ("added", "unchanged", "removed")}
+    total = {}
+    for entry in results:
+        for field, value in entry['tokens']['total'].items():
+            total[field] = total.get(field, 0) + value
+    return {
+        'conflict': merge_conflicts(
+            [(entry['file']['filename'], entry['conflict']) for entry in succeeded], result_key, result_id, violated_by
+        ),
+        'diff': diff,
+        'files': results,
+        'failed': len(results) - len(succeeded),
+        'vector_store': {'documents': len(documents), 'removed': len(removed_ids)},
+        'tokens': {'request_id': batch_ledger.request_id, 'total': total},
+    }
+
+
+def batch_parallelism(parallelism: int) -> int:
+    return max(1, min(parallelism or UPLOAD_BATCH_PARALLELISM, UPLOAD_BATCH_MAX_PARALLELISM))
+
+
+@app.post("/upload/law/batch")
+async def upload_law_batch(files: List[UploadFile] = File(...), parallelism: int = Form(0)):
+    """
+    Onboard many law documents at once: `files` are PDFs and/or zip archives of PDFs, processed
+    `parallelism` at a time (UPLOAD_BATCH_PARALLELISM by default) with a single vector store commit.
+    Returns one combined conflict report plus the result (or error) of every document.
+    """
+    current_ledger().document = f"batch:{len(files)} files"
+    try:
+        stored_files = await store_batch(law_uploads, files)
+        result = await run_in_threadpool(
+            ingest_batch, "law", stored_files, ingest_law,
+            "features", "feature_id", "provision_ids", batch_parallelism(parallelism),
+        )
+        return JSONResponse(content=result)
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return JSONResponse(content={'conflict': result, 'parsed_feature': parsed_feature})
 
+@app.post("/upload/feature/batch")
+async def upload_feature_batch(files: List[UploadFile] = File(...), jurisdictions: str = Form(""),
+                               labels: str = Form(""), parallelism: int = Form(0)):
+    """Batch version of /upload/feature (see /upload/law/batch); `jurisdictions` / `labels` apply to every file."""
+    current_ledger().document = f"batch:{len(files)} files"
+    try:
+        stored_files = await store_batch(feature_uploads, files)
+        result = await run_in_threadpool(
+            ingest_batch, "feature", stored_files,
+            lambda stored_file, commit: ingest_feature(stored_file, commit, jurisdictions, labels),
+            "provisions", "provision_id", "feature_ids", batch_parallelism(parallelism),
+        )
+        return JSONResponse(content=result)
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,53 @@
+import sys
+import argparse
+
+from model.RAGLawModel import RAGLawModel
+from model.FeatureRagModel import FeatureRagModel
+
+
+def get_store(kind):
+    model = RAGLawModel() if kind == "law" else FeatureRagModel()
+    return model.store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands for the sharded law/feature vector stores.")
+    parser.add_argument("store", choices=["law", "feature"], help="Which vector store to operate on.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Print the document count of every shard.")
+    sub.add_parser("reshard", help="Move documents of the legacy single store into per-jurisdiction/per-project shards.")
+    rebuild = sub.add_parser("rebuild", help="Rebuild the lexical/facet indexes of one shard.")
+    rebuild.add_argument("shard")
+    sub.add_parser("reembed", help="Re-embed every document with the configured EMBEDDING_PROVIDER (after switching providers).")
+    compact = sub.add_parser("compact", help="Rebuild shards with only their live vectors (drops tombstones of deleted documents).")
+    compact.add_argument("shard", nargs="?", help="Only this shard (default: every shard).")
+    sub.add_parser("verify", help="Check docstore, FAISS index and lexical index consistency; exits 1 on problems.")
+    args = parser.parse_args()
+
+    store = get_store(args.store)
+    if args.command == "reshard":
+        print(store.reshard())
+    elif args.command == "reembed":
+        print(store.reembed())
+    elif args.command == "rebuild":
+        store.rebuild_shard(args.shard)
+        print(f"Rebuilt shard '{args.shard}'.")
+    elif args.command == "compact":
+        for result in store.compact([args.shard] if args.shard else None):
+            print(f"Compacted {result['shard']}: {result['before']} -> {result['after']} vectors "
+                  f"({result['tombstones']} tombstones dropped, {result['orphans']} documents re-embedded)")
+    elif args.command == "verify":
+        problems = store.verify()
+        for key, found in problems.items():
+            for problem in found:
+                print(f"{key}: {problem}")
+        print("Consistent." if not problems else "Run `compact` to repair the shards above.")
+        if problems:
+            sys.exit(1)
+
+    for key, shard in sorted(store.shards.items()):
+        print(f"{key}: {len(shard)} documents, {len(shard.tombstones)} tombstones ({shard.path})")
+
+
+if __name__ == "__main__":
+    main()
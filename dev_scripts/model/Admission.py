@@ -0,0 +1,140 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from monitoring.Metrics import ADMISSIONS, QUEUE_DEPTH, stage
+
+# name: (concurrency, queue size, max wait seconds); a queue size / wait of None is unbounded.
+# upload / batch_upload admit whole requests at the edge and reject when saturated; parse / analysis cap the
+# Gemini calls of admitted pipelines, which wait for a slot instead of failing.
+# Each is overridable with ADMISSION_<NAME>_CONCURRENCY / _QUEUE / _WAIT (empty = unbounded).
+DEFAULT_LIMITS = {
+    "upload": (4, 8, 30.0),
+    "batch_upload": (1, 2, 30.0),
+    "parse": (4, None, None),
+    "analysis": (4, None, None),
+}
+
+
+class Overloaded(Exception):
+    """A stage is saturated: 429 when its wait queue is full, 503 when the wait for a slot timed out."""
+
+    def __init__(self, name: str, status: int, retry_after: int):
+        reason = "wait queue is full" if status == 429 else "no capacity freed up in time"
+        super().__init__(f"The service is at capacity for {name} ({reason}), retry in {retry_after} s")
+        self.name = name
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimit:
+    """
+    At most `concurrency` holders at once; up to `queue_size` callers wait for a slot in FIFO order (a freed
+    slot is handed to the oldest waiter, never to a newcomer) for at most `max_wait` seconds.
+    Retry-After hints are derived from the average time a slot is held.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: Optional[int] = None, max_wait: Optional[float] = None):
+        self.logger = logging.getLogger("Admission")
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._avg_hold = None  # exponentially weighted seconds per slot
+
+    def retry_after(self) -> int:
+        """Seconds until a retry is likely to be admitted: the current backlog drained at the observed pace."""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil((self._avg_hold or 1.0) * backlog / self.concurrency))
+
+    def acquire(self) -> float:
+        """Take a slot, waiting in the queue if needed; returns the monotonic time it was granted."""
+        with self._lock:
+            if self.active < self.concurrency and not self._waiters:
+                self.active += 1
+                ADMISSIONS.inc(stage=self.name, outcome="admitted")
+                return time.monotonic()
+            if self.queue_size is not None and len(self._waiters) >= self.queue_size:
+                ADMISSIONS.inc(stage=self.name, outcome="rejected")
+                raise Overloaded(self.name, 429, self.retry_after())
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        with QUEUE_DEPTH.track(queue=f"admission_{self.name}"), stage(f"{self.name}_admission_wait"):
+            waiter.wait(self.max_wait)
+        with self._lock:
+            # release() hands the slot over by setting the event; it may do so right after the wait timed out
+            if not waiter.is_set():
+                self._waiters.remove(waiter)
+                ADMISSIONS.inc(stage=self.name, outcome="timed_out")
+                self.logger.warning(f"{self.name}: no slot within {self.max_wait} s ({self.active} active, "
+                                    f"{len(self._waiters)} waiting)")
+                raise Overloaded(self.name, 503, self.retry_after())
+        ADMISSIONS.inc(stage=self.name, outcome="queued")
+        return time.monotonic()
+
+    def release(self, acquired_at: float):
+        held = time.monotonic() - acquired_at
+        with self._lock:
+            self._avg_hold = held if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held
+            if self._waiters:
+                self._waiters.popleft().set()  # the slot passes straight to the oldest waiter
+            else:
+                self.active -= 1
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the block."""
+        acquired_at = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency, "active": self.active, "waiting": len(self._waiters),
+                "queue_size": self.queue_size, "max_wait": self.max_wait,
+                "avg_hold_seconds": round(self._avg_hold, 3) if self._avg_hold is not None else None,
+            }
+
+
+def _env_bound(name: str, default, cast):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return cast(value) if value.strip() else None
+
+
+_limits: Dict[str, ConcurrencyLimit] = {}
+_limits_lock = threading.Lock()
+
+
+def stage_limit(name: str) -> ConcurrencyLimit:
+    """The process-wide limit of a stage (see DEFAULT_LIMITS), created on first use."""
+    with _limits_lock:
+        if name not in _limits:
+            # Read at call time: main loads .ENV after the model modules are imported
+            concurrency, queue_size, max_wait = DEFAULT_LIMITS.get(name, (4, None, None))
+            prefix = f"ADMISSION_{name.upper()}"
+            _limits[name] = ConcurrencyLimit(
+                name,
+                int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+                _env_bound(f"{prefix}_QUEUE", queue_size, int),
+                _env_bound(f"{prefix}_WAIT", max_wait, float),
+            )
+        return _limits[name]
+
+
+def status() -> Dict[str, dict]:
+    with _limits_lock:
+        limits = dict(_limits)
+    return {name: limit.status() for name, limit in sorted(limits.items())}
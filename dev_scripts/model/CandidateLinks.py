@@ -0,0 +1,136 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+LINK_CANDIDATES_PATH = "link_candidates"
+LINK_CANDIDATES_FILE = "candidates.json"
+LINK_THRESHOLD = 0.6  # same relevance scale as the retrieval score_threshold
+SCORE_BLOCK = 1024  # query vectors per range search
+
+
+class CandidateLinks:
+    """
+    Persisted feature x provision candidate table.
+
+    Every feature/provision pair whose embeddings are closer than LINK_THRESHOLD is recorded.
+    update() only reads back and scores the vectors of documents not seen before, so "which features
+    does this law touch" is a dictionary lookup instead of a retrieval pass.
+    """
+
+    def __init__(self, path: str = LINK_CANDIDATES_PATH, threshold: float = LINK_THRESHOLD):
+        self.logger = logging.getLogger("CandidateLinks")
+        self.path = path
+        self.threshold = threshold
+        self.features: Dict[str, Dict[str, float]] = {}    # feature_id -> {provision_id: score}
+        self.provisions: Dict[str, Dict[str, float]] = {}  # provision_id -> {feature_id: score}
+        self.known_features = set()
+        self.known_provisions = set()
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._load()
+
+    def _load(self):
+        file_path = os.path.join(self.path, LINK_CANDIDATES_FILE)
+        if not os.path.isfile(file_path):
+            return
+        self._loaded_mtime = os.path.getmtime(file_path)
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("threshold") != self.threshold:
+            self.logger.info("Link threshold changed, candidate table will be recomputed.")
+            return
+        self.known_features = set(data["known_features"])
+        self.known_provisions = set(data["known_provisions"])
+        for feature_id, provision_id, score in data["pairs"]:
+            self._add_pair(feature_id, provision_id, score)
+
+    def reload_if_changed(self) -> bool:
+        """Pick up the table saved by another process (the index writer); True when it was reloaded."""
+        file_path = os.path.join(self.path, LINK_CANDIDATES_FILE)
+        if not os.path.isfile(file_path) or os.path.getmtime(file_path) == self._loaded_mtime:
+            return False
+        fresh = CandidateLinks(self.path, self.threshold)
+        with self._lock:
+            self.features, self.provisions = fresh.features, fresh.provisions
+            self.known_features, self.known_provisions = fresh.known_features, fresh.known_provisions
+            self._loaded_mtime = fresh._loaded_mtime
+        self.logger.info(f"Reloaded candidate links ({len(self.known_features)} features, {len(self.known_provisions)} provisions).")
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {
+                "threshold": self.threshold,
+                "known_features": sorted(self.known_features),
+                "known_provisions": sorted(self.known_provisions),
+                "pairs": [[f, p, score] for f, provisions in self.features.items() for p, score in provisions.items()],
+            }
+        os.makedirs(self.path, exist_ok=True)
+        file_path = os.path.join(self.path, LINK_CANDIDATES_FILE)
+        with open(file_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(file_path + ".tmp", file_path)
+
+    def _add_pair(self, feature_id: str, provision_id: str, score: float):
+        self.features.setdefault(feature_id, {})[provision_id] = score
+        self.provisions.setdefault(provision_id, {})[feature_id] = score
+
+    def _drop(self, feature_ids, provision_ids):
+        for feature_id in feature_ids:
+            for provision_id in self.features.pop(feature_id, {}):
+                self.provisions.get(provision_id, {}).pop(feature_id, None)
+        for provision_id in provision_ids:
+            for feature_id in self.provisions.pop(provision_id, {}):
+                self.features.get(feature_id, {}).pop(provision_id, None)
+        self.known_features -= set(feature_ids)
+        self.known_provisions -= set(provision_ids)
+
+    def _match(self, ids, vectors, other_store, other_id_field: str) -> List[Tuple[str, List[Tuple[str, float]]]]:
+        """(id, [(other record id, relevance)]) of every vector against the other store, SCORE_BLOCK queries at a time."""
+        matches = []
+        for start in range(0, len(ids), SCORE_BLOCK):
+            hits = other_store.range_search(vectors[start:start + SCORE_BLOCK], self.threshold, other_id_field)
+            matches += zip(ids[start:start + SCORE_BLOCK], hits)
+        return matches
+
+    def update(self, feature_store, law_store) -> List[Tuple[str, str, float]]:
+        """
+        Bring the table up to date with both stores; returns the newly found (feature_id, provision_id, score).
+        New and removed documents are found from the docstores; only the vectors of new documents are read
+        back, new features are range-searched against the law store and new provisions against the feature
+        store. Documents that disappeared are dropped.
+        """
+        with self._lock:
+            feature_ids = feature_store.record_ids("feature_id")
+            provision_ids = law_store.record_ids("id")
+            self._drop(self.known_features - set(feature_ids), self.known_provisions - set(provision_ids))
+
+            new_f = [feature_id for feature_id in feature_ids if feature_id not in self.known_features]
+            new_p = [provision_id for provision_id in provision_ids if provision_id not in self.known_provisions]
+            found: Dict[Tuple[str, str], float] = {}
+            if new_f:
+                for feature_id, hits in self._match(*feature_store.record_vectors("feature_id", new_f), law_store, "id"):
+                    for provision_id, score in hits:
+                        found[(feature_id, provision_id)] = score
+            if new_p:
+                for provision_id, hits in self._match(*law_store.record_vectors("id", new_p), feature_store, "feature_id"):
+                    for feature_id, score in hits:
+                        found.setdefault((feature_id, provision_id), score)  # new x new pairs are found from both sides
+
+            pairs = [(feature_id, provision_id, score) for (feature_id, provision_id), score in found.items()]
+            for feature_id, provision_id, score in pairs:
+                self._add_pair(feature_id, provision_id, score)
+            self.known_features.update(feature_ids)
+            self.known_provisions.update(provision_ids)
+        self.logger.info(f"Candidate links updated: {len(new_f)} new features, {len(new_p)} new provisions, {len(pairs)} new pairs.")
+        return pairs
+
+    def features_for_provision(self, provision_id: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.provisions.get(provision_id, {}))
+
+    def provisions_for_feature(self, feature_id: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self.features.get(feature_id, {}))
@@ -0,0 +1,167 @@
+import os
+import zlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from model.LexicalIndex import tokenize
+
+# EMBEDDING_PROVIDER: gemini (remote Gemini API) | hashing (offline token hashing) | onnx (local model)
+DEFAULT_EMBEDDING_PROVIDER = "gemini"
+GEMINI_EMBEDDING_MODEL = "models/gemini-embedding-001"
+GEMINI_DIMENSION = 3072
+# Folder holding model.onnx and tokenizer.json (a Hugging Face sentence-transformers export)
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "embedding_model")
+HASHING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 1024))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", os.cpu_count() or 1))
+ONNX_MAX_TOKENS = 512
+
+
+def embedding_provider(embedding) -> str:
+    """Name of the provider behind an embedding client; vectors of different providers are not comparable."""
+    return getattr(embedding, "provider", None) or "gemini"
+
+
+def embedding_dimension(embedding) -> int:
+    return getattr(embedding, "dimension", None) or GEMINI_DIMENSION
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Base for embedders running in-process on the CPU.
+
+    Documents are embedded in batches of `batch_size`, spread over a thread pool (numpy and onnxruntime
+    release the GIL); a query is a batch of one and never leaves the process.
+    """
+
+    provider = "local"
+    local = True
+
+    def __init__(self, dimension: int, batch_size: int = EMBEDDING_BATCH_SIZE, workers: int = EMBEDDING_WORKERS):
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dimension) float32 array of L2-normalised vectors."""
+        raise NotImplementedError
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+            return self._executor
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1 or self.workers <= 1:
+            arrays = [self._embed_batch(batch) for batch in batches]
+        else:
+            arrays = list(self._pool().map(self._embed_batch, batches))
+        return np.vstack(arrays).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class HashingEmbedding(LocalEmbeddings):
+    """
+    Deterministic offline embedding: tokens are hashed (crc32) into `dimension` signed buckets and the
+    vector is L2-normalised. Texts sharing vocabulary land close together, so retrieval stays meaningful;
+    no model files, no network. Meant for tests, benchmarks and offline development.
+    """
+
+    provider = "hashing"
+
+    def __init__(self, dimension: int = HASHING_DIMENSION, **kwargs):
+        super().__init__(dimension, **kwargs)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                bucket = zlib.crc32(token.encode("utf-8"))
+                vectors[row, bucket % self.dimension] += 1.0 if bucket & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class OnnxEmbedding(LocalEmbeddings):
+    """
+    Sentence-embedding model exported to ONNX (e.g. all-MiniLM-L6-v2 or bge-small), run with onnxruntime.
+    `model_path` holds model.onnx and tokenizer.json; token embeddings are mean-pooled over the attention mask.
+    Needs the optional onnxruntime and tokenizers packages.
+    """
+
+    provider = "onnx"
+
+    def __init__(self, model_path: str = EMBEDDING_MODEL_PATH, **kwargs):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_PROVIDER=onnx needs `pip install onnxruntime tokenizers`") from e
+        self.logger = logging.getLogger("OnnxEmbedding")
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=ONNX_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        # Parallelism comes from the batch thread pool; one intra-op thread per batch avoids oversubscription
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        super().__init__(dimension=0, **kwargs)
+        self.dimension = self._embed_batch(["dimension probe"]).shape[1]
+        self.logger.info(f"Loaded ONNX embedding model from {model_path} ({self.dimension} dimensions).")
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+        output = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        if output.ndim == 3:
+            weights = mask[..., None].astype(np.float32)
+            output = (output * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return _normalize(output.astype(np.float32))
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def create_embeddings(provider: Optional[str] = None) -> Embeddings:
+    """
+    The embedding client selected by EMBEDDING_PROVIDER, shared by every caller in the process
+    (one ONNX session, one thread pool). Stores built with one provider must be re-embedded to switch
+    (`python manage_index.py <store> reembed`).
+    """
+    # Read at call time: main loads .ENV after the model modules are imported
+    provider = (provider or os.getenv("EMBEDDING_PROVIDER", DEFAULT_EMBEDDING_PROVIDER)).lower()
+    with _instances_lock:
+        if provider not in _instances:
+            if provider == "gemini":
+                _instances[provider] = GoogleGenerativeAIEmbeddings(model=GEMINI_EMBEDDING_MODEL)
+            elif provider == "hashing":
+                _instances[provider] = HashingEmbedding()
+            elif provider == "onnx":
+                _instances[provider] = OnnxEmbedding(os.getenv("EMBEDDING_MODEL_PATH", EMBEDDING_MODEL_PATH))
+            else:
+                raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}' (expected gemini, hashing or onnx)")
+        return _instances[provider]
@@ -0,0 +1,101 @@
+import json
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Regions meaning "the whole country": such provisions apply to every region of that country
+NATIONWIDE_REGIONS = {"", "n/a", "all", "none"}
+COUNTRY_ALIASES = {
+    "united states of america": "united states",
+    "usa": "united states",
+    "us": "united states",
+    "eu": "european union",
+}
+FACETS = ("country", "region", "law_code", "labels")
+
+
+def normalize(value) -> str:
+    value = str(value or "").strip().lower()
+    return COUNTRY_ALIASES.get(value, value)
+
+
+def split_labels(labels) -> List[str]:
+    if isinstance(labels, str):
+        labels = labels.split(",")
+    return [normalize(label) for label in labels or [] if normalize(label)]
+
+
+def provision_of(doc) -> dict:
+    """Jurisdiction fields of a law Document: from metadata, falling back to its JSON page content."""
+    metadata = doc.metadata
+    if all(key in metadata for key in ("country", "region", "law_code")):
+        return {**metadata, "labels": metadata.get("labels", metadata.get("relevant_labels"))}
+    try:
+        record = json.loads(doc.page_content)
+    except (json.JSONDecodeError, TypeError):
+        return metadata
+    return {**record, "labels": record.get("relevant_labels"), **metadata}
+
+
+class FacetIndex:
+    """
+    FAISS positions precomputed per facet value (country, region, law_code, labels).
+
+    select() turns caller constraints into a sorted position array that is passed to the
+    index search as an ID selector, so only matching provisions are scanned.
+    Deleted documents must drop out and positions shift when a shard is compacted, so the index is
+    rebuilt after every mutation.
+    """
+
+    def __init__(self):
+        self.positions: Dict[str, Dict[str, np.ndarray]] = {facet: {} for facet in FACETS}
+        self.size = 0
+
+    @classmethod
+    def from_vector_store(cls, vector_store) -> "FacetIndex":
+        facets = cls()
+        lists: Dict[str, Dict[str, List[int]]] = {facet: {} for facet in FACETS}
+        for position, docstore_id in vector_store.index_to_docstore_id.items():
+            doc = vector_store.docstore.search(docstore_id)
+            if isinstance(doc, str):
+                continue
+            record = provision_of(doc)
+            for facet in ("country", "region", "law_code"):
+                lists[facet].setdefault(normalize(record.get(facet)), []).append(position)
+            for label in split_labels(record.get("labels")):
+                lists["labels"].setdefault(label, []).append(position)
+        for facet, values in lists.items():
+            facets.positions[facet] = {value: np.array(sorted(p), dtype=np.int64) for value, p in values.items()}
+        facets.size = len(vector_store.index_to_docstore_id)
+        return facets
+
+    def _lookup(self, facet: str, values: Iterable[str]) -> np.ndarray:
+        arrays = [self.positions[facet].get(normalize(value)) for value in values]
+        arrays = [array for array in arrays if array is not None]
+        return np.unique(np.concatenate(arrays)) if arrays else np.empty(0, dtype=np.int64)
+
+    def _jurisdiction(self, jurisdiction: str) -> np.ndarray:
+        """'Country/Region' -> that region plus nationwide law; a single name matches a country or a region."""
+        if "/" in jurisdiction:
+            country, region = jurisdiction.split("/", 1)
+            regional = np.union1d(self._lookup("region", [region]), self._lookup("region", NATIONWIDE_REGIONS))
+            return np.intersect1d(self._lookup("country", [country]), regional)
+        return np.union1d(self._lookup("country", [jurisdiction]), self._lookup("region", [jurisdiction]))
+
+    def select(self, jurisdictions: Optional[List[str]] = None, labels: Optional[List[str]] = None,
+               law_codes: Optional[List[str]] = None) -> Optional[np.ndarray]:
+        """
+        Positions matching any of the jurisdictions AND any of the labels AND any of the law codes.
+        Returns None when no constraint is given (search everything).
+        """
+        selected = None
+        constraints = []
+        if jurisdictions:
+            constraints.append(np.unique(np.concatenate([self._jurisdiction(j) for j in jurisdictions])))
+        if labels:
+            constraints.append(self._lookup("labels", labels))
+        if law_codes:
+            constraints.append(self._lookup("law_code", law_codes))
+        for positions in constraints:
+            selected = positions if selected is None else np.intersect1d(selected, positions)
+        return selected
@@ -1,18 +1,26 @@
-import os
 import logging
-from typing import List
+import threading
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from time import sleep
 
+from model.ShardedStore import ShardedStore, shard_slug
+from model.Embeddings import create_embeddings
+from model.utils import InstrumentedEmbeddings, known_dense_hits, reciprocal_rank_fusion, UsageCallback
+from model.Scheduler import provider_scheduler
+from monitoring.Metrics import LLM_CALLS, stage
+from model.VerdictCache import VerdictCache, analyze_pairs
+
 load_dotenv()
 
+SCORE_THRESHOLD = 0.6
+HYBRID_FETCH_K = 20  # candidates taken from each of the dense and lexical rankings
+HYBRID_TOP_K = 8  # documents returned after rank fusion
 FEATURE_VECTOR_STORE_PATH = "feature_vector_store"
+PROMPT_VERSION = "feature-v2"  # bump whenever the template or FEATURE_SCHEMA changes, cached verdicts are keyed by it
 FEATURE_SCHEMA = {
   "title": "Answer",
   "type": "object",
@@ -54,6 +62,11 @@ FEATURE_SCHEMA = {
           "reasoning": {
             "type": "string",
             "description": "List out all laws that has been violated the features and the reason for the violation"
+          },
+          "provision_ids": {
+            "type": "array",
+            "description": "id of every input provision violated by the feature.",
+            "items": {"type": "string"}
           }
         },
         "required": [
@@ -64,7 +77,8 @@ FEATURE_SCHEMA = {
           "project_name",
           "project_id",
           "reference_file",
-          "reasoning"
+          "reasoning",
+          "provision_ids"
         ]
       }
     }
@@ -82,34 +96,18 @@ class FeatureRagModel:
             self.llm = ChatGoogleGenerativeAI(
                 model="gemini-2.5-flash", response_mime_type="application/json", response_schema=FEATURE_SCHEMA
             )
-            self.embedding = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
-            self.vector_store = self._get_vector_store()
+            self.embedding = InstrumentedEmbeddings(create_embeddings())
+            self.store = ShardedStore(FEATURE_VECTOR_STORE_PATH, self.embedding, self._shard_key)
+            self._write_lock = threading.Lock()
+            self.verdicts = VerdictCache()
         except Exception as e:
             self.logger.error(f"Error initializing model components: {e}", exc_info=True)
             raise
 
-    def _get_vector_store(self) -> FAISS:
-        try:
-            if os.path.isdir(FEATURE_VECTOR_STORE_PATH):
-                self.logger.info(f"Loading existing vector store from {FEATURE_VECTOR_STORE_PATH}")
-                return FAISS.load_local(
-                    folder_path=FEATURE_VECTOR_STORE_PATH, embeddings=self.embedding, allow_dangerous_deserialization=True
-                )
-            else:
-                self.logger.info(f"Creating new vector store at {FEATURE_VECTOR_STORE_PATH}")
-                os.makedirs(FEATURE_VECTOR_STORE_PATH, exist_ok=True)
-                index = faiss.IndexFlatL2(3072)
-                vs = FAISS(
-                    embedding_function=self.embedding,
-                    index=index,
-                    docstore=InMemoryDocstore(),
-                    index_to_docstore_id={},
-                )
-                vs.save_local(FEATURE_VECTOR_STORE_PATH)
-                return vs
-        except Exception as e:
-            self.logger.error(f"Error creating/loading vector store: {e}", exc_info=True)
-            raise
+    @staticmethod
+    def _shard_key(doc) -> str:
+        """Features are sharded by project."""
+        return shard_slug(doc.metadata.get("project_name"))
 
     def _generate_template(self) -> ChatPromptTemplate:
         template = """
@@ -118,6 +116,7 @@ class FeatureRagModel:
         Your response should start with a '{{' and end with a '}}'. Do not include any other text, explanations, or markdown formatting.
 
         If you find relevant provisions in the context, extract them according to the schema.
+        Each input provision is prefixed with its [id]; list the ids of the provisions a feature violates in "provision_ids".
         If the context is empty or you cannot find any relevant provisions, you MUST return an empty JSON object.
 
         Input:
@@ -129,40 +128,122 @@ class FeatureRagModel:
         return ChatPromptTemplate.from_template(template)
 
     def update_vector_store(self, documents: List, batch_size: int = 2):
-      try:
-          for i in range(0, len(documents), batch_size):
-              batch = documents[i:i + batch_size]
-              self.vector_store.add_documents(batch)
-              sleep(2)
-          self.vector_store.save_local(FEATURE_VECTOR_STORE_PATH)
-          self.logger.info(f"Vector store updated with {len(documents)} documents in batches of {batch_size}.")
-      except Exception as e:
-          self.logger.error(f"Error updating vector store: {e}", exc_info=True)
-          raise
+        try:
+            touched = set()
+            for i in range(0, len(documents), batch_size):
+                batch = documents[i:i + batch_size]
+                touched.update(self.store.add_documents(batch))
+                sleep(2)
+            self.store.save(touched)
+            self.logger.info(f"Vector store updated with {len(documents)} documents in batches of {batch_size} (shards: {sorted(touched)}).")
+        except Exception as e:
+            self.logger.error(f"Error updating vector store: {e}", exc_info=True)
+            raise
+
+    def get_stored_records(self, project_name: str) -> Tuple[Dict[str, List[Tuple[str, str]]], Optional[str]]:
+        """
+        Map content_hash -> [(docstore_id, feature_id)] for every stored feature of a project.
+        Also returns the stored project_id so a re-upload keeps the same project identity.
+        Features stored before content hashes existed have no hash and will be treated as removed.
+        """
+        stored, project_id = {}, None
+        for docstore_id, doc in self.store.documents():
+            metadata = doc.metadata
+            if metadata.get("project_name") != project_name:
+                continue
+            project_id = project_id or metadata.get("project_id")
+            stored.setdefault(metadata.get("content_hash"), []).append((docstore_id, metadata.get("feature_id")))
+        return stored, project_id
+
+    def sync_vector_store(self, documents: List, removed_ids: List[str], batch_size: int = 2):
+        """Delete stale documents and embed only the new or changed ones."""
+        with self._write_lock:
+            try:
+                if removed_ids:
+                    touched = self.store.delete(removed_ids)
+                    self.logger.info(f"Removed {len(removed_ids)} stale documents from vector store.")
+                    self.store.save(touched)
+                if documents:
+                    self.update_vector_store(documents, batch_size)
+            except Exception as e:
+                self.logger.error(f"Error syncing vector store: {e}", exc_info=True)
+                raise
 
+    def reload_store(self) -> bool:
+        """Swap in a snapshot of the store written by another process (offline rebuild, compaction)."""
+        if not self.store.snapshot_changed():
+            return False
+        # Uploads syncing into the old shards would be lost by the swap, so they wait for it
+        with self._write_lock:
+            return self.store.reload_if_changed()
 
     def retrieve_docs(self, law) -> List:
         try:
-            retriever = self.vector_store.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={
-                    "fetch_k": len(self.vector_store.docstore._dict),
-                    "k": len(self.vector_store.docstore._dict),
-                    "score_threshold": 0.6,
-                },
-            )
-            results = retriever.invoke(law)
+            hits = self.store.search(self.embedding.embed_query(law), len(self.store), SCORE_THRESHOLD)
+            results = [self.store.get(doc_id) for doc_id, _ in hits]
             self.logger.info(f"Retrieved {len(results)} documents for law.")
             return results
         except Exception as e:
             self.logger.error(f"Error retrieving documents: {e}", exc_info=True)
             return []
 
+    def lexical_search(self, query: str, k: int = HYBRID_TOP_K) -> List:
+        """BM25 lookup only: exact tokens such as section numbers or acronyms, no embedding call."""
+        return [self.store.get(doc_id) for doc_id, _ in self.store.lexical_search(query, k)]
+
+    def hybrid_retrieve_docs(self, law, k: int = HYBRID_TOP_K) -> List:
+        """
+        Dense and BM25 rankings fused with reciprocal rank fusion, top-k documents.
+        Every project shard is searched in parallel and the results merged.
+        """
+        return [doc for doc, _, _ in self.hybrid_retrieve_scored(law, k)]
+
+    def hybrid_retrieve_scored(self, law, k: int = HYBRID_TOP_K, known_scores: Optional[Dict[str, float]] = None) -> List[Tuple]:
+        """
+        hybrid_retrieve_docs with the evidence kept: [(document, dense relevance or None, BM25 score or None)].
+        `known_scores` ({feature_id: relevance}, e.g. from the candidate link table) stand in for the dense
+        search, so the law is not embedded; the BM25 search still runs.
+        """
+        try:
+            if known_scores is None:
+                dense = self.store.search(self.embedding.embed_query(law), HYBRID_FETCH_K, SCORE_THRESHOLD)
+            else:
+                dense = known_dense_hits(self.store.find_ids("feature_id", known_scores), known_scores,
+                                         HYBRID_FETCH_K, SCORE_THRESHOLD)
+            lexical = self.store.lexical_search(law, HYBRID_FETCH_K)
+            fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in dense], [doc_id for doc_id, _ in lexical]])
+            dense_scores, lexical_scores = dict(dense), dict(lexical)
+            results = [
+                (doc, dense_scores.get(doc_id), lexical_scores.get(doc_id))
+                for doc_id, doc in ((doc_id, self.store.get(doc_id)) for doc_id in fused[:k]) if doc is not None
+            ]
+            self.logger.info(f"Retrieved {len(results)} documents for law ({len(dense)} dense, {len(lexical)} lexical).")
+            return results
+        except Exception as e:
+            self.logger.error(f"Error retrieving documents: {e}", exc_info=True)
+            return []
+
     def prompt(self, prompt, docs):
         try:
             document_chain = create_stuff_documents_chain(self.llm, self._generate_template())
-            response = document_chain.invoke({"query": prompt, "context": docs})
+            # Waits for an LLM slot and quota token in the caller's priority class
+            with provider_scheduler("llm").slot(), stage("llm_analysis"):
+                response = document_chain.invoke(
+                    {"query": prompt, "context": docs}, config={"callbacks": [UsageCallback("llm_analysis")]}
+                )
+            LLM_CALLS.inc(outcome="made")
             return response
         except Exception as e:
             self.logger.error(f"Error running prompt chain: {e}", exc_info=True)
             return None
+
+    def analyze(self, laws: List[dict], retrieved: Dict[str, List], build_prompt) -> Tuple[dict, dict]:
+        """
+        Impact analysis of uploaded provisions against the features retrieved for each of them.
+        Pairs judged before are answered from the verdict cache, only the others are sent to the LLM.
+        """
+        return analyze_pairs(
+            self.prompt, build_prompt, self.verdicts, PROMPT_VERSION, laws, retrieved,
+            input_id="id", doc_id="feature_id", result_key="features", result_id="feature_id",
+            violated_by="provision_ids", inputs_are_features=False,
+        )
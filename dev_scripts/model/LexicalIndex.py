@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+LEXICAL_INDEX_FILE = "lexical.json"
+
+# Keeps section numbers ("2258A"), acronyms ("CSAM") and names ("CyberTipline") as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index kept next to a FAISS store, keyed by docstore id.
+    Serves exact-token lookups without an embedding call.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_docstore(cls, docstore: Dict) -> "LexicalIndex":
+        """Build an index from a vector store's docstore ({docstore_id: Document})."""
+        index = cls()
+        for docstore_id, doc in docstore.items():
+            index.add(docstore_id, doc.page_content)
+        return index
+
+    @classmethod
+    def load(cls, folder_path: str) -> "LexicalIndex":
+        index = cls()
+        with open(os.path.join(folder_path, LEXICAL_INDEX_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index.k1, index.b = data["k1"], data["b"]
+        index.postings = data["postings"]
+        index.doc_lengths = data["doc_lengths"]
+        for term, docs in index.postings.items():
+            for doc_id in docs:
+                index.doc_terms.setdefault(doc_id, []).append(term)
+        index._total_length = sum(index.doc_lengths.values())
+        return index
+
+    def save(self, folder_path: str):
+        with self._lock:
+            data = {"k1": self.k1, "b": self.b, "postings": self.postings, "doc_lengths": self.doc_lengths}
+        os.makedirs(folder_path, exist_ok=True)
+        path = os.path.join(folder_path, LEXICAL_INDEX_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_lengths
+
+    def add(self, doc_id: str, text: str):
+        tokens = tokenize(text)
+        with self._lock:
+            if doc_id in self.doc_lengths:
+                self._remove(doc_id)
+            counts = Counter(tokens)
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+            self.doc_terms[doc_id] = list(counts)
+            self.doc_lengths[doc_id] = len(tokens)
+            self._total_length += len(tokens)
+
+    def remove(self, doc_ids: List[str]):
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id in self.doc_lengths:
+                    self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        for term in self.doc_terms.pop(doc_id, []):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+        self._total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (doc_id, BM25 score) for a query; documents sharing no term are not returned.
+        `allowed` restricts scoring to those doc ids.
+        """
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
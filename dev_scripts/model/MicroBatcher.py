@@ -0,0 +1,91 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Generic, List, Sequence, TypeVar
+
+from monitoring.Metrics import MICROBATCH_SIZE
+
+# Cross-request micro-batching of query embeddings and FAISS searches: concurrent callers are served by one
+# call with a stacked batch instead of one call each. MICROBATCH=0 calls straight through on the caller thread.
+MICROBATCH = os.getenv("MICROBATCH", "1") != "0"
+MICROBATCH_MAX = int(os.getenv("MICROBATCH_MAX", 32))
+# Collection window, only waited for while requests are actually arriving together (the previous batch had
+# more than one item); a lone request is dispatched immediately and pays no added latency
+MICROBATCH_WAIT_MS = float(os.getenv("MICROBATCH_WAIT_MS", 2))
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+class MicroBatcher(Generic[Item, Result]):
+    """
+    Collects items submitted by concurrent threads and runs `fn` on them as one batch on a worker thread.
+
+    `fn(items)` returns one result per item, in order. submit() blocks until the caller's result is ready and
+    raises the caller's exception; when a batch of several fails, its items are retried one by one so a single
+    bad input does not fail the other requests batched with it. While a batch runs new items queue up, so
+    under load batches form on their own and at low load each item goes out alone.
+    """
+
+    def __init__(self, name: str, fn: Callable[[List[Item]], Sequence[Result]],
+                 max_batch: int = MICROBATCH_MAX, wait_ms: float = MICROBATCH_WAIT_MS):
+        self.logger = logging.getLogger("MicroBatcher")
+        self.name = name
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.wait = max(0.0, wait_ms) / 1000
+        self._queue: "queue.SimpleQueue[tuple]" = queue.SimpleQueue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._last_size = 1
+
+    def submit(self, item: Item) -> Result:
+        if not MICROBATCH or self.max_batch == 1:
+            return self.fn([item])[0]
+        self._ensure_thread()
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + (self.wait if self._last_size > 1 else 0)
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._last_size = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            MICROBATCH_SIZE.observe(len(batch), batcher=self.name)
+            try:
+                results = self.fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                self.logger.warning(f"{self.name} batch of {len(batch)} failed, retrying items one by one: {e}")
+                for item, future in batch:
+                    try:
+                        future.set_result(self.fn([item])[0])
+                    except Exception as item_error:
+                        future.set_exception(item_error)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
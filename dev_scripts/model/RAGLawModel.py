@@ -1,16 +1,27 @@
-import os
+import json
 import logging
-from typing import List
+import threading
+from typing import Dict, List, Optional, Tuple
 
-import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from time import sleep
 
+from model.FacetIndex import normalize, provision_of
+from model.ShardedStore import ShardedStore, shard_slug
+from model.Embeddings import create_embeddings
+from model.utils import content_hash, InstrumentedEmbeddings, known_dense_hits, LAW_HASH_FIELDS, reciprocal_rank_fusion, UsageCallback
+from model.Scheduler import provider_scheduler
+from monitoring.Metrics import LLM_CALLS, stage
+from model.VerdictCache import VerdictCache, analyze_pairs
+
+SCORE_THRESHOLD = 0.6
+HYBRID_FETCH_K = 20  # candidates taken from each of the dense and lexical rankings
+HYBRID_TOP_K = 8  # documents returned after rank fusion
 VECTOR_STORE = "law_index"
+PROMPT_VERSION = "law-v2"  # bump whenever the template or SCHEMA changes, cached verdicts are keyed by it
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
 SCHEMA = {
@@ -33,6 +44,11 @@ SCHEMA = {
                     "reference_file": {"type": "string", "description": "reference_file of provision violated."},
                     "reasoning": {"type": "string", "description": "List out all features that has violated the provision and how does the feature violate the provision"},
                     "provision_id" : {"type": "string", "description": "id of provivision violated."},
+                    "feature_ids": {
+                        "type": "array",
+                        "description": "feature_id of every input feature that violates the provision.",
+                        "items": {"type": "string"},
+                    },
                 },
                 "required": [
                     "provision_title",
@@ -44,6 +60,8 @@ SCHEMA = {
                     "law_code",
                     "reference_file",
                     "reasoning",
+                    "provision_id",
+                    "feature_ids",
                 ],
             },
         }
@@ -59,35 +77,18 @@ class RAGLawModel:
             self.llm = ChatGoogleGenerativeAI(
                 model="gemini-2.5-flash", response_mime_type="application/json", response_schema=SCHEMA
             )
-            self.embedding = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
-            self.vector_store = self._get_vector_store()
+            self.embedding = InstrumentedEmbeddings(create_embeddings())
+            self.store = ShardedStore(VECTOR_STORE, self.embedding, self._shard_key, with_facets=True)
+            self._write_lock = threading.Lock()
+            self.verdicts = VerdictCache()
         except Exception as e:
             self.logger.error(f"Error initializing model components: {e}", exc_info=True)
             raise
 
-    def _get_vector_store(self) -> FAISS:
-        try:
-            if os.path.isdir(VECTOR_STORE):
-                self.logger.info(f"Loading existing vector store from {VECTOR_STORE}")
-                return FAISS.load_local(
-                    folder_path=VECTOR_STORE, embeddings=self.embedding, allow_dangerous_deserialization=True
-                )
-            else:
-                self.logger.info(f"Creating new vector store at {VECTOR_STORE}")
-                os.makedirs(VECTOR_STORE, exist_ok=True)
-                index = faiss.IndexFlatL2(3072)
-
-                vs = FAISS(
-                    embedding_function=self.embedding,
-                    index=index,
-                    docstore=InMemoryDocstore(),
-                    index_to_docstore_id={},
-                )
-                vs.save_local(VECTOR_STORE)
-                return vs
-        except Exception as e:
-            self.logger.error(f"Error creating/loading vector store: {e}", exc_info=True)
-            raise
+    @staticmethod
+    def _shard_key(doc) -> str:
+        """Laws are sharded by jurisdiction (country)."""
+        return shard_slug(normalize(provision_of(doc).get("country")))
 
     def _generate_template(self) -> ChatPromptTemplate:
         template = """
@@ -97,6 +98,7 @@ class RAGLawModel:
         Your response should start with a '{{' and end with a '}}'. Do not include any other text, explanations, or markdown formatting.
         
         If you find relevant provisions in the context, extract them according to the schema.
+        Each input feature is prefixed with its [feature_id]; list the ids of the features violating a provision in "feature_ids".
         If the context is empty or you cannot find any relevant provisions, you MUST return a JSON object with an empty list for the "provisions" key.
 
         Context:
@@ -108,38 +110,131 @@ class RAGLawModel:
 
     def update_vector_store(self, documents: List, batch_size: int = 2):
         try:
+            touched = set()
             for i in range(0, len(documents), batch_size):
                 batch = documents[i:i + batch_size]
-                self.vector_store.add_documents(batch)
+                touched.update(self.store.add_documents(batch))
                 sleep(2)
-            self.vector_store.save_local(VECTOR_STORE)
-            self.logger.info(f"Vector store updated with {len(documents)} documents in batches of {batch_size}.")
+            self.store.save(touched)
+            self.logger.info(f"Vector store updated with {len(documents)} documents in batches of {batch_size} (shards: {sorted(touched)}).")
         except Exception as e:
             self.logger.error(f"Error updating vector store: {e}", exc_info=True)
             raise
 
+    def get_stored_records(self, law_code: str) -> Dict[str, List[Tuple[str, str]]]:
+        """Map content_hash -> [(docstore_id, provision id)] for every stored provision of a law."""
+        stored = {}
+        for docstore_id, doc in self.store.documents():
+            metadata = doc.metadata
+            if "content_hash" in metadata and "law_code" in metadata:
+                code, digest, record_id = metadata["law_code"], metadata["content_hash"], metadata.get("id")
+            else:
+                # Older documents only carry the raw provision JSON
+                try:
+                    record = json.loads(doc.page_content)
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                code, digest, record_id = record.get("law_code"), content_hash(record, LAW_HASH_FIELDS), record.get("id")
+            if code == law_code:
+                stored.setdefault(digest, []).append((docstore_id, record_id))
+        return stored
+
+    def sync_vector_store(self, documents: List, removed_ids: List[str], batch_size: int = 2):
+        """Delete stale documents and embed only the new or changed ones."""
+        with self._write_lock:
+            try:
+                if removed_ids:
+                    touched = self.store.delete(removed_ids)
+                    self.logger.info(f"Removed {len(removed_ids)} stale documents from vector store.")
+                    self.store.save(touched)
+                if documents:
+                    self.update_vector_store(documents, batch_size)
+            except Exception as e:
+                self.logger.error(f"Error syncing vector store: {e}", exc_info=True)
+                raise
+
+    def reload_store(self) -> bool:
+        """Swap in a snapshot of the store written by another process (offline rebuild, compaction)."""
+        if not self.store.snapshot_changed():
+            return False
+        # Uploads syncing into the old shards would be lost by the swap, so they wait for it
+        with self._write_lock:
+            return self.store.reload_if_changed()
+
     def retrieve_docs(self, feature) -> List:
         try:
-            retriever = self.vector_store.as_retriever(
-                search_type="similarity_score_threshold",
-                search_kwargs={
-                    "fetch_k": len(self.vector_store.docstore._dict),
-                    "k": len(self.vector_store.docstore._dict),
-                    "score_threshold": 0.6,
-                },
-            )
-            results = retriever.invoke(feature)
+            hits = self.store.search(self.embedding.embed_query(feature), len(self.store), SCORE_THRESHOLD)
+            results = [self.store.get(doc_id) for doc_id, _ in hits]
             self.logger.info(f"Retrieved {len(results)} documents for feature.")
             return results
         except Exception as e:
             self.logger.error(f"Error retrieving documents: {e}", exc_info=True)
             return []
 
+    def lexical_search(self, query: str, k: int = HYBRID_TOP_K) -> List:
+        """BM25 lookup only: exact tokens such as section numbers or acronyms, no embedding call."""
+        return [self.store.get(doc_id) for doc_id, _ in self.store.lexical_search(query, k)]
+
+    def hybrid_retrieve_docs(self, feature, k: int = HYBRID_TOP_K, jurisdictions: Optional[List[str]] = None,
+                             labels: Optional[List[str]] = None, law_codes: Optional[List[str]] = None) -> List:
+        """
+        Dense and BM25 rankings fused with reciprocal rank fusion, top-k documents.
+        Jurisdiction ("Country", "Region" or "Country/Region"), label and law code constraints are
+        applied inside both searches, so provisions outside them are never scanned.
+        Every jurisdiction shard is searched in parallel and the results merged.
+        """
+        return [doc for doc, _, _ in self.hybrid_retrieve_scored(feature, k, jurisdictions, labels, law_codes)]
+
+    def hybrid_retrieve_scored(self, feature, k: int = HYBRID_TOP_K, jurisdictions: Optional[List[str]] = None,
+                               labels: Optional[List[str]] = None, law_codes: Optional[List[str]] = None,
+                               known_scores: Optional[Dict[str, float]] = None) -> List[Tuple]:
+        """
+        hybrid_retrieve_docs with the evidence kept: [(document, dense relevance or None, BM25 score or None)].
+        `known_scores` ({provision id: relevance} from the unfiltered candidate link table) stand in for the
+        dense search, so the feature is not embedded; the BM25 search still runs.
+        """
+        try:
+            filters = {"jurisdictions": jurisdictions, "labels": labels, "law_codes": law_codes}
+            filters = {key: value for key, value in filters.items() if value}
+            if known_scores is None:
+                dense = self.store.search(self.embedding.embed_query(feature), HYBRID_FETCH_K, SCORE_THRESHOLD, filters)
+            else:
+                dense = known_dense_hits(self.store.find_ids("id", known_scores), known_scores,
+                                         HYBRID_FETCH_K, SCORE_THRESHOLD)
+            lexical = self.store.lexical_search(feature, HYBRID_FETCH_K, filters)
+            fused = reciprocal_rank_fusion([[doc_id for doc_id, _ in dense], [doc_id for doc_id, _ in lexical]])
+            dense_scores, lexical_scores = dict(dense), dict(lexical)
+            results = [
+                (doc, dense_scores.get(doc_id), lexical_scores.get(doc_id))
+                for doc_id, doc in ((doc_id, self.store.get(doc_id)) for doc_id in fused[:k]) if doc is not None
+            ]
+            self.logger.info(f"Retrieved {len(results)} documents for feature ({len(dense)} dense, {len(lexical)} lexical).")
+            return results
+        except Exception as e:
+            self.logger.error(f"Error retrieving documents: {e}", exc_info=True)
+            return []
+
     def prompt(self, prompt, docs):
         try:
             document_chain = create_stuff_documents_chain(self.llm, self._generate_template())
-            response = document_chain.invoke({"input": prompt, "context": docs})
+            # Waits for an LLM slot and quota token in the caller's priority class
+            with provider_scheduler("llm").slot(), stage("llm_analysis"):
+                response = document_chain.invoke(
+                    {"input": prompt, "context": docs}, config={"callbacks": [UsageCallback("llm_analysis")]}
+                )
+            LLM_CALLS.inc(outcome="made")
             return response
         except Exception as e:
             self.logger.error(f"Error running prompt chain: {e}", exc_info=True)
             return None
+
+    def analyze(self, features: List[dict], retrieved: Dict[str, List], build_prompt) -> Tuple[dict, dict]:
+        """
+        Conflict analysis of uploaded features against the provisions retrieved for each of them.
+        Pairs judged before are answered from the verdict cache, only the others are sent to the LLM.
+        """
+        return analyze_pairs(
+            self.prompt, build_prompt, self.verdicts, PROMPT_VERSION, features, retrieved,
+            input_id="feature_id", doc_id="id", result_key="provisions", result_id="provision_id",
+            violated_by="feature_ids", inputs_are_features=True,
+        )
@@ -0,0 +1,53 @@
+import os
+import time
+import threading
+from typing import Optional
+
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 60))
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: on average `rate` acquisitions per `per` seconds, bursts of up to `burst`.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, burst: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.per = per
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: float, burst: Optional[float] = None):
+        with self._lock:
+            self.rate = rate
+            self.burst = burst if burst is not None else max(1.0, rate / 10)
+            self._tokens = self.burst
+            self._updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens` if available (returns 0), else the seconds until they will be; never blocks."""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate / self.per)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) * self.per / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until `tokens` are available; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+# Shared by every Gemini generation call in the process (parses, analyses, batch sweeps); taken through
+# model.Scheduler so that waiting calls are served in priority order
+llm_rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
@@ -0,0 +1,164 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from model.RateLimiter import RateLimiter, llm_rate_limiter
+from monitoring.Metrics import QUEUE_DEPTH, SCHEDULED, stage
+
+# Priority classes of provider calls, highest first: uploads from the frontend, bulk (batch) ingestion,
+# background work (vector store syncs, link refreshes, compliance sweeps)
+PRIORITY_CLASSES = ("interactive", "batch", "background")
+DEFAULT_PRIORITY = "interactive"
+# In-flight calls per provider resource
+PROVIDER_CONCURRENCY = 8
+# Share of the slots a class may hold while higher classes have calls running or waiting; alone it may use them all
+CLASS_QUOTAS = {"interactive": 1.0, "batch": 0.5, "background": 0.25}
+# A call waiting this long is served next regardless of its class
+STARVATION_SECONDS = 60.0
+POLL_SECONDS = 1.0  # waiters re-check for starvation at least this often
+
+_priority: ContextVar[str] = ContextVar("provider_priority", default=DEFAULT_PRIORITY)
+
+
+@contextmanager
+def priority(name: str):
+    """Run the block's provider calls (and threads started from its context) in priority class `name`."""
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class {name}, expected one of {PRIORITY_CLASSES}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class PriorityScheduler:
+    """
+    Grants provider call slots in priority order: at most `concurrency` calls in flight, each also taking a
+    token from `limiter` (the provider quota) when one is given. A waiting higher class is always served before
+    a lower one, and a lower class holds at most its quota share of the slots while higher classes are active,
+    so interactive calls find capacity and bulk work uses what is left. Calls waiting `starvation_seconds` are
+    promoted ahead of every class, so a steady interactive load never stalls bulk work completely.
+    """
+
+    def __init__(self, name: str, concurrency: int = PROVIDER_CONCURRENCY, quotas: Optional[Dict[str, float]] = None,
+                 starvation_seconds: float = STARVATION_SECONDS, limiter: Optional[RateLimiter] = None):
+        self.logger = logging.getLogger("Scheduler")
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        quotas = {**CLASS_QUOTAS, **(quotas or {})}
+        self.quotas = {cls: max(1, math.floor(quotas[cls] * self.concurrency)) for cls in PRIORITY_CLASSES}
+        self.starvation_seconds = starvation_seconds
+        self.limiter = limiter
+        self.in_flight = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._waiting = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+
+    def _active(self, cls: str) -> bool:
+        return bool(self.in_flight[cls] or self._waiting[cls])
+
+    def _next(self, now: float):
+        """The waiter to serve next as (class, ticket, promoted), or None while every slot is taken."""
+        if sum(self.in_flight.values()) >= self.concurrency:
+            return None
+        heads = [(cls, self._waiting[cls][0]) for cls in PRIORITY_CLASSES if self._waiting[cls]]
+        starved = [(enqueued, cls, ticket) for cls, (ticket, enqueued) in heads if now - enqueued >= self.starvation_seconds]
+        if starved:
+            _, cls, ticket = min(starved, key=lambda entry: entry[0])
+            return cls, ticket, True
+        for cls, (ticket, _) in heads:
+            higher = PRIORITY_CLASSES[:PRIORITY_CLASSES.index(cls)]
+            if self.in_flight[cls] < self.quotas[cls] or not any(self._active(other) for other in higher):
+                return cls, ticket, False
+        return None
+
+    def acquire(self, cls: Optional[str] = None) -> str:
+        """Wait for a slot in class `cls` (default: the caller's priority class); returns the class."""
+        cls = cls or current_priority()
+        ticket = object()
+        started = time.monotonic()
+        with QUEUE_DEPTH.track(queue=f"{self.name}_{cls}"), stage(f"{self.name}_scheduler_wait"):
+            with self._cond:
+                self._waiting[cls].append((ticket, started))
+                try:
+                    while True:
+                        chosen = self._next(time.monotonic())
+                        if chosen is not None and chosen[1] is ticket:
+                            delay = self.limiter.try_acquire() if self.limiter is not None else 0.0
+                            if not delay:
+                                break
+                            self._cond.wait(delay)
+                        else:
+                            self._cond.wait(POLL_SECONDS)
+                finally:
+                    self._waiting[cls].remove((ticket, started))
+                self.in_flight[cls] += 1
+                # The queue heads changed: the next waiter may be servable right away
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        outcome = "promoted" if chosen[2] else ("waited" if waited >= 0.001 else "immediate")
+        if chosen[2]:
+            self.logger.info(f"{self.name}: {cls} call promoted after waiting {waited:.1f} s")
+        SCHEDULED.inc(resource=self.name, priority=cls, outcome=outcome)
+        return cls
+
+    def release(self, cls: str):
+        with self._cond:
+            self.in_flight[cls] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, cls: Optional[str] = None):
+        """Hold a provider call slot for the duration of the block."""
+        cls = self.acquire(cls)
+        try:
+            yield
+        finally:
+            self.release(cls)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency": self.concurrency, "quotas": dict(self.quotas),
+                "in_flight": dict(self.in_flight), "waiting": {cls: len(q) for cls, q in self._waiting.items()},
+            }
+
+
+_schedulers: Dict[str, PriorityScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def provider_scheduler(resource: str) -> PriorityScheduler:
+    """
+    The process-wide scheduler of a provider resource: "llm" (Gemini generation: parses and analyses, under
+    LLM_REQUESTS_PER_MINUTE) or "embedding" (remote embedding calls). Configured with
+    SCHEDULER_<RESOURCE>_CONCURRENCY, SCHEDULER_QUOTA_<CLASS> and SCHEDULER_STARVATION_SECONDS.
+    """
+    with _schedulers_lock:
+        if resource not in _schedulers:
+            # Read at call time: main loads .ENV after the model modules are imported
+            quotas = {cls: float(os.getenv(f"SCHEDULER_QUOTA_{cls.upper()}", CLASS_QUOTAS[cls])) for cls in PRIORITY_CLASSES}
+            _schedulers[resource] = PriorityScheduler(
+                resource,
+                int(os.getenv(f"SCHEDULER_{resource.upper()}_CONCURRENCY", PROVIDER_CONCURRENCY)),
+                quotas,
+                float(os.getenv("SCHEDULER_STARVATION_SECONDS", STARVATION_SECONDS)),
+                llm_rate_limiter if resource == "llm" else None,
+            )
+        return _schedulers[resource]
+
+
+def status() -> Dict[str, dict]:
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {name: scheduler.status() for name, scheduler in sorted(schedulers.items())}
@@ -0,0 +1,752 @@
+import os
+import math
+import re
+import json
+import time
+import pickle
+import uuid
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from model.Embeddings import embedding_dimension, embedding_provider
+from model.FacetIndex import FacetIndex
+from model.LexicalIndex import LexicalIndex
+from model.MicroBatcher import MicroBatcher
+from model.utils import search_by_vectors
+from monitoring.Metrics import stage
+
+EMBEDDING_MARKER = "embedding.json"  # provider/dimension the vectors of a store were made with
+DEFAULT_SHARD = "default"  # the legacy single-store layout at the root folder
+SHARDS_DIR = "shards"
+# A shard is compacted on save once this share of its index positions are tombstones (and at least COMPACT_MIN_TOMBSTONES)
+COMPACT_TOMBSTONE_RATIO = float(os.getenv("COMPACT_TOMBSTONE_RATIO", 0.2))
+COMPACT_MIN_TOMBSTONES = int(os.getenv("COMPACT_MIN_TOMBSTONES", 32))
+# Version of the shard files on disk, replaced after every write so other processes can reload (see reload_if_changed)
+SNAPSHOT_FILE = "snapshot.json"
+SNAPSHOT_WRITE_TIMEOUT = 600  # a write marker older than this was left by a crashed writer
+# Read-only loads map the flat vector data of index.faiss instead of copying it, so reader processes share it
+MMAP_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+# Queries per search call from which FAISS scores with one BLAS matrix multiplication instead of a scan per
+# query (FAISS default: 20). Micro-batched searches carry a handful of queries; from ~8 (3072 dimensions) the
+# BLAS path breaks even and is 1.5-3x faster at 12-32, while smaller batches are faster on the scan.
+FAISS_BLAS_THRESHOLD = int(os.getenv("FAISS_BLAS_THRESHOLD", 8))
+faiss.cvar.distance_compute_blas_threshold = FAISS_BLAS_THRESHOLD
+
+
+def index_role() -> str:
+    """
+    INDEX_ROLE: standalone (one process reads and writes the stores) | writer (owns index mutation for a
+    group of readers) | reader (read-only API worker: memory-mapped stores, changes go to INDEX_WRITER_URL).
+    """
+    # Read at call time: main loads .ENV after the model modules are imported
+    return os.getenv("INDEX_ROLE", "standalone").lower()
+
+
+def shard_slug(value) -> str:
+    """Folder-safe shard key ("United States" -> "united-states")."""
+    slug = re.sub(r"[^a-z0-9]+", "-", str(value or "").lower())[:64].strip("-")
+    return slug or DEFAULT_SHARD
+
+
+def _make_direct_map(index):
+    """IVF lists can only be read back by id through a direct map; flat indexes need none."""
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+
+
+class IndexShard:
+    """
+    One FAISS store with its lexical index (and optional facet index), persisted in its own folder.
+
+    Deleting only drops the docstore entries and leaves the vectors in place as tombstones (their
+    index_to_docstore_id entry points at a missing document), so positions never shift and a delete does not
+    rewrite the whole index. Searches skip tombstones; compact() rebuilds the index from the live vectors.
+
+    A read-only shard memory-maps its vectors and refuses every mutation (FAISS aborts the process when a
+    mapped index is written to).
+    """
+
+    def __init__(self, key: str, path: str, embedding, with_facets: bool = False, read_only: bool = False):
+        self.logger = logging.getLogger("IndexShard")
+        self.key = key
+        self.path = path
+        self.embedding = embedding
+        self.with_facets = with_facets
+        self.read_only = read_only
+        self.lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if os.path.isfile(os.path.join(self.path, "index.faiss")) and self.read_only:
+            self.logger.info(f"Mapping shard '{self.key}' from {self.path} (read-only)")
+            index = faiss.read_index(os.path.join(self.path, "index.faiss"), MMAP_FLAGS)
+            with open(os.path.join(self.path, "index.pkl"), "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            vector_store = FAISS(self.embedding, index, docstore, index_to_docstore_id)
+        elif os.path.isfile(os.path.join(self.path, "index.faiss")):
+            self.logger.info(f"Loading shard '{self.key}' from {self.path}")
+            vector_store = FAISS.load_local(
+                folder_path=self.path, embeddings=self.embedding, allow_dangerous_deserialization=True
+            )
+        else:
+            self.logger.info(f"Creating new shard '{self.key}' at {self.path}")
+            vector_store = FAISS(
+                embedding_function=self.embedding,
+                index=faiss.IndexFlatL2(self.dimension),
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={},
+            )
+        lexical_index = self._load_lexical_index(vector_store)
+        facets = FacetIndex.from_vector_store(vector_store) if self.with_facets else None
+        tombstones = self._find_tombstones(vector_store)
+        # Swap them all together so readers never see a mix of old and new state
+        self.vector_store, self.lexical_index, self.facets, self.tombstones = vector_store, lexical_index, facets, tombstones
+
+    @staticmethod
+    def _find_tombstones(vector_store) -> set:
+        """Positions whose document was deleted, or that were superseded by a later vector of the same id."""
+        live = {}
+        for position, doc_id in sorted(vector_store.index_to_docstore_id.items()):
+            if doc_id in vector_store.docstore._dict:
+                live[doc_id] = position
+        live_positions = set(live.values())
+        return {position for position in vector_store.index_to_docstore_id if position not in live_positions}
+
+    def _load_lexical_index(self, vector_store) -> LexicalIndex:
+        try:
+            index = LexicalIndex.load(self.path)
+            if len(index) == len(vector_store.docstore._dict):
+                return index
+            self.logger.info(f"Lexical index of shard '{self.key}' out of sync, rebuilding")
+        except FileNotFoundError:
+            pass
+        return LexicalIndex.from_docstore(vector_store.docstore._dict)
+
+    @property
+    def dimension(self) -> int:
+        return embedding_dimension(self.embedding)
+
+    def __len__(self) -> int:
+        """Live documents; tombstoned positions are not counted."""
+        return len(self.vector_store.index_to_docstore_id) - len(self.tombstones)
+
+    @property
+    def tombstone_ratio(self) -> float:
+        total = len(self.vector_store.index_to_docstore_id)
+        return len(self.tombstones) / total if total else 0.0
+
+    def needs_compaction(self, ratio: float = COMPACT_TOMBSTONE_RATIO, min_tombstones: int = COMPACT_MIN_TOMBSTONES) -> bool:
+        return len(self.tombstones) >= min_tombstones and self.tombstone_ratio >= ratio
+
+    def live_positions(self) -> List[Tuple[int, str]]:
+        """(position, docstore id) of every live vector, in index order."""
+        return [
+            (position, doc_id) for position, doc_id in sorted(self.vector_store.index_to_docstore_id.items())
+            if position not in self.tombstones
+        ]
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.vector_store.docstore._dict
+
+    def documents(self) -> List[Tuple[str, Document]]:
+        return list(self.vector_store.docstore._dict.items())
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        doc = self.vector_store.docstore.search(doc_id)
+        return doc if isinstance(doc, Document) else None
+
+    def record_ids(self, id_field: str) -> Dict[str, str]:
+        """{record id (metadata[id_field], else the docstore id): docstore id} of the live documents; no vectors read."""
+        return {(doc.metadata.get(id_field) or doc_id): doc_id for doc_id, doc in self.documents()}
+
+    def vectors(self, doc_ids: List[str]) -> np.ndarray:
+        """Stored vectors of the given live documents, read back by position instead of copying the whole index."""
+        index = self.vector_store.index
+        positions = {doc_id: position for position, doc_id in self.live_positions()}
+        wanted = np.array([positions[doc_id] for doc_id in doc_ids], dtype=np.int64)
+        if not len(wanted):
+            return np.empty((0, index.d), dtype=np.float32)
+        _make_direct_map(index)
+        return index.reconstruct_batch(wanted)
+
+    def range_search(self, vectors: np.ndarray, min_relevance: float) -> List[List[Tuple[str, float]]]:
+        """Per query vector, every live document with relevance >= min_relevance as (docstore id, relevance)."""
+        with self.lock:
+            return self._range_search(vectors, min_relevance)
+
+    def _range_search(self, vectors: np.ndarray, min_relevance: float) -> List[List[Tuple[str, float]]]:
+        index = self.vector_store.index
+        if not index.ntotal or not len(vectors):
+            return [[] for _ in range(len(vectors))]
+        relevance_fn = self.vector_store._select_relevance_score_fn()
+        # Relevance of the L2 stores is 1 - d / sqrt(2) for the squared distance d that FAISS reports
+        radius = (1.0 - min_relevance) * math.sqrt(2.0)
+        lims, distances, positions = index.range_search(np.asarray(vectors, dtype=np.float32), radius)
+        index_to_id = self.vector_store.index_to_docstore_id
+        results = []
+        for q in range(len(vectors)):
+            hits = []
+            for distance, position in zip(distances[lims[q]:lims[q + 1]], positions[lims[q]:lims[q + 1]]):
+                doc_id = index_to_id.get(int(position))
+                relevance = relevance_fn(float(distance))
+                if position not in self.tombstones and doc_id in self and relevance >= min_relevance:
+                    hits.append((doc_id, relevance))
+            results.append(hits)
+        return results
+
+    def _require_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Shard '{self.key}' is read-only (INDEX_ROLE=reader); send changes to the index writer")
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        self._require_writable()
+        with self.lock:
+            ids = self.vector_store.add_documents(documents)
+            for doc_id, doc in zip(ids, documents):
+                self.lexical_index.add(doc_id, doc.page_content)
+            self._refresh_facets()
+            return ids
+
+    def delete(self, ids: List[str]):
+        """Drop the documents and tombstone their vectors (see compact())."""
+        self._require_writable()
+        with self.lock:
+            wanted = set(ids)
+            positions = {
+                position for position, doc_id in self.vector_store.index_to_docstore_id.items()
+                if doc_id in wanted and position not in self.tombstones
+            }
+            self.vector_store.docstore.delete(list(wanted))
+            self.tombstones |= positions
+            self.lexical_index.remove(ids)
+            self._refresh_facets()
+
+    def compact(self) -> dict:
+        """
+        Rebuild the index with only the live vectors (no embedding calls): tombstones are dropped, positions
+        renumbered, and ANN indexes (IVF) re-trained on the live data. Documents that lost their vector are
+        re-embedded. Not persisted until save().
+        """
+        self._require_writable()
+        with self.lock:
+            vector_store = self.vector_store
+            old_index = vector_store.index
+            live = [(position, doc_id) for position, doc_id in self.live_positions() if position < old_index.ntotal]
+            vectors = self._all_vectors(old_index)[[position for position, _ in live]]
+            index = self._empty_index_like(old_index, vectors)
+            if len(vectors):
+                index.add(vectors)
+            index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(live)}
+            orphans = sorted(set(vector_store.docstore._dict) - set(index_to_docstore_id.values()))
+            stats = {"shard": self.key, "before": old_index.ntotal, "tombstones": len(self.tombstones),
+                     "orphans": len(orphans)}
+
+            vector_store.index, vector_store.index_to_docstore_id = index, index_to_docstore_id
+            self.tombstones = set()
+            if orphans:
+                # A docstore entry without a vector can only be made searchable again by embedding it
+                docs = [vector_store.docstore._dict.pop(doc_id) for doc_id in orphans]
+                vector_store.add_documents(docs, ids=orphans)
+            self.lexical_index = LexicalIndex.from_docstore(vector_store.docstore._dict)
+            self._refresh_facets()
+            stats["after"] = index.ntotal
+            self.logger.info(f"Compacted shard '{self.key}': {stats}")
+            return stats
+
+    @staticmethod
+    def _all_vectors(index) -> np.ndarray:
+        if not index.ntotal:
+            return np.empty((0, index.d), dtype=np.float32)
+        _make_direct_map(index)
+        return index.reconstruct_n(0, index.ntotal)
+
+    @staticmethod
+    def _empty_index_like(index, vectors: np.ndarray):
+        """An empty index of the same kind; IVF coarse quantizers are re-trained on the live vectors."""
+        if isinstance(index, faiss.IndexFlat):
+            return faiss.IndexFlat(index.d, index.metric_type)
+        empty = faiss.clone_index(index)
+        empty.reset()
+        try:
+            ivf = faiss.extract_index_ivf(empty)
+        except RuntimeError:
+            return empty
+        if len(vectors) >= ivf.nlist:
+            ivf.quantizer.reset()
+            ivf.is_trained = empty.is_trained = False
+            empty.train(vectors)
+        return empty
+
+    def verify(self) -> List[str]:
+        """Inconsistencies between the FAISS index, index_to_docstore_id, the docstore and the lexical index."""
+        with self.lock:
+            vector_store = self.vector_store
+            index_to_id = vector_store.index_to_docstore_id
+            problems = []
+            if len(index_to_id) != vector_store.index.ntotal:
+                problems.append(f"{vector_store.index.ntotal} vectors but {len(index_to_id)} index_to_docstore_id entries")
+            if set(index_to_id) != set(range(len(index_to_id))):
+                problems.append("index_to_docstore_id positions are not contiguous")
+            live_ids = [doc_id for _, doc_id in self.live_positions()]
+            if len(live_ids) != len(set(live_ids)):
+                problems.append(f"{len(live_ids) - len(set(live_ids))} documents have several live vectors")
+            orphans = set(vector_store.docstore._dict) - set(live_ids)
+            if orphans:
+                problems.append(f"{len(orphans)} documents have no vector")
+            lexical = set(self.lexical_index.doc_lengths)
+            if lexical != set(vector_store.docstore._dict):
+                problems.append(
+                    f"lexical index differs from the docstore ({len(lexical - set(vector_store.docstore._dict))} stale, "
+                    f"{len(set(vector_store.docstore._dict) - lexical)} missing)"
+                )
+            return problems
+
+    def _refresh_facets(self):
+        if self.with_facets:
+            self.facets = FacetIndex.from_vector_store(self.vector_store)
+
+    def save(self):
+        """
+        Write the shard next to the current files and move them into place: processes that mapped the old
+        index.faiss keep reading the old file instead of seeing it truncated under them.
+        """
+        self._require_writable()
+        with self.lock:
+            staging = os.path.join(self.path, ".saving")
+            self.vector_store.save_local(staging)
+            for name in ("index.faiss", "index.pkl"):
+                os.replace(os.path.join(staging, name), os.path.join(self.path, name))
+            self.lexical_index.save(self.path)
+
+    def reload(self):
+        """Re-read the shard from disk (e.g. after it was rebuilt by another process)."""
+        with self.lock:
+            self._load()
+
+    def reembed(self, batch_size: int = 256):
+        """Re-embed every document with the current embedding client into a fresh flat index and persist it."""
+        self._require_writable()
+        with self.lock:
+            items = self.documents()
+            vector_store = FAISS(
+                embedding_function=self.embedding,
+                index=faiss.IndexFlatL2(self.dimension),
+                docstore=InMemoryDocstore(),
+                index_to_docstore_id={},
+            )
+            for i in range(0, len(items), batch_size):
+                chunk = items[i:i + batch_size]
+                vector_store.add_documents([doc for _, doc in chunk], ids=[doc_id for doc_id, _ in chunk])
+            # Docstore ids are kept, so the lexical index stays valid; facets are keyed by position
+            self.vector_store, self.tombstones = vector_store, set()
+            self._refresh_facets()
+            self.save()
+
+    def rebuild(self):
+        """Rebuild the lexical and facet indexes from the docstore and persist them."""
+        self._require_writable()
+        with self.lock:
+            self.lexical_index = LexicalIndex.from_docstore(self.vector_store.docstore._dict)
+            self._refresh_facets()
+            self.save()
+
+    def positions(self, **filters) -> Optional[np.ndarray]:
+        return self.facets.select(**filters) if self.facets is not None and filters else None
+
+    def search(self, embedding, k: int, score_threshold=None, filters: Optional[dict] = None) -> List[Tuple[str, float]]:
+        return self.search_batch([embedding], k, [score_threshold], filters)[0]
+
+    def search_batch(self, embeddings, k: int, score_thresholds, filters: Optional[dict] = None) -> List[List[Tuple[str, float]]]:
+        """search() for several embeddings sharing k and filters, in one FAISS call."""
+        positions = self.positions(**(filters or {}))
+        if not self.tombstones:
+            return search_by_vectors(self.vector_store, embeddings, k, score_thresholds, positions)
+        # Facet positions never include tombstones; a full scan over-fetches by their count and skips them
+        fetch = k if positions is not None else k + len(self.tombstones)
+        results = search_by_vectors(self.vector_store, embeddings, fetch, score_thresholds, positions)
+        return [[hit for hit in hits if hit[0] in self][:k] for hits in results]
+
+    def lexical_search(self, query: str, k: int, filters: Optional[dict] = None) -> List[Tuple[str, float]]:
+        positions = self.positions(**(filters or {}))
+        allowed = None
+        if positions is not None:
+            allowed = {self.vector_store.index_to_docstore_id[int(p)] for p in positions}
+        return self.lexical_index.search(query, k, allowed)
+
+
+def _writes_snapshot(method):
+    """Mark the snapshot as being written while a ShardedStore method persists shards, and bump its version after."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._writing():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class ShardedStore:
+    """
+    A set of IndexShards under one root folder, e.g. law_index/shards/<jurisdiction>/.
+
+    New documents are routed by `shard_key(doc)`; searches fan out to every shard on a thread
+    pool (FAISS releases the GIL) and the per-shard top-k lists are merged. Each shard is saved,
+    reloaded and rebuilt on its own, so cost scales with shard size instead of the whole corpus.
+    A legacy store at the root folder is loaded as the DEFAULT_SHARD.
+
+    Dense searches of concurrent requests are micro-batched: queued queries with the same filters are searched
+    as one stacked matrix per shard and each caller gets its own top-k back.
+
+    Every write replaces SNAPSHOT_FILE with a new version; a process serving the store picks up versions
+    written by others (offline rebuilds, compactions) with reload_if_changed() without a restart.
+    With `read_only` (default: INDEX_ROLE=reader) shards are memory-mapped and every write raises.
+    """
+
+    def __init__(self, root: str, embedding, shard_key: Callable[[Document], str], with_facets: bool = False,
+                 max_workers: Optional[int] = None, read_only: Optional[bool] = None):
+        self.logger = logging.getLogger("ShardedStore")
+        self.root = root
+        self.embedding = embedding
+        self.shard_key = shard_key
+        self.with_facets = with_facets
+        self.read_only = index_role() == "reader" if read_only is None else read_only
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count(), thread_name_prefix="shard-search")
+        self._searches = MicroBatcher(f"faiss_search:{os.path.basename(os.path.normpath(root))}", self._search_batch)
+        self._write_depth = 0
+        self._write_depth_lock = threading.Lock()
+        self.snapshot_version = (self.read_snapshot() or {}).get("version")
+        self.shards: Dict[str, IndexShard] = self._read_shards()
+        self.logger.info(f"Loaded {len(self.shards)} shards from {self.root} ({len(self)} documents).")
+        self.embedding_mismatch = self._check_embedding()
+
+    def _shard_path(self, key: str) -> str:
+        return self.root if key == DEFAULT_SHARD else os.path.join(self.root, SHARDS_DIR, key)
+
+    def _read_shards(self) -> Dict[str, IndexShard]:
+        os.makedirs(self.root, exist_ok=True)
+        shards = {}
+        if os.path.isfile(os.path.join(self.root, "index.faiss")):
+            shards[DEFAULT_SHARD] = IndexShard(DEFAULT_SHARD, self.root, self.embedding, self.with_facets, self.read_only)
+        shards_dir = os.path.join(self.root, SHARDS_DIR)
+        if os.path.isdir(shards_dir):
+            for key in sorted(os.listdir(shards_dir)):
+                if os.path.isfile(os.path.join(shards_dir, key, "index.faiss")):
+                    shards[key] = IndexShard(key, self._shard_path(key), self.embedding, self.with_facets, self.read_only)
+        return shards
+
+    def read_snapshot(self) -> Optional[dict]:
+        """{"version", "writing", "time"} of the files on disk, None for stores written before versioning."""
+        try:
+            with open(os.path.join(self.root, SNAPSHOT_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_snapshot(self, writing: bool):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, SNAPSHOT_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": self.snapshot_version, "writing": writing, "time": time.time()}, f)
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def _writing(self):
+        """Readers in other processes skip the snapshot while it is marked as being written (nested writes mark once)."""
+        self._require_writable()
+        with self._write_depth_lock:
+            self._write_depth += 1
+            if self._write_depth == 1:
+                self._write_snapshot(writing=True)
+        try:
+            yield
+        finally:
+            with self._write_depth_lock:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self.snapshot_version = uuid.uuid4().hex
+                    self._write_snapshot(writing=False)
+
+    def snapshot_changed(self) -> bool:
+        """True when another process wrote a complete snapshot newer than the one loaded here."""
+        snapshot = self.read_snapshot()
+        if snapshot is None or snapshot.get("version") == self.snapshot_version:
+            return False
+        return not snapshot.get("writing") or time.time() - snapshot.get("time", 0) > SNAPSHOT_WRITE_TIMEOUT
+
+    def reload_if_changed(self) -> bool:
+        """
+        Load a newer snapshot next to the current one and swap it in. Searches already running keep the
+        shards they started with; new ones see the new shards. A snapshot rewritten while it was being read
+        is discarded (False), the next call retries. Callers must keep writes to this store out meanwhile.
+        """
+        if not self.snapshot_changed():
+            return False
+        before = self.read_snapshot()
+        shards = self._read_shards()
+        if self.read_snapshot() != before:
+            self.logger.info(f"Snapshot of {self.root} changed while loading, retrying later.")
+            return False
+        with self._lock:
+            self.shards = shards
+            self.snapshot_version = before.get("version")
+        self.embedding_mismatch = self._check_embedding()
+        self.logger.info(f"Reloaded {self.root} snapshot {self.snapshot_version}: {len(shards)} shards, {len(self)} documents.")
+        return True
+
+    def _embedding_spec(self) -> dict:
+        return {"provider": embedding_provider(self.embedding), "dimension": embedding_dimension(self.embedding)}
+
+    def _check_embedding(self) -> Optional[str]:
+        """
+        Why the stored vectors cannot be searched with the configured embedding client, None when they can.
+        Stores from before the marker existed are only checked by dimension.
+        """
+        expected = self._embedding_spec()
+        try:
+            with open(os.path.join(self.root, EMBEDDING_MARKER), encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            dims = {shard.vector_store.index.d for shard in self.shards.values() if len(shard)}
+            if dims <= {expected["dimension"]}:
+                return None
+            stored = {"provider": "unmarked", "dimension": ", ".join(str(d) for d in sorted(dims))}
+        if stored == expected:
+            return None
+        reason = (f"{self.root} holds {stored['provider']} vectors ({stored['dimension']} dimensions), the configured "
+                  f"embedding is {expected['provider']} ({expected['dimension']}); "
+                  f"re-embed it with `python manage_index.py <store> reembed` or switch EMBEDDING_PROVIDER back")
+        self.logger.error(reason)
+        return reason
+
+    def _require_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"{self.root} is read-only (INDEX_ROLE=reader); send changes to the index writer")
+
+    def _require_compatible_embedding(self):
+        if self.embedding_mismatch:
+            raise ValueError(self.embedding_mismatch)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in list(self.shards.values()))
+
+    def shard(self, key: str) -> IndexShard:
+        with self._lock:
+            if key not in self.shards:
+                self.shards[key] = IndexShard(key, self._shard_path(key), self.embedding, self.with_facets, self.read_only)
+            return self.shards[key]
+
+    def documents(self) -> Iterable[Tuple[str, Document]]:
+        for shard in list(self.shards.values()):
+            yield from shard.documents()
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        for shard in list(self.shards.values()):
+            doc = shard.get(doc_id)
+            if doc is not None:
+                return doc
+        return None
+
+    def find_ids(self, id_field: str, record_ids: Iterable[str]) -> Dict[str, str]:
+        """{record id: docstore id} of the documents whose metadata[id_field] is one of record_ids."""
+        wanted = set(record_ids)
+        return {doc.metadata[id_field]: doc_id for doc_id, doc in self.documents() if doc.metadata.get(id_field) in wanted}
+
+    def record_ids(self, id_field: str) -> Dict[str, Tuple[str, str]]:
+        """{record id: (shard key, docstore id)} of every live document, from the docstores only."""
+        return {
+            record_id: (key, doc_id)
+            for key, shard in list(self.shards.items()) for record_id, doc_id in shard.record_ids(id_field).items()
+        }
+
+    def record_vectors(self, id_field: str, record_ids: Iterable[str]) -> Tuple[List[str], np.ndarray]:
+        """(record ids, stacked vectors) of the given records (unknown ids are skipped); only their vectors are read."""
+        located = self.record_ids(id_field)
+        grouped: Dict[str, List[Tuple[str, str]]] = {}
+        for record_id in record_ids:
+            if record_id in located:
+                key, doc_id = located[record_id]
+                grouped.setdefault(key, []).append((record_id, doc_id))
+        ids, blocks = [], []
+        for key, entries in grouped.items():
+            shard = self.shards[key]
+            with shard.lock:
+                entries = [(record_id, doc_id) for record_id, doc_id in entries if doc_id in shard]  # deleted meanwhile
+                blocks.append(shard.vectors([doc_id for _, doc_id in entries]))
+            ids += [record_id for record_id, _ in entries]
+        return ids, (np.vstack(blocks) if blocks else np.empty((0, 0), dtype=np.float32))
+
+    def range_search(self, vectors: np.ndarray, min_relevance: float, id_field: str) -> List[List[Tuple[str, float]]]:
+        """Per query vector, every document of every shard with relevance >= min_relevance as (record id, relevance)."""
+        shards = [shard for shard in list(self.shards.values()) if len(shard)]
+        results: List[List[Tuple[str, float]]] = [[] for _ in range(len(vectors))]
+        for shard, shard_hits in zip(shards, self._executor.map(lambda shard: shard.range_search(vectors, min_relevance), shards)):
+            for row, hits in zip(results, shard_hits):
+                for doc_id, relevance in hits:
+                    doc = shard.get(doc_id)
+                    row.append(((doc.metadata.get(id_field) if doc else None) or doc_id, relevance))
+        return results
+
+    def add_documents(self, documents: List[Document]) -> Dict[str, List[str]]:
+        """Route documents to their shards; returns {shard key: new docstore ids}."""
+        self._require_compatible_embedding()
+        self._require_writable()
+        grouped: Dict[str, List[Document]] = {}
+        for doc in documents:
+            grouped.setdefault(self.shard_key(doc), []).append(doc)
+        return {key: self.shard(key).add_documents(docs) for key, docs in grouped.items()}
+
+    def delete(self, ids: List[str]) -> List[str]:
+        """Delete documents from whichever shards hold them; returns the touched shard keys."""
+        touched = []
+        for key, shard in list(self.shards.items()):
+            owned = [doc_id for doc_id in ids if doc_id in shard]
+            if owned:
+                shard.delete(owned)
+                touched.append(key)
+        return touched
+
+    @_writes_snapshot
+    def save(self, keys: Optional[Iterable[str]] = None):
+        """Persist shards; those whose tombstone ratio crossed COMPACT_TOMBSTONE_RATIO are compacted first."""
+        keys = list(self.shards if keys is None else keys)
+        with stage("vector_store_save", items=sum(len(self.shards[key]) for key in keys)):
+            for key in keys:
+                if self.shards[key].needs_compaction():
+                    with stage("vector_store_compact"):
+                        self.shards[key].compact()
+                self.shards[key].save()
+            if not self.embedding_mismatch:
+                self._write_embedding_marker()
+
+    def _write_embedding_marker(self):
+        with open(os.path.join(self.root, EMBEDDING_MARKER), "w", encoding="utf-8") as f:
+            json.dump(self._embedding_spec(), f)
+
+    @_writes_snapshot
+    def reembed(self) -> Dict[str, int]:
+        """Re-embed every shard with the configured embedding client (after switching EMBEDDING_PROVIDER)."""
+        counts = {}
+        for key, shard in sorted(self.shards.items()):
+            shard.reembed()
+            counts[key] = len(shard)
+        self._write_embedding_marker()
+        self.embedding_mismatch = None
+        self.logger.info(f"Re-embedded {sum(counts.values())} documents of {self.root} with {embedding_provider(self.embedding)}.")
+        return counts
+
+    @_writes_snapshot
+    def compact(self, keys: Optional[Iterable[str]] = None) -> List[dict]:
+        """Compact and persist shards (all by default), whatever their tombstone ratio."""
+        keys = sorted(self.shards if keys is None else keys)
+        results = []
+        for key in keys:
+            with stage("vector_store_compact"):
+                results.append(self.shards[key].compact())
+            self.shards[key].save()
+        return results
+
+    def verify(self) -> Dict[str, List[str]]:
+        """{shard key: problems} for every inconsistent shard; empty when the store is consistent."""
+        problems = {key: shard.verify() for key, shard in sorted(self.shards.items())}
+        return {key: found for key, found in problems.items() if found}
+
+    def reload_shard(self, key: str):
+        self.shard(key).reload()
+
+    @_writes_snapshot
+    def rebuild_shard(self, key: str):
+        self.shard(key).rebuild()
+
+    def _fan_out(self, fn: Callable[[IndexShard], List[Tuple[str, float]]], k: int) -> List[Tuple[str, float]]:
+        shards = [shard for shard in list(self.shards.values()) if len(shard)]
+        if len(shards) == 1:
+            merged = fn(shards[0])
+        else:
+            merged = [hit for hits in self._executor.map(fn, shards) for hit in hits]
+        return sorted(merged, key=lambda hit: hit[1], reverse=True)[:k]
+
+    def search(self, embedding, k: int, score_threshold=None, filters: Optional[dict] = None) -> List[Tuple[str, float]]:
+        """Merged top-k (docstore_id, relevance) over all shards."""
+        self._require_compatible_embedding()
+        with stage("faiss_search"):
+            return self._searches.submit((embedding, k, score_threshold, filters))
+
+    def _search_batch(self, queries: List[tuple]) -> List[List[Tuple[str, float]]]:
+        """
+        Micro-batch of (embedding, k, score_threshold, filters): queries with the same filters are searched
+        together at their largest k, then every result list is cut to its own k.
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, (_, _, _, filters) in enumerate(queries):
+            groups.setdefault(json.dumps(filters or {}, sort_keys=True, default=str), []).append(i)
+        results: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        shards = [shard for shard in list(self.shards.values()) if len(shard)]
+        for members in groups.values():
+            embeddings = [queries[i][0] for i in members]
+            thresholds = [queries[i][2] for i in members]
+            k = max(queries[i][1] for i in members)
+            filters = queries[members[0]][3]
+
+            def search_shard(shard: IndexShard) -> List[List[Tuple[str, float]]]:
+                return shard.search_batch(embeddings, k, thresholds, filters)
+
+            per_shard = [search_shard(shards[0])] if len(shards) == 1 else list(self._executor.map(search_shard, shards))
+            for row, i in enumerate(members):
+                merged = [hit for shard_hits in per_shard for hit in shard_hits[row]]
+                results[i] = sorted(merged, key=lambda hit: hit[1], reverse=True)[:queries[i][1]]
+        return results
+
+    def lexical_search(self, query: str, k: int, filters: Optional[dict] = None) -> List[Tuple[str, float]]:
+        """Merged top-k (docstore_id, BM25 score) over all shards."""
+        with stage("lexical_search"):
+            return self._fan_out(lambda shard: shard.lexical_search(query, k, filters), k)
+
+    @_writes_snapshot
+    def reshard(self) -> Dict[str, int]:
+        """
+        Move documents of the legacy DEFAULT_SHARD into their keyed shards.
+        Vectors are copied from the flat index, so no embedding calls are made.
+        """
+        legacy = self.shards.get(DEFAULT_SHARD)
+        if legacy is None or not len(legacy):
+            return {}
+        moved: Dict[str, int] = {}
+        with legacy.lock:
+            index_to_id = legacy.vector_store.index_to_docstore_id
+            vectors = legacy.vector_store.index.reconstruct_n(0, legacy.vector_store.index.ntotal)
+            grouped: Dict[str, List[int]] = {}
+            for position, doc_id in legacy.live_positions():
+                key = self.shard_key(legacy.get(doc_id))
+                if key != DEFAULT_SHARD:
+                    grouped.setdefault(key, []).append(position)
+            for key, positions in grouped.items():
+                shard = self.shard(key)
+                ids = [index_to_id[p] for p in positions]
+                docs = [legacy.get(doc_id) for doc_id in ids]
+                with shard.lock:
+                    shard.vector_store.add_embeddings(
+                        [(doc.page_content, vectors[p].tolist()) for doc, p in zip(docs, positions)],
+                        metadatas=[doc.metadata for doc in docs],
+                        ids=ids,
+                    )
+                    for doc_id, doc in zip(ids, docs):
+                        shard.lexical_index.add(doc_id, doc.page_content)
+                    shard._refresh_facets()
+                    shard.save()
+                legacy.delete(ids)
+                moved[key] = len(ids)
+            legacy.save()
+        self.logger.info(f"Resharded {sum(moved.values())} documents from {self.root}: {moved}")
+        return moved
@@ -0,0 +1,83 @@
+import gc
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from monitoring.Metrics import STORE_RELOADS
+
+# Seconds between checks for vector store snapshots written by other processes (0 disables polling)
+STORE_RELOAD_INTERVAL = float(os.getenv("STORE_RELOAD_INTERVAL", 15))
+
+
+class SnapshotWatcher:
+    """
+    Hot reload of the vector stores: polls the snapshot version of each model's store and swaps in
+    snapshots written by another process (`manage_index.py ... compact|reembed|reshard`, offline rebuilds)
+    on a background thread, so the service never restarts and requests are not blocked by the load.
+    """
+
+    def __init__(self, models: Dict[str, object], on_reload: Optional[Callable[[List[str]], None]] = None,
+                 interval: float = STORE_RELOAD_INTERVAL, on_poll: Optional[Callable[[], None]] = None):
+        self.logger = logging.getLogger("SnapshotWatcher")
+        self.models = models
+        self.on_reload = on_reload
+        self.on_poll = on_poll  # extra per-poll check, e.g. files another process writes next to the stores
+        self.interval = interval
+        self.last_reload: Dict[str, Optional[float]] = {name: None for name in models}
+        self._lock = threading.Lock()  # the poll thread and an explicit reload request never load concurrently
+
+    def check(self, name: Optional[str] = None) -> Dict[str, bool]:
+        """Reload the stores (or the named one) whose snapshot changed; returns {store: reloaded}."""
+        results = {}
+        with self._lock:
+            for store, model in self.models.items():
+                if name is not None and store != name:
+                    continue
+                try:
+                    results[store] = model.reload_store()
+                except Exception as e:
+                    self.logger.error(f"Failed to reload the {store} store, still serving the loaded one: {e}", exc_info=True)
+                    STORE_RELOADS.inc(store=store, outcome="failed")
+                    results[store] = False
+                    continue
+                if results[store]:
+                    STORE_RELOADS.inc(store=store, outcome="reloaded")
+                    self.last_reload[store] = time.time()
+        reloaded = [store for store, done in results.items() if done]
+        if reloaded:
+            # The replaced shards are freed by reference counting; freezing the new ones keeps them out of
+            # full GC passes, which otherwise scan the whole heap and stall searches for 100+ ms
+            gc.freeze()
+        if reloaded and self.on_reload is not None:
+            self.on_reload(reloaded)
+        return results
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        thread = threading.Thread(target=self._run, name="snapshot-watcher", daemon=True)
+        thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+            if self.on_poll is not None:
+                try:
+                    self.on_poll()
+                except Exception as e:
+                    self.logger.warning(f"Poll hook failed: {e}")
+
+    def status(self) -> dict:
+        stores = {}
+        for name, model in self.models.items():
+            stores[name] = {
+                "loaded_version": model.store.snapshot_version,
+                "disk": model.store.read_snapshot(),
+                "documents": len(model.store),
+                "shards": len(model.store.shards),
+                "last_reload": self.last_reload[name],
+            }
+        return {"interval": self.interval, "stores": stores}
@@ -0,0 +1,83 @@
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from monitoring.Metrics import LLM_CALLS, PAIRS
+
+# Relevance is on the same scale as the retrieval SCORE_THRESHOLD, lexical evidence is a BM25 score
+CLEAR_NO_THRESHOLD = float(os.getenv("TRIAGE_CLEAR_NO_THRESHOLD", 0.65))
+CLEAR_CANDIDATE_THRESHOLD = float(os.getenv("TRIAGE_CLEAR_CANDIDATE_THRESHOLD", 0.8))
+LEXICAL_EVIDENCE_THRESHOLD = float(os.getenv("TRIAGE_LEXICAL_EVIDENCE_THRESHOLD", 4.0))
+
+CLEAR_NO = "clear_no"
+CANDIDATE = "candidate"
+AMBIGUOUS = "ambiguous"
+
+# (document, dense relevance or None, BM25 score or None)
+ScoredDoc = Tuple[Document, Optional[float], Optional[float]]
+
+
+class Triage:
+    """
+    Score-based triage of retrieved (record, document) pairs before the LLM conflict analysis.
+
+    clear_no:  weak similarity and no lexical evidence -> dropped, never sent to the LLM
+    candidate: strong similarity                      -> sent
+    ambiguous: everything in between                  -> sent
+    Counters accumulate over the process lifetime; an upload whose pairs are all clear_no costs no LLM call.
+    """
+
+    def __init__(self, clear_no: float = CLEAR_NO_THRESHOLD, clear_candidate: float = CLEAR_CANDIDATE_THRESHOLD,
+                 lexical_evidence: float = LEXICAL_EVIDENCE_THRESHOLD):
+        self.logger = logging.getLogger("Triage")
+        self.clear_no = clear_no
+        self.clear_candidate = clear_candidate
+        self.lexical_evidence = lexical_evidence
+        self._lock = threading.Lock()
+        self.counters = {CLEAR_NO: 0, CANDIDATE: 0, AMBIGUOUS: 0, "llm_calls_avoided": 0}
+
+    def classify(self, dense: Optional[float], lexical: Optional[float]) -> str:
+        if dense is not None and dense >= self.clear_candidate:
+            return CANDIDATE
+        has_lexical_evidence = lexical is not None and lexical >= self.lexical_evidence
+        if (dense is None or dense < self.clear_no) and not has_lexical_evidence:
+            return CLEAR_NO
+        return AMBIGUOUS
+
+    def filter(self, retrieved: Dict[str, List[ScoredDoc]]) -> Tuple[Dict[str, List[Document]], dict]:
+        """Drop clear_no pairs; returns ({record id: [documents to analyze]}, per-class counts of this call)."""
+        kept: Dict[str, List[Document]] = {}
+        counts = {CLEAR_NO: 0, CANDIDATE: 0, AMBIGUOUS: 0}
+        for record_id, scored in retrieved.items():
+            for doc, dense, lexical in scored:
+                verdict = self.classify(dense, lexical)
+                counts[verdict] += 1
+                if verdict != CLEAR_NO:
+                    kept.setdefault(record_id, []).append(doc)
+        call_avoided = counts[CLEAR_NO] > 0 and not kept
+        with self._lock:
+            for verdict, count in counts.items():
+                self.counters[verdict] += count
+            self.counters["llm_calls_avoided"] += int(call_avoided)
+        for verdict, count in counts.items():
+            PAIRS.inc(count, outcome=verdict)
+        if call_avoided:
+            LLM_CALLS.inc(outcome="avoided_triage")
+        self.logger.info(f"Triage: {counts}{' (LLM call avoided)' if call_avoided else ''}")
+        return kept, counts
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "pairs_avoided": counters[CLEAR_NO],
+            "thresholds": {
+                "clear_no": self.clear_no,
+                "clear_candidate": self.clear_candidate,
+                "lexical_evidence": self.lexical_evidence,
+            },
+        }
@@ -0,0 +1,155 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from monitoring.Metrics import LLM_CALLS, PAIRS
+
+VERDICT_CACHE_PATH = "verdict_cache.sqlite3"
+
+# (feature content hash, provision content hash, prompt version)
+PairKey = Tuple[str, str, str]
+
+
+class VerdictCache:
+    """
+    LLM conflict verdicts per (feature, provision) pair, stored in SQLite.
+
+    Keys are content hashes plus the prompt version, so a pair is only re-judged when one
+    of the two texts or the prompt/schema changes. Non-violations are cached too.
+    """
+
+    def __init__(self, path: str = VERDICT_CACHE_PATH):
+        self.logger = logging.getLogger("VerdictCache")
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS verdicts (
+                feature_hash TEXT NOT NULL,
+                provision_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                violated INTEGER NOT NULL,
+                item TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (feature_hash, provision_hash, prompt_version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[PairKey]) -> Dict[PairKey, Optional[dict]]:
+        """Cached verdicts: key -> violation item (None for "no violation"). Missing keys are not returned."""
+        found = {}
+        with self._lock:
+            for key in set(keys):
+                row = self._conn.execute(
+                    "SELECT violated, item FROM verdicts WHERE feature_hash = ? AND provision_hash = ? AND prompt_version = ?",
+                    key,
+                ).fetchone()
+                if row is not None:
+                    found[key] = json.loads(row[1]) if row[0] else None
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, verdicts: Dict[PairKey, Optional[dict]]):
+        now = time.time()
+        rows = [
+            (*key, int(item is not None), json.dumps(item) if item is not None else None, now)
+            for key, item in verdicts.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        return {"entries": size, "hits": self.hits, "misses": self.misses}
+
+
+def analyze_pairs(prompt_fn: Callable, build_prompt: Callable, cache: VerdictCache, prompt_version: str,
+                  inputs: List[dict], retrieved: Dict[str, List], input_id: str, doc_id: str,
+                  result_key: str, result_id: str, violated_by: str, inputs_are_features: bool) -> Tuple[dict, dict]:
+    """
+    Conflict analysis of uploaded records against their retrieved documents, one LLM call for the uncached pairs only.
+
+    `retrieved` maps an input record id to the documents retrieved for it; each (record, document) is a pair.
+    Cached pairs are answered from `cache`; the rest go to a single `prompt_fn(build_prompt(records), docs)` call,
+    whose items name the violating inputs in `violated_by`. New verdicts are cached and merged with the cached ones.
+    Returns ({result_key: [items]}, stats); stats["unanswered"] counts the pending pairs left without a verdict
+    because the LLM call failed or its answer was unusable.
+    """
+    records = {record[input_id]: record for record in inputs}
+    pairs: Dict[Tuple[str, str], Optional[PairKey]] = {}
+    docs_by_id = {}
+    for record_id, docs in retrieved.items():
+        for doc in docs:
+            target_id = doc.metadata.get(doc_id)
+            docs_by_id.setdefault(target_id, doc)
+            input_hash, doc_hash = records[record_id].get("content_hash"), doc.metadata.get("content_hash")
+            key = None
+            if input_hash and doc_hash:
+                key = (input_hash, doc_hash, prompt_version) if inputs_are_features else (doc_hash, input_hash, prompt_version)
+            pairs[(record_id, target_id)] = key
+
+    unanswered = 0
+    cached = cache.get_many([key for key in pairs.values() if key is not None])
+    verdicts = {pair: cached[key] for pair, key in pairs.items() if key in cached}
+    pending = [pair for pair in pairs if pair not in verdicts]
+
+    if pending:
+        ask_ids = [record_id for record_id in records if any(pair[0] == record_id for pair in pending)]
+        ask_docs = list({target_id: docs_by_id[target_id] for _, target_id in pending}.values())
+        response = prompt_fn(build_prompt([records[record_id] for record_id in ask_ids]), ask_docs)
+        answered = _parse_items(response, result_key, result_id, violated_by, ask_ids)
+        if answered is not None:
+            fresh = {pair: answered.get(pair) for pair in pending}
+            verdicts.update(fresh)
+            cache.put_many({pairs[pair]: item for pair, item in fresh.items() if pairs[pair] is not None})
+        else:
+            # The call failed (quota, timeout, error response) or its answer was unusable
+            unanswered = len(pending)
+
+    merged: Dict[str, dict] = {}
+    for (record_id, target_id), item in verdicts.items():
+        if item is None:
+            continue
+        entry = merged.setdefault(target_id, {**item, violated_by: [], "reasoning": ""})
+        if record_id not in entry[violated_by]:
+            entry[violated_by].append(record_id)
+        if item.get("reasoning") and item["reasoning"] not in entry["reasoning"]:
+            entry["reasoning"] = f'{entry["reasoning"]}\n{item["reasoning"]}'.strip()
+    stats = {"pairs": len(pairs), "cached": len(pairs) - len(pending), "asked": len(pending), "unanswered": unanswered}
+    PAIRS.inc(stats["cached"], outcome="cached")
+    PAIRS.inc(stats["asked"], outcome="asked")
+    if pairs and not pending:
+        LLM_CALLS.inc(outcome="avoided_cache")
+    return {result_key: list(merged.values())}, stats
+
+
+def _parse_items(response, result_key: str, result_id: str, violated_by: str,
+                 asked_ids: List[str]) -> Optional[Dict[Tuple[str, str], dict]]:
+    """LLM answer -> {(input id, document id): item}; None when the answer is unusable (nothing gets cached)."""
+    if response is None:
+        return None
+    try:
+        data = json.loads(response) if isinstance(response, str) else response
+    except json.JSONDecodeError:
+        logging.getLogger("VerdictCache").warning("Unparsable LLM answer, verdicts not cached.")
+        return None
+    answered = {}
+    for item in (data or {}).get(result_key, []):
+        # A verdict naming no violators is dropped; only a call about a single input may omit the list
+        violators = item.get(violated_by)
+        if violators is None and len(asked_ids) == 1:
+            violators = asked_ids
+        for record_id in violators or []:
+            answered[(str(record_id), str(item.get(result_id)))] = item
+    return answered
@@ -1,19 +1,206 @@
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 import json
+import hashlib
+import functools
+from contextlib import nullcontext
+import numpy as np
+import faiss
+
+from model.MicroBatcher import MicroBatcher
+from model.Scheduler import current_priority, PRIORITY_CLASSES, provider_scheduler
+from monitoring.Ledger import record_usage
+from monitoring.Metrics import stage
+
+# Fields that make up the content of a record; generated ids and file paths are excluded
+# so that re-parsing the same text yields the same hash.
+LAW_HASH_FIELDS = ["provision_title", "provision_body", "provision_code", "country", "region", "relevant_labels", "law_code"]
+FEATURE_HASH_FIELDS = ["feature_title", "feature_description", "feature_type", "project_name"]
+# Gemini task type of search queries; embed_documents would otherwise embed them as RETRIEVAL_DOCUMENT
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (~4 characters per token) for APIs that do not report usage."""
+    return max(1, len(text) // 4)
+
+
+class InstrumentedEmbeddings(Embeddings):
+    """
+    Wraps an embedding client so every call is timed as the "embedding" stage.
+    The Gemini embedding API reports no usage, so its tokens are recorded as an estimate; local providers cost none.
+    Queries of concurrent requests are micro-batched into one call (one round trip, still embedded with the query
+    task type); the stage and usage are still recorded on each caller's thread, so ledgers and traces stay per
+    request. Remote calls are scheduled by priority class, and queries are batched per class, so a background
+    batch waiting for its share of the provider never holds up interactive queries.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.provider = getattr(inner, "provider", None)
+        self.dimension = getattr(inner, "dimension", None)
+        self.local = getattr(inner, "local", False)
+        self._queries = {
+            cls: MicroBatcher(f"embed_query_{cls}", functools.partial(self._embed_queries, cls)) for cls in PRIORITY_CLASSES
+        }
+
+    def _provider_slot(self, cls=None):
+        return nullcontext() if self.local else provider_scheduler("embedding").slot(cls)
+
+    def _embed_queries(self, cls, texts):
+        with self._provider_slot(cls):
+            if len(texts) == 1:
+                return [self.inner.embed_query(texts[0])]
+            if self.local:
+                return self.inner.embed_documents(texts)  # local providers embed queries and documents alike
+            return self.inner.embed_documents(texts, task_type=QUERY_TASK_TYPE)
+
+    def embed_documents(self, texts):
+        with stage("embedding", items=len(texts)), self._provider_slot():
+            vectors = self.inner.embed_documents(texts)
+        if not self.local:
+            record_usage("embedding", estimated=True, embedding_tokens=sum(estimate_tokens(text) for text in texts))
+        return vectors
+
+    def embed_query(self, text):
+        with stage("embedding", items=1):
+            vector = self._queries[current_priority()].submit(text)
+        if not self.local:
+            record_usage("embedding", estimated=True, embedding_tokens=estimate_tokens(text))
+        return vector
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Records the token usage reported on chat model responses under `stage`."""
+
+    def __init__(self, stage_name: str):
+        self.stage_name = stage_name
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                if usage:
+                    # output_tokens includes the reasoning breakdown; keep the two apart like the parsers do
+                    thinking = (usage.get("output_token_details") or {}).get("reasoning", 0)
+                    record_usage(
+                        self.stage_name,
+                        prompt_tokens=usage.get("input_tokens", 0),
+                        output_tokens=max(0, usage.get("output_tokens", 0) - thinking),
+                        thinking_tokens=thinking,
+                    )
+
+
+def content_hash(record, fields, salt=""):
+    """SHA-256 over the given content fields of a record (plus an optional salt)."""
+    payload = json.dumps({field: record.get(field) for field in fields}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256((salt + payload).encode("utf-8")).hexdigest()
+
+
+def diff_records(records, stored, id_field):
+    """
+    Diff freshly parsed records against the stored version of the same document.
+
+    `stored` maps content_hash -> list of (docstore_id, record_id) already in the vector store.
+    Unchanged records take over the stored record id so nothing downstream has to be rewritten.
+    Returns (added, unchanged, removed) where removed is a list of (docstore_id, record_id).
+    """
+    remaining = {h: list(entries) for h, entries in stored.items()}
+    added, unchanged = [], []
+    for record in records:
+        entries = remaining.get(record.get("content_hash"))
+        if entries:
+            _, record_id = entries.pop()
+            record[id_field] = record_id
+            unchanged.append(record)
+        else:
+            added.append(record)
+    removed = [entry for entries in remaining.values() for entry in entries]
+    return added, unchanged, removed
+
+
+def known_dense_hits(docstore_ids, known_scores, k, score_threshold):
+    """
+    Dense ranking from relevances computed earlier: [(docstore_id, relevance)] best first, like a search.
+    `docstore_ids` maps the record ids of `known_scores` to their stored documents.
+    """
+    hits = [(doc_id, known_scores[record_id]) for record_id, doc_id in docstore_ids.items()
+            if known_scores[record_id] >= score_threshold]
+    return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked lists of ids into one: score(id) = sum(1 / (k + rank))."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def search_by_vector(vector_store, embedding, k, score_threshold=None, positions=None):
+    """
+    [(docstore_id, relevance)] for the k nearest documents to an embedding, best first.
+    `positions` restricts the search to those FAISS ids (applied inside the index via an ID selector).
+    """
+    return search_by_vectors(vector_store, [embedding], k, [score_threshold], positions)[0]
+
+
+def search_by_vectors(vector_store, embeddings, k, score_thresholds, positions=None):
+    """
+    search_by_vector() for several embeddings in one FAISS call (one result list per embedding, each with its
+    own score threshold). Stacked queries are scored with one matrix multiplication instead of one scan each.
+    """
+    if not vector_store.index.ntotal or (positions is not None and not len(positions)):
+        return [[] for _ in embeddings]
+    relevance_fn = vector_store._select_relevance_score_fn()
+    query = np.array(embeddings, dtype=np.float32)
+    if positions is None:
+        scores, indices = vector_store.index.search(query, min(k, vector_store.index.ntotal))
+    else:
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(positions))
+        scores, indices = vector_store.index.search(query, min(k, len(positions)), params=params)
+    all_results = []
+    for row_scores, row_indices, score_threshold in zip(scores, indices, score_thresholds):
+        results = []
+        for score, i in zip(row_scores, row_indices):
+            if i == -1:
+                continue
+            relevance = relevance_fn(float(score))
+            if score_threshold is None or relevance >= score_threshold:
+                results.append((vector_store.index_to_docstore_id[i], relevance))
+        all_results.append(results)
+    return all_results
+
 
 def law_to_document(jsonl_string):
     json_list = jsonl_string.strip().split("\n")
-    return [Document(j, metadata={"id": json.loads(j)["id"]}) for j in json_list]
+    docs = []
+    for j in json_list:
+        law = json.loads(j)
+        metadata = {
+            "id": law["id"],
+            "country": law.get("country"),
+            "region": law.get("region"),
+            "labels": law.get("relevant_labels"),
+            "law_code": law.get("law_code"),
+            "content_hash": law.get("content_hash") or content_hash(law, LAW_HASH_FIELDS),
+        }
+        docs.append(Document(j, metadata=metadata))
+    return docs
 
 def feature_to_document(features, compliances, data_dictionary):
     all_docs = []
     project_dictionary = []
     for line in data_dictionary.strip().split("\n"):
-        project_dictionary.append(json.loads(line))
+        if line.strip():
+            project_dictionary.append(json.loads(line))
 
     project_compliance = []
     for line in compliances.strip().split("\n"):
-        project_compliance.append(json.loads(line))
+        if line.strip():
+            project_compliance.append(json.loads(line))
     
     # Format the context once per project
     dict_context = "\n".join([f"- {item.get('variable_name', '')}: {item.get('variable_description', '')}" for item in project_dictionary])
@@ -21,6 +208,8 @@ def feature_to_document(features, compliances, data_dictionary):
 
     # Iterate through the features file for this project
     for line in features.strip().split("\n"):
+        if not line.strip():
+            continue
         feature = json.loads(line)
         
         content = (
@@ -40,7 +229,8 @@ def feature_to_document(features, compliances, data_dictionary):
             "project_id": feature.get('project_id'),
             "feature_id": feature.get('feature_id'),
             "feature_title": feature.get('feature_title'),
-            "source_file": feature.get('reference_file')
+            "source_file": feature.get('reference_file'),
+            "content_hash": feature.get('content_hash')
         }
         all_docs.append(Document(page_content=content, metadata=metadata))
     return all_docs
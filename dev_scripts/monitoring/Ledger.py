@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from monitoring.Metrics import REGISTRY, Counter
+
+LEDGER_PATH = os.getenv("TOKEN_LEDGER_PATH", "token_ledger.jsonl")
+RECENT_ENTRIES = 200
+USAGE_FIELDS = ("prompt_tokens", "output_tokens", "thinking_tokens", "embedding_tokens")
+
+TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Gemini tokens consumed per stage and kind (embedding tokens are estimated).", ["stage", "kind"]))
+
+_current: contextvars.ContextVar[Optional["Ledger"]] = contextvars.ContextVar("token_ledger", default=None)
+_recent = deque(maxlen=RECENT_ENTRIES)
+_file_lock = threading.Lock()
+
+
+class Ledger:
+    """
+    Token usage of one request (or batch unit), per stage, for one document.
+
+    Usage recorded after the request returned (e.g. by its background vector store sync) stays on the same
+    ledger; every flush() appends only what was added since the previous flush, tagged with a phase.
+    """
+
+    def __init__(self, document: str, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.document = document
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._flushed: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, estimated: bool = False, **usage):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"calls": 0, **{field: 0 for field in USAGE_FIELDS}})
+            entry["calls"] += 1
+            for field in USAGE_FIELDS:
+                entry[field] += usage.get(field) or 0
+            if estimated:
+                entry["estimated"] = True
+
+    def summary(self, stages: Optional[Dict[str, Dict[str, float]]] = None) -> dict:
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in (stages if stages is not None else self.stages).items()}
+        total = {field: sum(entry.get(field, 0) for entry in stages.values()) for field in USAGE_FIELDS}
+        total["total_tokens"] = sum(total.values())
+        return {"request_id": self.request_id, "document": self.document, "stages": stages, "total": total}
+
+    def flush(self, phase: str):
+        """Append the usage added since the last flush to the ledger file and the recent-entries buffer."""
+        with self._lock:
+            delta = {}
+            for name, entry in self.stages.items():
+                before = self._flushed.get(name, {})
+                change = {key: value - before.get(key, 0) for key, value in entry.items() if key != "estimated"}
+                if change.get("calls"):
+                    delta[name] = {**change, **({"estimated": True} if entry.get("estimated") else {})}
+            self._flushed = {name: dict(entry) for name, entry in self.stages.items()}
+        if not delta:
+            return
+        record = {**self.summary(delta), "phase": phase, "timestamp": time.time()}
+        _recent.append(record)
+        with _file_lock, open(LEDGER_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def current() -> Optional[Ledger]:
+    return _current.get()
+
+
+@contextmanager
+def ledger_scope(document: str, request_id: Optional[str] = None, phase: str = "request"):
+    """Make a new Ledger current for the block (and threads started from its copied context)."""
+    ledger = Ledger(document, request_id)
+    token = _current.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current.reset(token)
+        ledger.flush(phase)
+
+
+def record_usage(stage: str, estimated: bool = False, **usage):
+    """Add token usage to the metrics and, when there is one, to the current request's ledger."""
+    for field in USAGE_FIELDS:
+        if usage.get(field):
+            TOKENS.inc(usage[field], stage=stage, kind=field.replace("_tokens", ""))
+    ledger = current()
+    if ledger is not None:
+        ledger.add(stage, estimated, **usage)
+
+
+def recent_entries(document: Optional[str] = None, limit: int = 50):
+    entries = [entry for entry in list(_recent) if document is None or entry["document"] == document]
+    return entries[-limit:]
@@ -0,0 +1,196 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from monitoring.Tracing import span
+
+# Seconds; covers sub-millisecond FAISS searches up to multi-minute Gemini parses
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """In-flight style gauge: +1 while the block runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ------------------ Service metrics ------------------
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pipeline_stage_seconds", "Latency of one pipeline stage (file_receive, gemini_upload, parse_generation, "
+    "embedding, faiss_search, lexical_search, llm_analysis, backend_request, vector_store_save, ...).", ["stage"]))
+STAGE_ITEMS = REGISTRY.register(Counter(
+    "pipeline_stage_items_total", "Items processed by a stage (texts embedded, documents saved, ...).", ["stage"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_seconds", "HTTP request latency of the FastAPI app.", ["route", "method", "status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "background_queue_depth", "Work waiting or running in background queues.", ["queue"]))
+BACKEND_REQUESTS = REGISTRY.register(Counter(
+    "backend_requests_total", "Requests sent to the Go backend.", ["method", "route", "status"]))
+LLM_CALLS = REGISTRY.register(Counter(
+    "llm_calls_total", "LLM generation calls made or avoided.", ["outcome"]))
+PARSE_INPUTS = REGISTRY.register(Counter(
+    "parse_inputs_total", "Documents sent to the parse model as locally extracted text or as an uploaded PDF.", ["mode"]))
+STORE_RELOADS = REGISTRY.register(Counter(
+    "vector_store_reloads_total", "Vector store snapshots written by other processes and swapped in (or failed to load).",
+    ["store", "outcome"]))
+MICROBATCH_SIZE = REGISTRY.register(Histogram(
+    "microbatch_size", "Items served by one micro-batched call (query embeddings, FAISS searches).", ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64)))
+ADMISSIONS = REGISTRY.register(Counter(
+    "admissions_total", "Admission decisions per stage: admitted, queued (admitted after waiting), rejected (429, "
+    "queue full) or timed_out (503).", ["stage", "outcome"]))
+SCHEDULED = REGISTRY.register(Counter(
+    "provider_calls_scheduled_total", "Provider calls granted a slot per resource and priority class: immediate, "
+    "waited, or promoted past higher classes after waiting too long.", ["resource", "priority", "outcome"]))
+PAIRS = REGISTRY.register(Counter(
+    "analysis_pairs_total", "Retrieved (record, document) pairs by triage class and verdict cache outcome.", ["outcome"]))
+
+
+@contextmanager
+def stage(name: str, items: int = 0):
+    """Time a pipeline stage (and count the items it processed); inside a traced request it is also a span."""
+    with STAGE_SECONDS.time(stage=name), span(name, **({"items": items} if items else {})):
+        yield
+    if items:
+        STAGE_ITEMS.inc(items, stage=name)
@@ -0,0 +1,138 @@
+import io
+import os
+import re
+import time
+import pstats
+import random
+import cProfile
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Fraction of requests profiled without being asked to (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+# "X-Profile: 1" on a request profiles that request; set PROFILE_HEADER_ENABLED=0 to ignore the header
+PROFILE_HEADER = "X-Profile"
+PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "1") != "0"
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 200))
+SUMMARY_LINES = 40
+
+# Label of the profiled request, inherited by the background threads it starts
+_label: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("profile_label", default=None)
+
+
+class Profiler:
+    """
+    Opt-in cProfile capture of single requests, written to PROFILE_DIR as <time>-<label>.prof (pstats / snakeviz)
+    plus a .txt summary of the top functions by cumulative time.
+
+    cProfile follows one thread: the request profile covers the event loop while the request is served (other
+    requests interleaved on the loop show up in it too); background work the request starts gets its own file.
+    A thread only runs one profile at a time, requests arriving meanwhile are served unprofiled.
+    When nothing asks for a profile the cost per request is one header lookup (and one random() when sampling).
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 header_enabled: bool = PROFILE_HEADER_ENABLED, keep: int = PROFILE_KEEP):
+        self.logger = logging.getLogger("Profiler")
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header_enabled = header_enabled
+        self.keep = keep
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def requested(self, headers) -> Optional[str]:
+        """Why this request should be profiled ("header" / "sampled"), None when it should not."""
+        if self.header_enabled and headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @contextmanager
+    def profile(self, label: str, reason: str = "header"):
+        """Profile the block on this thread; yields the list the written file names are added to on exit."""
+        written: List[str] = []
+        thread_id = threading.get_ident()
+        with self._lock:
+            busy = thread_id in self._busy
+            self._busy.add(thread_id)
+        if busy:
+            self.logger.info(f"Profiler busy on this thread, {label} not profiled.")
+            yield written
+            return
+        token = _label.set(label)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield written
+        finally:
+            profiler.disable()
+            _label.reset(token)
+            with self._lock:
+                self._busy.discard(thread_id)
+            try:
+                written.append(self._write(profiler, label, reason, time.perf_counter() - started))
+            except OSError as e:
+                self.logger.warning(f"Failed to write profile of {label}: {e}")
+
+    @contextmanager
+    def follow(self, suffix: str):
+        """In a background thread: profile the block when the request that started it is being profiled."""
+        label = _label.get()
+        if label is None:
+            yield []
+            return
+        with self.profile(f"{label}-{suffix}", "background") as written:
+            yield written
+
+    def _write(self, profiler: cProfile.Profile, label: str, reason: str, elapsed: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]', '_', label)}"
+        path = os.path.join(self.directory, name)
+        profiler.dump_stats(path + ".prof")
+
+        summary = io.StringIO()
+        summary.write(f"{label} ({reason}), {elapsed:.3f}s wall\n\n")
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        with open(path + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        self.logger.info(f"Profile of {label} ({reason}, {elapsed:.3f}s) written to {path}.prof")
+        self._prune()
+        return name + ".prof"
+
+    def _prune(self):
+        profiles = sorted(self.list(), key=lambda p: p["modified"])
+        for entry in profiles[:max(0, len(profiles) - self.keep)]:
+            for ext in (".prof", ".txt"):
+                try:
+                    os.remove(os.path.join(self.directory, entry["name"][:-len(".prof")] + ext))
+                except OSError:
+                    pass
+
+    def list(self) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".prof"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append({"name": name, "size": stat.st_size, "modified": stat.st_mtime})
+        return sorted(entries, key=lambda e: e["modified"], reverse=True)
+
+    def path(self, name: str) -> Optional[str]:
+        """Absolute path of a written profile (.prof or .txt), None for names outside the profile directory."""
+        name = os.path.basename(name)
+        path = os.path.join(self.directory, name)
+        if not name.endswith((".prof", ".txt")) or not os.path.isfile(path):
+            return None
+        return path
+
+    def settings(self) -> dict:
+        return {"directory": self.directory, "sample_rate": self.sample_rate, "header": PROFILE_HEADER,
+                "header_enabled": self.header_enabled, "keep": self.keep}
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import hashlib
+import secrets
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+# Spans are kept in memory for GET /traces; set either variable to also export them in OTLP/JSON
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")  # one ExportTraceServiceRequest per line
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")  # e.g. http://localhost:4318 (OTLP/HTTP JSON)
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "compliance-rag")
+RECENT_TRACES = 100
+
+REQUEST_ID_HEADER = "X-Request-ID"
+TRACEPARENT_HEADER = "traceparent"
+
+_HEX32 = re.compile(r"[0-9a-f]{32}")
+_TRACEPARENT = re.compile(r"00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}")
+
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+_recent: "OrderedDict[str, List[dict]]" = OrderedDict()
+_recent_lock = threading.Lock()
+_file_lock = threading.Lock()
+logger = logging.getLogger("Tracing")
+
+
+def trace_id_for(request_id: str) -> str:
+    """OTel trace ids are 32 hex chars; correlation ids of another shape are hashed into one."""
+    request_id = request_id.lower().replace("-", "")
+    return request_id if _HEX32.fullmatch(request_id) else hashlib.sha256(request_id.encode()).hexdigest()[:32]
+
+
+class Span:
+    def __init__(self, trace_id: str, name: str, parent_id: Optional[str], attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            **({"error": self.error} if self.error else {}),
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": {"stringValue": str(value)}} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """
+    Spans of one correlation id inside this process.
+
+    Like the token ledger, spans finished after the request returned (its background vector store sync)
+    still belong to it; each flush() exports only the spans finished since the previous one.
+    """
+
+    def __init__(self, request_id: str, remote_parent: Optional[str] = None, trace_id: Optional[str] = None):
+        self.request_id = request_id
+        self.trace_id = trace_id or trace_id_for(request_id)
+        self.remote_parent = remote_parent
+        self._finished: List[Span] = []
+        self._lock = threading.Lock()
+
+    def finish(self, span: Span):
+        span.end_ns = time.time_ns()
+        with self._lock:
+            self._finished.append(span)
+
+    def flush(self):
+        with self._lock:
+            spans, self._finished = self._finished, []
+        if spans:
+            _export(self.request_id, spans)
+
+
+def current_span() -> Optional[Span]:
+    return _span.get()
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """Headers that carry the current correlation id (and parent span) to the next hop."""
+    trace, parent = _trace.get(), _span.get()
+    if trace is None:
+        return {}
+    headers = {REQUEST_ID_HEADER: trace.request_id}
+    if parent is not None:
+        headers[TRACEPARENT_HEADER] = f"00-{trace.trace_id}-{parent.span_id}-01"
+    return headers
+
+
+def parse_incoming(headers) -> Tuple[str, Optional[str], Optional[str]]:
+    """(correlation id, trace id, remote parent span id) from request headers; a fresh id when there is none."""
+    match = _TRACEPARENT.fullmatch((headers.get(TRACEPARENT_HEADER) or "").strip())
+    request_id = headers.get(REQUEST_ID_HEADER) or (match.group(1) if match else secrets.token_hex(16))
+    if match:
+        return request_id, match.group(1), match.group(2)
+    return request_id, None, None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a step as a child of the current span; a no-op outside a traced request or job."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    current = Span(trace.trace_id, name, parent.span_id if parent else trace.remote_parent, attributes)
+    token = _span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _span.reset(token)
+        trace.finish(current)
+
+
+@contextmanager
+def trace_scope(name: str, request_id: Optional[str] = None, trace_id: Optional[str] = None,
+                remote_parent: Optional[str] = None, **attributes):
+    """Root span of a request (or batch unit) in this process; its spans are exported when it ends."""
+    trace = Trace(request_id or secrets.token_hex(16), remote_parent, trace_id)
+    token = _trace.set(trace)
+    try:
+        with span(name, **{"request.id": trace.request_id, **attributes}) as root:
+            yield root
+    finally:
+        _trace.reset(token)
+        trace.flush()
+
+
+def flush_current():
+    """Export spans finished after the request returned, e.g. at the end of a background job."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.flush()
+
+
+def get_trace(request_id: str) -> List[dict]:
+    with _recent_lock:
+        spans = list(_recent.get(request_id, []))
+    return sorted(spans, key=lambda s: s["start"])
+
+
+def recent_traces(limit: int = 20) -> List[dict]:
+    """Most recent traces, one line each: root span name, duration and span count."""
+    with _recent_lock:
+        items = list(_recent.items())[-limit:]
+    summaries = []
+    for request_id, spans in reversed(items):
+        span_ids = {s["span_id"] for s in spans}
+        root = min((s for s in spans if s["parent_id"] not in span_ids), key=lambda s: s["start"])
+        summaries.append({"request_id": request_id, "root": root["name"], "duration_ms": root["duration_ms"],
+                          "spans": len(spans)})
+    return summaries
+
+
+def _export(request_id: str, spans: List[Span]):
+    with _recent_lock:
+        _recent.setdefault(request_id, []).extend(s.to_dict() for s in spans)
+        _recent.move_to_end(request_id)
+        while len(_recent) > RECENT_TRACES:
+            _recent.popitem(last=False)
+    if not (TRACE_EXPORT_PATH or OTLP_ENDPOINT):
+        return
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "monitoring.Tracing"}, "spans": [s.to_otlp() for s in spans]}],
+    }]}
+    if TRACE_EXPORT_PATH:
+        try:
+            with _file_lock, open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write {len(spans)} spans of {request_id}: {e}")
+    if OTLP_ENDPOINT:
+        # Off the request path: a slow or absent collector must not delay responses
+        threading.Thread(target=_post, args=(request_id, payload), daemon=True).start()
+
+
+def _post(request_id: str, payload: dict):
+    try:
+        requests.post(f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=payload, timeout=5)
+    except Exception as e:
+        logger.warning(f"Failed to send spans of {request_id} to {OTLP_ENDPOINT}: {e}")
@@ -7,6 +7,13 @@ from google import genai
 from google.genai import types
 from pydantic import BaseModel, Field
 
+from monitoring.Ledger import record_usage
+from monitoring.Metrics import stage
+from model.Scheduler import provider_scheduler
+from model.utils import content_hash, FEATURE_HASH_FIELDS
+from parser.LawParser import SOURCE_PDF, SOURCE_TEXT
+from parser.PdfText import document_text
+
 
 # ------------------ Data Models ------------------
 
@@ -40,13 +47,13 @@ class FeatureParser:
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
     @staticmethod
-    def _generate_prompt() -> str:
+    def _generate_prompt(source: str = SOURCE_PDF) -> str:
         """Generate system prompt with parsing rules."""
-        return """<role>
+        return f"""<role>
             parser
             </role>
             <rules>
-            1. Reference the document in PDF format. 
+            1. Reference the document {source}. 
             2. Input 'n/a' in any field that does not exist or does not have any data.
             3. DO NOT search the internet. 
             4. DO NOT generate new data or make up data.
@@ -59,30 +66,48 @@ class FeatureParser:
         """Send request to Google GenAI with error handling."""
         try:
             client = genai.Client()
-            
-            FeatureParser.logger.info(f"Uploading document: {doc_path}")
-
-            if doc_path.lower().endswith(".pdf"):
-                doc = client.files.upload(file=doc_path)
+            source = SOURCE_PDF
+            prepared = document_text(doc_path)
+
+            if prepared:
+                doc, source = prepared["text"], SOURCE_TEXT
+            elif doc_path.lower().endswith(".pdf"):
+                FeatureParser.logger.info(f"Uploading document: {doc_path}")
+                with stage("gemini_upload"):
+                    doc = client.files.upload(file=doc_path)
             else:
                 with open(doc_path, "r") as f:
                     doc = f.read()
 
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[doc, FeatureParser._generate_prompt()],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    response_schema=SpecificationDocument
+            with provider_scheduler("llm").slot(), stage("parse_generation"):
+                response = client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=[doc, FeatureParser._generate_prompt(source)],
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=SpecificationDocument
+                    )
                 )
-            )
 
+            FeatureParser._record_usage(response)
             return response.text if response else None
 
         except Exception as e:
             FeatureParser.logger.error(f"Error sending request: {e}", exc_info=True)
             return None
 
+    @staticmethod
+    def _record_usage(response):
+        """Token usage reported by Gemini for the parse call."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            record_usage(
+                "parse",
+                prompt_tokens=usage.prompt_token_count or 0,
+                output_tokens=usage.candidates_token_count or 0,
+                thinking_tokens=usage.thoughts_token_count or 0,
+            )
+
     @staticmethod
     def _extract_json(response: str) -> Optional[dict]:
         """Extract JSON object from model response text."""
@@ -98,7 +123,8 @@ class FeatureParser:
     @staticmethod
     def _jsonl_from_records(records: List[dict], record_type: str,
                             project_name: str, project_id: str, file_path: str,
-                            id_field: str) -> str:
+                            id_field: str, hash_fields: Optional[List[str]] = None,
+                            context_hash: str = "") -> str:
         """Convert list of records to JSONL format with generated metadata."""
         jsonl_output = ""
         for rec in records:
@@ -106,6 +132,8 @@ class FeatureParser:
             rec["project_name"] = project_name
             rec["reference_file"] = file_path
             rec["project_id"] = project_id
+            if hash_fields:
+                rec["content_hash"] = content_hash(rec, hash_fields, context_hash)
             jsonl_output += json.dumps(rec) + "\n"
         FeatureParser.logger.info(f"Generated JSONL for {record_type}: {len(records)} records")
         return jsonl_output
@@ -120,13 +148,19 @@ class FeatureParser:
         project_name = data.get("project_name", "n/a")
         project_id = str(uuid.uuid4())
 
+        # Feature documents embed the project dictionary and compliance terms,
+        # so a change there must also change every feature's hash.
+        context_hash = content_hash(data, ["data_dictionary", "compliance_terms"])
+
         feature_jsonl = FeatureParser._jsonl_from_records(
             data.get("features", []),
             "features",
             project_name,
             project_id,
             file_path,
-            "feature_id"
+            "feature_id",
+            FEATURE_HASH_FIELDS,
+            context_hash
         )
 
         compliance_jsonl = FeatureParser._jsonl_from_records(
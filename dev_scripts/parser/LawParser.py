@@ -7,6 +7,12 @@ from google import genai
 from google.genai import types
 from pydantic import BaseModel, Field
 
+from monitoring.Ledger import record_usage
+from monitoring.Metrics import stage
+from model.Scheduler import provider_scheduler
+from model.utils import content_hash, LAW_HASH_FIELDS
+from parser.PdfText import document_text
+
 
 # ------------------ Data Models ------------------
 
@@ -26,16 +32,20 @@ class LegalDocument(BaseModel):
 
 # ------------------ Parser ------------------
 
+SOURCE_PDF = "in PDF format"
+SOURCE_TEXT = ("text extracted from the PDF. Lines in [brackets] are section headings detected automatically; "
+               "they may be incomplete or split a provision, so rely on the text itself")
+
 class LawParser:
     logger = logging.getLogger("LawParser")
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
     @staticmethod
-    def _generate_prompt() -> str:
+    def _generate_prompt(source: str = SOURCE_PDF) -> str:
         """Generate parsing rules prompt."""
-        return """<role>parser</role>
+        return f"""<role>parser</role>
         <rules>
-        1. Reference the document in PDF format.
+        1. Reference the document {source}.
         2. Input 'n/a' in any field that does not exist or does not have any data.
         3. DO NOT search the internet. 
         4. DO NOT generate new data or make up data.
@@ -48,23 +58,30 @@ class LawParser:
         """Send request to GenAI API with error handling."""
         try:
             client = genai.Client()
-            LawParser.logger.info(f"Uploading document: {doc_path}")
-            
-            doc = client.files.upload(file=doc_path)
-
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[doc, LawParser._generate_prompt()],
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=1024),
-                    temperature=0.2,
-                    top_k=80,
-                    top_p=0.2,
-                    response_mime_type="application/json",
-                    response_schema=LegalDocument,
-                ),
-            )
-
+            prepared = document_text(doc_path)
+            if prepared:
+                doc, source = prepared["text"], SOURCE_TEXT
+            else:
+                LawParser.logger.info(f"Uploading document: {doc_path}")
+                with stage("gemini_upload"):
+                    doc = client.files.upload(file=doc_path)
+                source = SOURCE_PDF
+
+            with provider_scheduler("llm").slot(), stage("parse_generation"):
+                response = client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=[doc, LawParser._generate_prompt(source)],
+                    config=types.GenerateContentConfig(
+                        thinking_config=types.ThinkingConfig(thinking_budget=1024),
+                        temperature=0.2,
+                        top_k=80,
+                        top_p=0.2,
+                        response_mime_type="application/json",
+                        response_schema=LegalDocument,
+                    ),
+                )
+
+            LawParser._record_usage(response)
             if response and response.text:
                 return response.text
             else:
@@ -75,6 +92,18 @@ class LawParser:
             LawParser.logger.error(f"Error sending request: {e}", exc_info=True)
             return None
 
+    @staticmethod
+    def _record_usage(response):
+        """Token usage reported by Gemini for the parse call."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            record_usage(
+                "parse",
+                prompt_tokens=usage.prompt_token_count or 0,
+                output_tokens=usage.candidates_token_count or 0,
+                thinking_tokens=usage.thoughts_token_count or 0,
+            )
+
     @staticmethod
     def _extract_json(response: str) -> Optional[dict]:
         """Safely extract JSON object from response string."""
@@ -104,6 +133,7 @@ class LawParser:
                 provision = provision | data  # merge common fields
                 provision["id"] = str(uuid.uuid4())
                 provision["reference_file"] = file_path
+                provision["content_hash"] = content_hash(provision, LAW_HASH_FIELDS)
                 out += json.dumps(provision) + "\n"
             except Exception as e:
                 LawParser.logger.error(f"Error processing provision: {e}", exc_info=True)
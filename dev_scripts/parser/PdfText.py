@@ -0,0 +1,153 @@
+import os
+import re
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+from monitoring.Metrics import PARSE_INPUTS, stage
+
+# Local text extraction and provision pre-segmentation, run before the parse call so that text PDFs are sent
+# to Gemini as plain text instead of an uploaded file (image/page tokens). Scanned PDFs (little or no text
+# layer) return None and the parsers fall back to uploading the PDF.
+
+PDF_LOCAL_TEXT = os.getenv("PDF_LOCAL_TEXT", "1") != "0"
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", 120))
+MIN_CHARS_PER_PAGE = 200  # below this the text layer is missing or OCR garbage
+PREAMBLE_CHARS = 2000  # text before the first heading kept for law code / country / title
+MIN_SEGMENTS = 2  # fewer detected headings -> send the cleaned text unsegmented
+
+HEADING_PATTERNS = [
+    r"(?:SECTION|Section|SEC\.|Sec\.)\s+\d+[A-Za-z0-9.\-]*\b",
+    r"§+\s*\d+[A-Za-z0-9.\-]*",
+    r"(?:ARTICLE|Article)\s+(?:\d+[a-z]?|[IVXLC]+)\b",
+    r"(?:CHAPTER|Chapter|PART|Part|TITLE|Title)\s+(?:\d+|[IVXLC]+)\b",
+    r"\d{1,2}(?:\.\d{1,2}){0,3}\.?\s+[A-Z][^.:;]{2,80}",  # numbered headings: "3.1 Customer Accounts"
+]
+HEADING = re.compile(r"^(?:" + "|".join(HEADING_PATTERNS) + r")")
+# Trailing editorial material of statute pages (e.g. LII): skipped up to the next heading
+NON_PROVISION = re.compile(
+    r"^(?:Editorial Notes|Statutory Notes.*|Footnotes|Notes|References in Text|Amendments|Prior Provisions)$", re.I
+)
+TOC_LINE = re.compile(r"(?:\.\s*){4,}\d+$")  # "Section 3 ........ 12"
+
+
+def extract_pages(path: str) -> Optional[List[str]]:
+    """Text of each page, None when the PDF has no usable text layer (or no PDF library is installed)."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return None
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    reader = PdfReader(path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    if not pages or sum(len(page.strip()) for page in pages) < MIN_CHARS_PER_PAGE * len(pages):
+        return None
+    return pages
+
+
+def _clean(pages: List[str]) -> List[str]:
+    """Lines of the document without running headers/footers (repeated on most pages) and TOC entries."""
+    page_lines = [[line.strip() for line in page.splitlines() if line.strip()] for page in pages]
+    repeated = set()
+    if len(pages) >= 3:
+        # Page numbers differ per page, so compare lines with digits masked
+        counts = Counter(key for lines in page_lines for key in {re.sub(r"\d+", "#", line) for line in lines})
+        repeated = {key for key, count in counts.items() if count >= len(pages) / 2}
+    return [
+        line for lines in page_lines for line in lines
+        if re.sub(r"\d+", "#", line) not in repeated and not TOC_LINE.search(line)
+    ]
+
+
+def segment(lines: List[str]) -> Tuple[str, List[Tuple[str, str]]]:
+    """(preamble, [(heading, body)]) of a cleaned document; container headings without a body are merged."""
+    preamble, segments = [], []
+    heading, body, skipping = None, [], False
+    for line in lines:
+        if HEADING.match(line):
+            if heading is not None and not body:
+                heading = f"{heading} / {line}"  # "Chapter II" followed directly by "Article 5"
+            else:
+                if heading is not None:
+                    segments.append((heading, "\n".join(body)))
+                heading, body = line, []
+            skipping = False
+        elif NON_PROVISION.match(line):
+            skipping = True
+        elif skipping:
+            continue
+        elif heading is None:
+            preamble.append(line)
+        else:
+            body.append(line)
+    if heading is not None and body:
+        segments.append((heading, "\n".join(body)))
+    return "\n".join(preamble)[:PREAMBLE_CHARS], segments
+
+
+def prepare(path: str) -> Optional[dict]:
+    """
+    Text to send to the parse model instead of the PDF: the document preamble plus one block per detected
+    section/provision, or the cleaned text when no structure is found. None for scanned PDFs.
+    """
+    pages = extract_pages(path)
+    if pages is None:
+        return None
+    lines = _clean(pages)
+    preamble, segments = segment(lines)
+    if len(segments) >= MIN_SEGMENTS:
+        blocks = [f"[Document header]\n{preamble}"] if preamble else []
+        blocks += [f"[{heading}]\n{body}" for heading, body in segments]
+        text = "\n\n".join(blocks)
+    else:
+        text = "\n".join(lines)
+    return {
+        "text": text,
+        "pages": len(pages),
+        "segments": len(segments) if len(segments) >= MIN_SEGMENTS else 0,
+        "pdf_bytes": os.path.getsize(path),
+        "text_bytes": len(text.encode("utf-8")),
+    }
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def prepare_in_pool(path: str) -> Optional[dict]:
+    """prepare() on the shared process pool (PDF parsing is CPU-bound and holds the GIL); None on any failure."""
+    global _pool
+    try:
+        with _pool_lock:
+            if _pool is None:
+                # Default start method (fork on Linux): spawn would re-run main.py, models and all, in every worker
+                _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+            pool = _pool
+        return pool.submit(prepare, path).result(timeout=PDF_TIMEOUT)
+    except BrokenProcessPool as e:
+        with _pool_lock:
+            _pool = None  # a crashed worker (e.g. a malformed PDF) breaks the pool; start a fresh one next time
+        logging.getLogger("PdfText").warning(f"Local text extraction crashed for {path}, uploading the PDF: {e}")
+        return None
+    except Exception as e:
+        logging.getLogger("PdfText").warning(f"Local text extraction failed for {path}, uploading the PDF: {e}")
+        return None
+
+
+def document_text(path: str) -> Optional[dict]:
+    """Locally extracted text of a PDF for the parse prompt (see prepare()); None means "upload the PDF"."""
+    if not PDF_LOCAL_TEXT or not path.lower().endswith(".pdf"):
+        return None
+    with stage("pdf_extract"):
+        prepared = prepare_in_pool(path)
+    PARSE_INPUTS.inc(mode="text" if prepared else "pdf")
+    if prepared:
+        logging.getLogger("PdfText").info(
+            f"Extracted {prepared['pages']} pages of {path} locally: {prepared['segments']} segments, "
+            f"{prepared['text_bytes']} text bytes instead of a {prepared['pdf_bytes']} byte upload."
+        )
+    return prepared
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import logging
+import zipfile
+import tempfile
+from typing import List, Optional
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_ARCHIVE_MAX_FILES = int(os.getenv("UPLOAD_ARCHIVE_MAX_FILES", 200))
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+class ByteBudget:
+    """A byte limit shared by several stored files, e.g. every document of a batch upload."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def spend(self, size: int):
+        self.used += size
+        if self.used > self.limit:
+            raise UploadTooLarge(self.limit)
+
+
+class UploadStore:
+    """
+    Content-addressed storage for uploaded documents: <root>/sha256/<first 2 hex>/<sha256><ext>.
+
+    Uploads are streamed in chunks to a temporary file while the SHA-256 is computed, so memory per upload
+    is one chunk whatever the file size; the size limit is enforced while streaming. The finished file is
+    renamed to its hash, so concurrent uploads with the same filename cannot overwrite each other and
+    identical files are stored once.
+    """
+
+    def __init__(self, root: str, max_bytes: int = UPLOAD_MAX_BYTES, chunk_bytes: int = UPLOAD_CHUNK_BYTES):
+        self.logger = logging.getLogger("UploadStore")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+
+    def path_for(self, sha256: str, ext: str = "") -> str:
+        return os.path.join(self.root, "sha256", sha256[:2], sha256 + ext)
+
+    def _begin(self, filename: str, budget: Optional[ByteBudget] = None) -> "_IncomingFile":
+        os.makedirs(os.path.join(self.root, "incoming"), exist_ok=True)
+        return _IncomingFile(self, os.path.basename(filename or "upload"), budget)
+
+    async def save(self, upload, filename: Optional[str] = None, budget: Optional[ByteBudget] = None) -> dict:
+        """
+        Stream a FastAPI UploadFile to the store; returns {sha256, size, path, filename, deduplicated}.
+        The bytes are also charged to `budget` when given.
+        """
+        incoming = self._begin(filename or upload.filename, budget)
+        try:
+            while chunk := await upload.read(self.chunk_bytes):
+                incoming.write(chunk)
+            return incoming.commit()
+        except BaseException:
+            incoming.discard()
+            raise
+
+    def save_file(self, fileobj, filename: str, budget: Optional[ByteBudget] = None) -> dict:
+        """save() for a binary file object (e.g. a zip archive member)."""
+        incoming = self._begin(filename, budget)
+        try:
+            while chunk := fileobj.read(self.chunk_bytes):
+                incoming.write(chunk)
+            return incoming.commit()
+        except BaseException:
+            incoming.discard()
+            raise
+
+    def save_archive(self, path: str, extensions=(".pdf",), max_files: int = UPLOAD_ARCHIVE_MAX_FILES,
+                     budget: Optional[ByteBudget] = None) -> List[dict]:
+        """
+        Store every member of a zip archive with one of `extensions` (folders, hidden files and macOS
+        metadata are skipped). Members are streamed like uploads, so the per-file limit (and `budget`, which
+        the members share) holds for compressed members whatever their announced size.
+        """
+        try:
+            archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Not a valid zip archive: {e}")
+        with archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir()
+                and not any(part.startswith((".", "__MACOSX")) for part in member.filename.split("/"))
+                and os.path.splitext(member.filename)[1].lower() in extensions
+            ]
+            if len(members) > max_files:
+                raise ValueError(f"Archive holds {len(members)} documents, at most {max_files} are accepted")
+            stored = []
+            for member in members:
+                with archive.open(member) as fileobj:
+                    stored.append(self.save_file(fileobj, member.filename, budget))
+        return stored
+
+
+class _IncomingFile:
+    """A file being streamed into an UploadStore: hashed and size-checked chunk by chunk."""
+
+    def __init__(self, store: UploadStore, filename: str, budget: Optional[ByteBudget] = None):
+        self.store = store
+        self.filename = filename
+        self.budget = budget
+        self.ext = os.path.splitext(filename)[1].lower()
+        self.digest, self.size = hashlib.sha256(), 0
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.join(store.root, "incoming"), suffix=self.ext)
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.store.max_bytes:
+            raise UploadTooLarge(self.store.max_bytes)
+        if self.budget is not None:
+            self.budget.spend(len(chunk))
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self) -> dict:
+        """Move the finished file to its content address (or drop it when that content is already stored)."""
+        self.file.close()
+        sha256 = self.digest.hexdigest()
+        path = self.store.path_for(sha256, self.ext)
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            os.remove(self.temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.temp_path, path)
+        self.store.logger.info(
+            f"Stored {self.filename} ({self.size} bytes) as {path}{' (already stored)' if deduplicated else ''}"
+        )
+        return {"sha256": sha256, "size": self.size, "path": path, "filename": self.filename,
+                "deduplicated": deduplicated}
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
@@ -0,0 +1,181 @@
+"""
+Full-corpus compliance sweep: every feature of every project against the whole law corpus.
+
+    python sweep.py [--workers 4] [--rpm 30] [--chunk 5] [--restart]
+
+Candidate (feature, provision) pairs come from the precomputed candidate table, so no embedding calls
+are made. Pairs go through triage and the verdict cache; the rest are analysed in chunks of features on
+a bounded worker pool, with every LLM call going through the shared rate limiter at background priority. Violations are written
+to the backend in bulk and finished chunks are checkpointed, so an interrupted sweep resumes where it stopped.
+Unit ids include the law store snapshot version: once laws are added or changed, every unit is due again.
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from dotenv import load_dotenv
+
+from model.RAGLawModel import RAGLawModel
+from model.FeatureRagModel import FeatureRagModel
+from model.CandidateLinks import CandidateLinks
+from model.RateLimiter import llm_rate_limiter
+from model.Scheduler import priority
+from model.Triage import Triage
+from monitoring.Ledger import ledger_scope
+from monitoring.Tracing import trace_scope
+
+load_dotenv(dotenv_path=".ENV")
+
+GO_BACKEND_URL = os.getenv("GO_BACKEND_URL")
+CHECKPOINT_PATH = "sweep_checkpoint.json"
+LINK_BATCH_SIZE = 500
+
+
+def post_links(links):
+    """Bulk-write (feature_id, provision_id) pairs to the backend; returns the number of new links."""
+    inserted = 0
+    for i in range(0, len(links), LINK_BATCH_SIZE):
+        batch = [{"feature_id": f, "provision_id": p} for f, p in links[i:i + LINK_BATCH_SIZE]]
+        resp = requests.post(f"{GO_BACKEND_URL}/links", json=batch)
+        resp.raise_for_status()
+        inserted += resp.json().get("inserted_count", 0)
+    return inserted
+
+
+class Checkpoint:
+    """Ids of finished work units, rewritten atomically after each flush."""
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.done = set()
+        self.started_at = time.time()
+        if not restart and os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.done = set(data["done"])
+            self.started_at = data["started_at"]
+
+    def save(self, units):
+        self.done.update(units)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"started_at": self.started_at, "done": sorted(self.done)}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def build_units(feature_model: FeatureRagModel, chunk: int, law_version: str):
+    """
+    Features grouped per project and chunked. A unit id changes whenever one of its features or the law
+    store (`law_version`, its snapshot version) does, so a sweep after new laws re-checks every unit.
+    """
+    projects = {}
+    for _, doc in feature_model.store.documents():
+        metadata = doc.metadata
+        if not metadata.get("feature_id"):
+            continue
+        projects.setdefault(metadata.get("project_name"), []).append({
+            "feature_id": metadata["feature_id"],
+            "content_hash": metadata.get("content_hash"),
+            "text": doc.page_content,
+        })
+    units = []
+    for project, features in sorted(projects.items(), key=lambda item: str(item[0])):
+        features.sort(key=lambda record: record["feature_id"])
+        for i in range(0, len(features), chunk):
+            records = features[i:i + chunk]
+            digest = hashlib.sha256(
+                "|".join([str(law_version)] + [f'{r["feature_id"]}:{r["content_hash"]}' for r in records]).encode("utf-8")
+            ).hexdigest()
+            units.append((digest, project, records))
+    return units
+
+
+def build_prompt(records):
+    features_prompt = "\n".join(f'{i}. [{r["feature_id"]}] {r["text"]}' for i, r in enumerate(records))
+    return f"<features>\n{features_prompt}\n</features>"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-evaluate every feature against the whole law corpus.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent analysis calls.")
+    parser.add_argument("--rpm", type=float, default=None, help="LLM requests per minute (default: LLM_REQUESTS_PER_MINUTE).")
+    parser.add_argument("--chunk", type=int, default=5, help="Features analysed per LLM call.")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and sweep everything.")
+    args = parser.parse_args()
+
+    if args.rpm is not None:
+        llm_rate_limiter.set_rate(args.rpm)
+
+    law_model, feature_model = RAGLawModel(), FeatureRagModel()
+    candidate_links = CandidateLinks()
+    candidate_links.update(feature_model.store, law_model.store)
+    candidate_links.save()
+    provisions = {doc.metadata.get("id"): doc for _, doc in law_model.store.documents()}
+    triage = Triage()
+    checkpoint = Checkpoint(args.checkpoint, args.restart)
+
+    units = build_units(feature_model, args.chunk, law_model.store.snapshot_version)
+    # Units of earlier feature or law versions will never come up again
+    checkpoint.done &= {unit_id for unit_id, _, _ in units}
+    units = [unit for unit in units if unit[0] not in checkpoint.done]
+    print(f"Sweeping {len(units)} units ({len(checkpoint.done)} already done) with {args.workers} workers.")
+
+    def run_unit(unit):
+        _, project, records = unit
+        with ledger_scope(f"sweep:{project}", phase="sweep") as ledger, priority("background"), \
+                trace_scope("sweep_unit", ledger.request_id, project=project, records=len(records)):
+            return analyze_unit(records)
+
+    def analyze_unit(records):
+        retrieved = {}
+        for record in records:
+            scores = candidate_links.provisions_for_feature(record["feature_id"])
+            retrieved[record["feature_id"]] = [
+                (provisions[p], score, None) for p, score in scores.items() if p in provisions
+            ]
+        candidates, _ = triage.filter(retrieved)
+        result, stats = law_model.analyze(records, candidates, build_prompt)
+        if stats["unanswered"]:
+            # Checkpointing the unit would mark pairs as judged that the LLM never answered
+            raise RuntimeError(f"LLM analysis failed, {stats['unanswered']} pairs unanswered")
+        links = [(f, item["provision_id"]) for item in result["provisions"] for f in item.get("feature_ids", [])]
+        return links, stats
+
+    totals = {"pairs": 0, "cached": 0, "asked": 0, "links": 0}
+    pending_links, pending_units = [], []
+
+    def flush():
+        totals["links"] += post_links(pending_links)
+        checkpoint.save(pending_units)
+        pending_links.clear()
+        pending_units.clear()
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(run_unit, unit): unit for unit in units}
+        for done, future in enumerate(as_completed(futures), start=1):
+            unit_id, project, _ = futures[future]
+            try:
+                links, stats = future.result()
+            except Exception as e:
+                print(f"Unit {unit_id[:12]} of project {project} failed, it will be retried next run:", e)
+                continue
+            for key in ("pairs", "cached", "asked"):
+                totals[key] += stats[key]
+            pending_links.extend(links)
+            pending_units.append(unit_id)
+            if len(pending_links) >= LINK_BATCH_SIZE:
+                flush()
+            if done % 10 == 0:
+                print(f"{done}/{len(units)} units, {time.time() - started:.0f}s, {totals}")
+    flush()
+
+    print(f"Sweep finished in {time.time() - started:.0f}s: {totals}, triage: {triage.stats()}")
+
+
+if __name__ == "__main__":
+    main()
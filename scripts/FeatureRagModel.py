@@ -1,7 +1,7 @@
 import os
+import sys
 from dotenv import load_dotenv
 from langchain_community.vectorstores import FAISS
-from langchain_google_genai  import GoogleGenerativeAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.runnables import RunnablePassthrough
@@ -9,6 +9,10 @@ from langchain.chat_models import init_chat_model
 
 load_dotenv()
 
+# Share the embedding provider selection (EMBEDDING_PROVIDER) with the service in dev_scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dev_scripts"))
+from model.Embeddings import create_embeddings
+
 FEATURE_VECTOR_STORE_PATH = "feature_vector_store"
 FEATURE_SCHEMA = {
   "title": "Answer",
@@ -57,7 +61,7 @@ class FeatureRagModel:
         self.args = args
         self.vector_store_path = None
         self.prompt_template = None
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
+        self.embeddings = create_embeddings()
         self.llm = init_chat_model("gemini-2.5-flash", model_provider="google_genai", response_mime_type="application/json")
 
         self.vector_store_path = FEATURE_VECTOR_STORE_PATH
@@ -0,0 +1,153 @@
+import re
+import json
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Outcomes of NearDuplicateDetector.resolve
+MATCH = "match"          # the new law revises exactly one stored law
+NEW = "new"              # nothing in the store resembles the new law
+AMBIGUOUS = "ambiguous"  # a few candidates are close but not conclusive -> ask the LLM
+
+# Hash modulus: with coefficients and shingle hashes below 2**31, a * x + b stays below 2**63, so the
+# uint64 arithmetic of the universal hash never wraps around
+_MERSENNE_PRIME = (1 << 31) - 1
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _text_of(record: dict) -> str:
+    """Provision text used for shingling (falls back to the whole record)."""
+    text = " ".join(str(record.get(field, "")) for field in ("provision_title", "provision_body"))
+    if not text.strip():
+        text = " ".join(str(record.get(field, "")) for field in ("law", "law_desc", "page_content"))
+    return text.lower()
+
+
+def _codes_of(record: dict) -> Tuple[Optional[str], Optional[str]]:
+    """Normalised (law_code, provision_code); 'n/a' and blanks are treated as missing."""
+    def norm(value):
+        value = str(value).strip().lower() if value is not None else ""
+        return value if value and value != "n/a" else None
+    return norm(record.get("law_code") or record.get("law_id")), norm(record.get("provision_code"))
+
+
+def record_from_document(doc) -> dict:
+    """Flatten a stored Document into a record: JSON page content merged with its metadata."""
+    try:
+        record = json.loads(doc.page_content)
+        if not isinstance(record, dict):
+            record = {"page_content": doc.page_content}
+    except (json.JSONDecodeError, TypeError):
+        record = {"page_content": doc.page_content}
+    return {**doc.metadata, **record}
+
+
+class NearDuplicateDetector:
+    """
+    MinHash/LSH index over provision text plus an exact (law_code, provision_code) lookup.
+
+    Decides locally whether a new law revises a stored one. Only when the evidence is
+    inconclusive are the few candidate laws handed back to be checked by the LLM.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle_size: int = 5,
+                 match_threshold: float = 0.8, candidate_threshold: float = 0.3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.match_threshold = match_threshold
+        self.candidate_threshold = candidate_threshold
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._by_code: Dict[Tuple[str, str], List[str]] = {}
+        self._by_law: Dict[str, List[str]] = {}
+        self.records: Dict[str, dict] = {}
+
+    @classmethod
+    def from_docstore(cls, docstore: Dict, **kwargs) -> "NearDuplicateDetector":
+        """Build a detector from a vector store's docstore ({docstore_id: Document})."""
+        detector = cls(**kwargs)
+        for docstore_id, doc in docstore.items():
+            detector.add(docstore_id, record_from_document(doc))
+        return detector
+
+    def _shingles(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_RE.findall(text)
+        if len(tokens) < self.shingle_size:
+            grams = {" ".join(tokens)}
+        else:
+            grams = {" ".join(tokens[i:i + self.shingle_size]) for i in range(len(tokens) - self.shingle_size + 1)}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) % _MERSENNE_PRIME for g in grams), dtype=np.uint64,
+                           count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a text: one universal hash per permutation, minimum over shingles."""
+        shingles = self._shingles(text)
+        hashed = (np.outer(shingles, self._a) + self._b) % _MERSENNE_PRIME
+        return hashed.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key: str, record: dict):
+        signature = self.signature(_text_of(record))
+        self._signatures[key] = signature
+        self.records[key] = record
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(band_key, []).append(key)
+        law_code, provision_code = _codes_of(record)
+        if law_code:
+            self._by_law.setdefault(law_code, []).append(key)
+            if provision_code:
+                self._by_code.setdefault((law_code, provision_code), []).append(key)
+
+    def similarity(self, signature: np.ndarray, key: str) -> float:
+        """Estimated Jaccard similarity between a signature and a stored record."""
+        return float(np.mean(self._signatures[key] == signature))
+
+    def candidates(self, record: dict) -> List[Tuple[str, float]]:
+        """Stored records sharing an LSH bucket or a law_code with the record, best first."""
+        signature = self.signature(_text_of(record))
+        keys = set()
+        for band, band_key in zip(self._buckets, self._band_keys(signature)):
+            keys.update(band.get(band_key, ()))
+        law_code, _ = _codes_of(record)
+        if law_code:
+            keys.update(self._by_law.get(law_code, ()))
+        scored = [(key, self.similarity(signature, key)) for key in keys]
+        return sorted(scored, key=lambda item: item[1], reverse=True)
+
+    def resolve(self, record: dict) -> Tuple[str, List[Tuple[str, float]]]:
+        """
+        Classify a new law against the store.
+        Returns (MATCH, [best]), (NEW, []) or (AMBIGUOUS, candidates-for-the-LLM).
+        """
+        law_code, provision_code = _codes_of(record)
+        scored = self.candidates(record)
+
+        # Same law and provision code: a revision of that provision, whatever the wording change
+        if law_code and provision_code:
+            exact = [(key, score) for key, score in scored if key in self._by_code.get((law_code, provision_code), ())]
+            if len(exact) == 1 or (exact and exact[0][1] > exact[1][1]):
+                return MATCH, exact[:1]
+
+        close = [(key, score) for key, score in scored if score >= self.candidate_threshold]
+        if not close:
+            return NEW, []
+
+        best_key, best_score = close[0]
+        unique_best = len(close) == 1 or close[1][1] < self.match_threshold
+        same_law = law_code is not None and _codes_of(self.records[best_key])[0] == law_code
+        if best_score >= self.match_threshold and unique_best and (same_law or law_code is None):
+            return MATCH, close[:1]
+        return AMBIGUOUS, close
@@ -7,10 +7,11 @@ from langchain_community.vectorstores import FAISS
 from langchain_google_genai  import GoogleGenerativeAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chat_models import init_chat_model
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 
+from near_duplicate import NearDuplicateDetector, MATCH, AMBIGUOUS
+
 
 
 
@@ -19,6 +20,7 @@ VECTOR_FEATURE_STORE_PATH = "feature_vector_store"
 LAW_DATABASE_FILE = "law_data/laws.jsonl" # main law database
 FEATURE_DATABASE_FILE = "feature_data/" # main feature database
 NEW_LAW_FILE = "new_law.json" # new law file
+MAX_LLM_CANDIDATES = 5 # ambiguous near-duplicates sent to the LLM
 
 LAW_SCHEMA = {
   "title": "Answer",
@@ -115,7 +117,38 @@ class update_store:
             print("Invalid argument. Please use 'update_law' or 'update_feature'.")
 
     def update_law(self):
+        if not os.path.exists(VECTOR_LAW_STORE_PATH):
+            print(f"Error: Vector store not found at '{VECTOR_LAW_STORE_PATH}'.")
+            self.rag_chain = None # Ensure chain is None if setup fails
+            return
+
         self.vector_store = FAISS.load_local(VECTOR_LAW_STORE_PATH, self.embeddings, allow_dangerous_deserialization=True)
+
+        with open(NEW_LAW_FILE, 'r', encoding='utf-8') as jsonfile:
+            self.new_law = json.load(jsonfile)
+        self.query = json.dumps(self.new_law)
+
+        # Resolve the common cases locally: exact law/provision code match or MinHash near-duplicate
+        detector = NearDuplicateDetector.from_docstore(self.vector_store.docstore._dict)
+        decision, matches = detector.resolve(self.new_law)
+        print(f"Near-duplicate check: {decision} {matches[:3]}")
+
+        self.match_id = None
+        if decision == MATCH:
+            self.match_id = matches[0][0]
+        elif decision == AMBIGUOUS:
+            # Only inconclusive matches go to the model, with just the candidate laws as context
+            candidate_docs = [self.vector_store.docstore.search(key) for key, _ in matches[:MAX_LLM_CANDIDATES]]
+            self.analysis_result = self.ask_llm(candidate_docs)
+            print(json.dumps(self.analysis_result, indent=2))
+            self.match_id = self.llm_match_id(self.analysis_result, detector, [key for key, _ in matches])
+
+        self.replace_law() # replace law
+
+        # check if law already exists
+        # existing_law_index = next((i for i, law in enumerate(all_laws) if json.loads(law).get('law_code') == new_law.get('law_code')), -1)
+
+    def ask_llm(self, candidate_docs):
         self.llm = init_chat_model("gemini-2.5-flash", model_provider="google_genai", response_mime_type="application/json")
         
         self.llm.response_schema = LAW_SCHEMA
@@ -133,54 +166,36 @@ class update_store:
 
         Input: {query}
         """
-
-        with open(NEW_LAW_FILE, 'r', encoding='utf-8') as jsonfile:
-            self.new_law = json.load(jsonfile)
-        
-        if not os.path.exists(VECTOR_LAW_STORE_PATH):
-            print(f"Error: Vector store not found at '{VECTOR_LAW_STORE_PATH}'.")
-            self.rag_chain = None # Ensure chain is None if setup fails
-            return
-
-        vector_store = FAISS.load_local(
-            VECTOR_LAW_STORE_PATH,
-            self.embeddings, 
-            allow_dangerous_deserialization=True
-        )
-        retriever = vector_store.as_retriever(search_kwargs={"score_threshold": 0.9})
-
         prompt = ChatPromptTemplate.from_template(self.prompt_template)
 
-        self.rag_chain = (
-            {"context": retriever | self.format_docs, "query": RunnablePassthrough()}
-            | prompt
-            | self.llm
-            | JsonOutputParser()
-        )
+        self.rag_chain = prompt | self.llm | JsonOutputParser()
         print("RagModel initialized successfully.")
-        self.query = json.dumps(self.new_law)
-        self.analysis_result = self.rag_chain.invoke(self.query) # invoke query text
-        print(json.dumps(self.analysis_result, indent=2))
-        self.replace_law() # replace law
-
-        # check if law already exists
-        # existing_law_index = next((i for i, law in enumerate(all_laws) if json.loads(law).get('law_code') == new_law.get('law_code')), -1)
-        
+        try:
+            return self.rag_chain.invoke({"context": self.format_docs(candidate_docs), "query": self.query}) # invoke query text
+        except Exception as e:
+            print(f"LLM duplicate check failed, treating law as new: {e}")
+            return {}
+
+    def llm_match_id(self, analysis_result, detector, candidate_keys):
+        """Map the law flagged by the LLM back to the docstore id of one of the candidates."""
+        flagged = (analysis_result or {}).get('violated_old_law_provisions') or []
+        if not flagged:
+            return None
+        flagged_id = flagged[0].get('id')
+        for key in candidate_keys:
+            record = detector.records[key]
+            if flagged_id in (key, record.get('id'), record.get('law_id')):
+                return key
+        return None
 
     def replace_law(self):
-        id = self.analysis_result.get('id')
-        if id:
-            # Find the existing law in the vector store
-            existing_doc = self.vector_store.docstore.get(id)
-            if existing_doc:
-                for doc_id, doc in self.vector_store.docstore.items():
-                    if doc.metadata.get('id') == id:
-                        self.vector_store.docstore[doc_id] = Document(self.query)
-                        print(f"Law with id {id} has been updated to law with id {self.new_law.get('id')} in the vector store.")
-
+        if self.match_id:
+            # Remove the old version (vector and docstore entry) before adding the revision
+            self.vector_store.delete([self.match_id])
+            print(f"Law {self.match_id} has been replaced by law with id {self.new_law.get('id')}.")
         else:
-            self.vector_store.add_documents([Document(self.query)])
-            print(f"New law with id {self.new_law.get('id')} has been added to the vector store.")
+            print(f"New law with id {self.new_law.get('id')} will be added to the vector store.")
+        self.vector_store.add_documents([Document(self.query, metadata={"id": self.new_law.get('id'), "law_code": self.new_law.get('law_code')})])
 
         self.vector_store.save_local(VECTOR_LAW_STORE_PATH)
         print("Vector store updated successfully.")